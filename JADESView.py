@@ -5,14 +5,14 @@ import ast
 import sys
 import math
 import time 
+import threading
 import argparse
+import multiprocessing
 import requests
+from functools import partial
 from requests.auth import HTTPBasicAuth
 from io import BytesIO
 import numpy as np
-import matplotlib
-matplotlib.use("TkAgg")
-import matplotlib.pyplot as plt
 from astropy.io import fits
 from astropy.io import ascii
 from astropy.table import Table
@@ -22,10 +22,7 @@ from astropy import units as u
 from astropy.coordinates import SkyCoord
 from astropy.wcs import WCS
 
-from astropy.visualization import (MinMaxInterval, ZScaleInterval, LogStretch, ImageNormalize, AsinhStretch, SinhStretch, LinearStretch)
-
-import matplotlib.backends.tkagg as tkagg
-from matplotlib.backends.backend_agg import FigureCanvasAgg
+from astropy.visualization import (MinMaxInterval, LogStretch, ImageNormalize, AsinhStretch, SinhStretch, LinearStretch)
 
 #from Tkinter import *
 try:
@@ -33,7 +30,15 @@ try:
 except ImportError:
     from tkinter import *
 import PIL
-from PIL import ImageTk, Image, ImageGrab
+from PIL import ImageTk, Image, ImageGrab, ImageDraw
+
+from JADESView_prefetch import Prefetcher, prefetch_window
+from JADESView_fetch import SEDFetcher
+from JADESView_catalogs import ResultsCatalogs, resolve_IDs
+from JADESView_journal import ReviewJournal, ReviewState, write_session, read_session, write_session_list, read_session_list
+from JADESView_cache import ThumbnailCache, CutoutMemoryCache, IntervalCache, CutoutDiskCache, CutoutCacheFiller, HTTPDiskCache, make_cutout
+from JADESView_mosaics import MosaicRegistry, MosaicHeaderCache, PixelPositionTable, read_image_list
+from JADESView_render import render_thumbnail, crosshair_lines, crosshair_line_width, load_font
 
 JADESView_input_file = 'JADESView_input_file.dat'
 
@@ -49,15 +54,63 @@ make_crosshair = False
 # Currently, for testing JADESView, we have z_spec
 use_zspec = True
 
+# The number of objects ahead in the list that are prepared in the background
+# while looking at the current one (0 turns the prefetching off)
+prefetch_depth = 3
+
+# The memory (in MB) for keeping rendered thumbnails around, so that revisiting
+# an object or going back to a previous stretch doesn't render them again (0 
+# turns the cache off)
+thumbnail_cache_size = 256
+
+# The folder for keeping the raw cutouts between sessions (None turns this off),
+# and how big (in MB) it's allowed to get
+cutout_cache_directory = None
+cutout_cache_size = 2048
+
+# The username and password for the server with the SED plots and results
+fenrir_username = None
+fenrir_password = None
+
+# The number of SED plots that are downloaded at the same time, and the 
+# connect and read timeouts (in seconds) for downloading them
+fetch_workers = 4
+fetch_connect_timeout = 5.0
+fetch_read_timeout = 30.0
+
+# The folder for keeping downloaded SED plots and catalogs between sessions 
+# (None turns this off), and how big (in MB) it's allowed to get
+http_cache_directory = None
+http_cache_size = 2048
+
+# The number of mosaics that are opened (and have their WCS made) at the same
+# time at startup
+mosaic_workers = 8
+
+# The folder for the sidecar files that keep the mosaic headers and WCS between
+# sessions (None turns this off)
+header_cache_directory = None
+
+# The journal that every flag and note is written to as it's made (None means
+# it goes next to the output_flags_file, see JADESView_journal.py)
+review_journal_file = None
+
+# The file that the position in the list and the thumbnail settings are saved
+# to, for -resume (None means it goes next to the output_flags_file), and how
+# many objects on either side of the resumed position are fetched and cut 
+# into the caches in the background
+session_file = None
+resume_warm_depth = 10
+
+# Only one object's thumbnails are rendered at a time (see render_thumbnails)
+thumbnail_render_lock = threading.Lock()
+
 def getEAZYimage(ID):
 	start_time = time.time()
 	EAZY_file_name = EAZY_files+str(ID)+'_EAZY_SED.png'
 
-	if (EAZY_file_name.startswith('http')):
-		response = requests.get(EAZY_file_name, auth=HTTPBasicAuth(fenrir_username, fenrir_password))
-		image = Image.open(BytesIO(response.content))
-	else:
-		image = Image.open(EAZY_file_name)
+	# From the server or from disk (see JADESView_fetch.py)
+	image = sed_fetcher.open_image(EAZY_file_name)
 		
 	end_time = time.time()
 	if (timer_verbose):
@@ -69,11 +122,8 @@ def getBEAGLEimage(ID):
 	start_time = time.time()
 	BEAGLE_file_name = BEAGLE_files+str(ID)+'_BEAGLE_SED.png'
 
-	if (BEAGLE_file_name.startswith('http')):
-		response = requests.get(BEAGLE_file_name, auth=HTTPBasicAuth(fenrir_username, fenrir_password))
-		image = Image.open(BytesIO(response.content))
-	else:
-		image = Image.open(BEAGLE_file_name)
+	# From the server or from disk (see JADESView_fetch.py)
+	image = sed_fetcher.open_image(BEAGLE_file_name)
 
 	end_time = time.time()
 	if (timer_verbose):
@@ -85,11 +135,8 @@ def getSEDzimage(ID):
 	start_time = time.time()
 	SEDz_file_name = SEDz_files+str(ID)+'_BEAGLE_SED.png'
 
-	if (SEDz_file_name.startswith('http')):
-		response = requests.get(SEDz_file_name, auth=HTTPBasicAuth(fenrir_username, fenrir_password))
-		image = Image.open(BytesIO(response.content))
-	else:
-		image = Image.open(SEDz_file_name)
+	# From the server or from disk (see JADESView_fetch.py)
+	image = sed_fetcher.open_image(SEDz_file_name)
 		
 	end_time = time.time()
 	if (timer_verbose):
@@ -102,11 +149,8 @@ def getBAGPIPESimage(ID):
 	bagpipes_file_name_individual = '{:05d}.png'.format(ID)
 	bagpipes_file_name = BAGPIPES_files+bagpipes_file_name_individual
 
-	if (bagpipes_file_name.startswith('http')):
-		response = requests.get(bagpipes_file_name, auth=HTTPBasicAuth(fenrir_username, fenrir_password))
-		image = Image.open(BytesIO(response.content))
-	else:
-		image = Image.open(bagpipes_file_name)
+	# From the server or from disk (see JADESView_fetch.py)
+	image = sed_fetcher.open_image(bagpipes_file_name)
 		
 	end_time = time.time()
 	if (timer_verbose):
@@ -114,29 +158,18 @@ def getBAGPIPESimage(ID):
 
 	return image
 
-def resizeimage(image):
-	global baseplotwidth
-	wpercent = (baseplotwidth / float(image.size[0]))
+def scaleimage(image, plotwidth):
+	wpercent = (plotwidth / float(image.size[0]))
 	hsize = int((float(image.size[1]) * float(wpercent)))
-	image = image.resize((baseplotwidth, hsize), PIL.Image.ANTIALIAS)
-	photo = ImageTk.PhotoImage(image)
-	return photo
-
-def resizeBAGPIPESimage(image):
-	global BAGPIPESbaseplotwidth
-	wpercent = (BAGPIPESbaseplotwidth / float(image.size[0]))
-	hsize = int((float(image.size[1]) * float(wpercent)))
-	image = image.resize((BAGPIPESbaseplotwidth, hsize), PIL.Image.ANTIALIAS)
-	photo = ImageTk.PhotoImage(image)
-	return photo
+	image = image.resize((plotwidth, hsize), PIL.Image.ANTIALIAS)
+	return image
 
 def highz():
 	global current_index
 	global ID_iterator
 	global ID_list
-	global highZflag_array
 	
-	highZflag_array[current_index] = 1
+	review_state.set_flag(current_index, 'HighZFlag')
 	current_id = ID_list[ID_iterator]
 	print("Object "+str(current_id)+" is a high-redshift candidate.")
 
@@ -144,9 +177,8 @@ def badfit():
 	global current_index
 	global ID_iterator
 	global ID_list
-	global badfitflag_array
 	
-	badfitflag_array[current_index] = 1
+	review_state.set_flag(current_index, 'BadFitFlag')
 	current_id = ID_list[ID_iterator]
 	print("Object "+str(current_id)+" has a bad fit.")
 
@@ -154,193 +186,342 @@ def baddata():
 	global current_index
 	global ID_iterator
 	global ID_list
-	global baddataflag_array
 	
-	baddataflag_array[current_index] = 1
+	review_state.set_flag(current_index, 'BadDataFlag')
 	current_id = ID_list[ID_iterator]
 	print("Object "+str(current_id)+" object has bad data.")
 
-def update_eazy_text(current_id, eazy_results_IDs, eazy_results_zpeak):
-	eazy_z_peak = getfile_value(current_id, eazy_results_IDs, eazy_results_zpeak, 4)
-	eazy_z_a = getfile_value(current_id, eazy_results_IDs, eazy_results_za, 4)
-	eazy_l68 = getfile_value(current_id, eazy_results_IDs, eazy_results_zl68, 4)
-	eazy_u68 = getfile_value(current_id, eazy_results_IDs, eazy_results_zu68, 4)
+# The text for the labels of each results catalog, as a list of (label name,
+# text, color), so that the same text goes on the Tk labels and on the panels
+# that are saved (see compose_panel)
+def eazy_text(eazy_record):
+	eazy_z_peak = getfile_value(eazy_record, 'zpeak', 4)
+	eazy_z_a = getfile_value(eazy_record, 'za', 4)
+	eazy_l68 = getfile_value(eazy_record, 'zl68', 4)
+	eazy_u68 = getfile_value(eazy_record, 'zu68', 4)
 
-	eazy_label_zpeak.configure(text="z_EAZY, peak = "+str(eazy_z_peak)+" ("+str(eazy_l68)+" - "+str(eazy_u68)+")")  
-	eazy_label_za.configure(text="z_EAZY, a = "+str(eazy_z_a))  
+	return [('eazy_label_zpeak', "z_EAZY, peak = "+str(eazy_z_peak)+" ("+str(eazy_l68)+" - "+str(eazy_u68)+")", '#133e7c'),
+		('eazy_label_za', "z_EAZY, a = "+str(eazy_z_a), '#133e7c')]
 
 
-def update_beagle_text(current_id, beagle_results_IDs, beagle_results_zavg):
-	beagle_z_avg = getfile_value(current_id, beagle_results_IDs, beagle_results_zavg, 4)
-	beagle_z_l68 = getfile_value(current_id, beagle_results_IDs, beagle_results_zl68, 4)
-	beagle_z_u68 = getfile_value(current_id, beagle_results_IDs, beagle_results_zu68, 4)
+def beagle_text(beagle_record):
+	beagle_z_avg = getfile_value(beagle_record, 'zavg', 4)
+	beagle_z_l68 = getfile_value(beagle_record, 'zl68', 4)
+	beagle_z_u68 = getfile_value(beagle_record, 'zu68', 4)
 	
-	beagle_label.configure(text="z_BEAGLE,avg = "+str(beagle_z_avg)+" ("+str(beagle_z_l68)+" - "+str(beagle_z_u68)+")")  
-	beagle_z_1 = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_1, 4)
-	beagle_z_1_err = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_err_1, 4)
-	beagle_z1_label.configure(text="z_BEAGLE,1 = "+str(beagle_z_1)+" +/- "+str(beagle_z_1_err))  
-	beagle_z_2 = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_2, 4)
-	beagle_z_2_err = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_err_2, 4)
-	beagle_z2_label.configure(text="z_BEAGLE,2 = "+str(beagle_z_2)+" +/- "+str(beagle_z_2_err))  
-
-	beagle_Pzgt2p0 = getfile_value(current_id, beagle_results_IDs, beagle_results_Pzgt2p0, 2)
-	beagle_Pzgt4p0 = getfile_value(current_id, beagle_results_IDs, beagle_results_Pzgt4p0, 2)
-	beagle_Pzgt6p0 = getfile_value(current_id, beagle_results_IDs, beagle_results_Pzgt6p0, 2)
-	beagle_prob_label.configure(text="P(z > 2) = "+str(beagle_Pzgt2p0)+", P(z > 4) = "+str(beagle_Pzgt4p0)+", P(z > 4) = "+str(beagle_Pzgt6p0))  
-
-def update_NN_text(current_id, NN_results_IDs, NN_results_zpred):
-
-	NN_zpred = getfile_value(current_id, NN_results_IDs, NN_results_zpred, 4)
-	NN_use = getfile_true_or_false(current_id, NN_results_IDs, NN_results_use)
+	beagle_z_1 = getfile_value(beagle_record, 'redshift_1', 4)
+	beagle_z_1_err = getfile_value(beagle_record, 'redshift_err_1', 4)
+	beagle_z_2 = getfile_value(beagle_record, 'redshift_2', 4)
+	beagle_z_2_err = getfile_value(beagle_record, 'redshift_err_2', 4)
+
+	beagle_Pzgt2p0 = getfile_value(beagle_record, 'Pzgt2p0', 2)
+	beagle_Pzgt4p0 = getfile_value(beagle_record, 'Pzgt4p0', 2)
+	beagle_Pzgt6p0 = getfile_value(beagle_record, 'Pzgt6p0', 2)
+
+	return [('beagle_label', "z_BEAGLE,avg = "+str(beagle_z_avg)+" ("+str(beagle_z_l68)+" - "+str(beagle_z_u68)+")", '#711c91'),
+		('beagle_z1_label', "z_BEAGLE,1 = "+str(beagle_z_1)+" +/- "+str(beagle_z_1_err), '#711c91'),
+		('beagle_z2_label', "z_BEAGLE,2 = "+str(beagle_z_2)+" +/- "+str(beagle_z_2_err), '#711c91'),
+		('beagle_prob_label', "P(z > 2) = "+str(beagle_Pzgt2p0)+", P(z > 4) = "+str(beagle_Pzgt4p0)+", P(z > 4) = "+str(beagle_Pzgt6p0), '#711c91')]
+
+def NN_text(NN_record):
+
+	NN_zpred = getfile_value(NN_record, 'zpred', 4)
+	NN_use = getfile_true_or_false(NN_record, 'use')
 	
+	text = []
 	if (NN_use == True):
-		nn_label.configure(text="z_NN = "+str(NN_zpred), fg = 'black')  
+		text.append(('nn_label', "z_NN = "+str(NN_zpred), 'black'))
 	if (NN_use == False):
-		nn_label.configure(text="z_NN = "+str(NN_zpred)+" (USE = F)", fg = 'grey')  
+		text.append(('nn_label', "z_NN = "+str(NN_zpred)+" (USE = F)", 'grey'))
 
 	if(use_zspec == True):
-		NN_zspec = getfile_value(current_id, NN_results_IDs, NN_results_zspec, 4)
-		nn_label_zspec.configure(text="z_spec = "+str(NN_zspec))  
+		NN_zspec = getfile_value(NN_record, 'zspec', 4)
+		text.append(('nn_label_zspec', "z_spec = "+str(NN_zspec), 'red'))
+	return text
 	
-def update_color_selection_text(current_id, color_selection_results_IDs, color_selection_F090W_dropouts, color_selection_F115W_dropouts, color_selection_F150W_dropouts):
-	is_F090W_dropout = getfile_true_or_false(current_id, color_selection_IDs, color_selection_F090W_dropouts)
-	is_F115W_dropout = getfile_true_or_false(current_id, color_selection_IDs, color_selection_F115W_dropouts)
-	is_F150W_dropout = getfile_true_or_false(current_id, color_selection_IDs, color_selection_F150W_dropouts)
+def color_selection_text(color_selection_record):
+	is_F090W_dropout = getfile_true_or_false(color_selection_record, 'F090W_dropouts')
+	is_F115W_dropout = getfile_true_or_false(color_selection_record, 'F115W_dropouts')
+	is_F150W_dropout = getfile_true_or_false(color_selection_record, 'F150W_dropouts')
 
 	if (is_F090W_dropout):
-		color_selection_label.configure(text="F090W Dropout")  
+		return [('color_selection_label', "F090W Dropout", '#091833')]
 	elif (is_F115W_dropout):
-		color_selection_label.configure(text="F115W Dropout")  
+		return [('color_selection_label', "F115W Dropout", '#091833')]
 	elif (is_F150W_dropout):
-		color_selection_label.configure(text="F150W Dropout")  
+		return [('color_selection_label', "F150W Dropout", '#091833')]
 	else:
-		color_selection_label.configure(text=" ")  
+		return [('color_selection_label', " ", '#091833')]
 	
-def update_BAGPIPES_text(current_id, BAGPIPES_results_IDs, BAGPIPES_results_zphot):
-	BAGPIPES_zpred = getfile_value(current_id-1, BAGPIPES_results_IDs, BAGPIPES_results_zphot, 4)
-	bagpipes_label.configure(text="z_BAGPIPES = "+str(BAGPIPES_zpred))
+def BAGPIPES_text(BAGPIPES_record):
+	BAGPIPES_zpred = getfile_value(BAGPIPES_record, 'zphot', 4)
+	return [('bagpipes_label', "z_BAGPIPES = "+str(BAGPIPES_zpred), 'grey')]
+
+results_text_functions = {'EAZY':eazy_text, 'BEAGLE':beagle_text, 'NN':NN_text, 'color_selection':color_selection_text, 'BAGPIPES':BAGPIPES_text}
+
+# Where each of the labels goes (x, and y relative to toprow_y, before they're
+# scaled by sf), and whether it's in bold
+results_label_positions = {
+	'eazy_label_zpeak':(1100, -290, False), 'eazy_label_za':(1100, -250, False),
+	'beagle_label':(1100, -210, False), 'beagle_z1_label':(1100, -170, False), 'beagle_z2_label':(1100, -130, False), 'beagle_prob_label':(1100, -90, False),
+	'nn_label':(1740, -290, False), 'nn_label_zspec':(1740, -250, True),
+	'color_selection_label':(1760, -90, False),
+	'bagpipes_label':(1740, -150, False)
+}
+
+def update_results_text(current_index, names = None):
+	# Fill in the labels for each of the results catalogs that has been loaded
+	# (by default, all of them), from the object's row in each catalog
+	if (names is None):
+		names = results_first_labels.keys()
+	for name in names:
+		record = results_catalogs.record(name, current_index)
+		if (record is not None):
+			for (label_name, text, color) in results_text_functions[name](record):
+				results_labels[label_name].configure(text=text, fg=color)
+
+def check_results_catalogs():
+	# Fill in the labels of the catalogs that have arrived since the last check,
+	# and keep checking until they're all in
+	finished = results_catalogs.loaded_since_last_check()
+	for name in finished:
+		if (results_catalogs.get(name) is None):
+			results_first_labels[name].configure(text=name+" results not available")
+	update_results_text(ID_list_indices[ID_iterator], finished)
+	if (results_catalogs.pending()):
+		root.after(200, check_results_catalogs)
 		
 
-def nextobject():
-	global e2
-	global ID_iterator
-	global current_index
-	global ID_list
-	global ID_list_indices
+def object_key(current_id, current_index):
+	# Everything that decides what an object looks like on the screen
+	# (the crosshair is drawn on the canvas, so it doesn't matter here)
+	return (current_id, current_index, defaultstretch, ra_dec_size_value)
+
+def prepare_EAZY_image(current_id):
+	image = getEAZYimage(current_id)
+	start_time = time.time()
+	image = cropEAZY(image)
+	end_time = time.time()
+	if (timer_verbose):
+		print("Cropping the EAZY image: " +str(end_time - start_time))
+	start_time = time.time()
+	image = scaleimage(image, baseplotwidth)
+	end_time = time.time()
+	if (timer_verbose):
+		print("Resizing the EAZY image: " +str(end_time - start_time))
+	return image
+
+def prepare_BEAGLE_image(current_id):
+	new_image = getBEAGLEimage(current_id)
+	start_time = time.time()
+	new_image = scaleimage(new_image, baseplotwidth)
+	end_time = time.time()
+	if (timer_verbose):
+		print("Resizing the BEAGLE image: " +str(end_time - start_time))
+	return new_image
+
+def SED_image_functions(current_id):
+	# The functions that fetch (and crop and resize) each of the SED plots for
+	# an object, so that they can all be downloaded at the same time
+	SED_functions = {}
+	if (EAZY_plots_exist == True):
+		SED_functions['EAZY'] = partial(prepare_EAZY_image, current_id)
+	if (BEAGLE_plots_exist == True):
+		SED_functions['BEAGLE'] = partial(prepare_BEAGLE_image, current_id)
+	return SED_functions
+
+def prepare_object(current_id, current_index, stretch, ra_dec_size_value):
+	# Fetch the SED plots and render the thumbnails for an object, without 
+	# touching Tk, so that this can be run in a prefetching thread. The SED 
+	# plots are downloaded while the thumbnails are being made.
+	SED_futures = sed_fetcher.submit_all(SED_image_functions(current_id))
+
+	prepared = {}
+	start_time = time.time()
+	prepared['thumbnails'], prepared['cutouts'] = render_thumbnails(current_index, stretch, ra_dec_size_value)
+	end_time = time.time()
+	if (timer_verbose):
+		print("Creating the thumbnails: " +str(end_time - start_time))
+
+	for SED_name in SED_futures:
+		prepared[SED_name] = SED_futures[SED_name].result()
+	return prepared
+
+def schedule_prefetch():
+	# Start preparing the objects around the current one in the list
+	global prefetcher
+
+	if (prefetcher is None):
+		return
+	prefetch_keys = []
+	for position in prefetch_window(ID_iterator, len(ID_list), prefetch_depth):
+		prefetch_keys.append(object_key(ID_list[position], ID_list_indices[position]))
+	prefetcher.schedule(prefetch_keys)
+
+def fill_cutout_cache(id_value_index):
+	# Make the cutouts for an object (which puts them in the cutout cache), for
+	# the idle-time cache filler
+	fill_key = (id_value_index, ra_dec_size_value)
+	if (fill_key in filled_cutout_indices):
+		return
+
+	objRA = RA_values[id_value_index]
+	objDEC = DEC_values[id_value_index]
+	position = SkyCoord(str(objRA)+'d '+str(objDEC)+'d', frame='fk5')
+	size = u.Quantity((ra_dec_size_value, ra_dec_size_value), u.arcsec)
+
+	# (The lock is taken for one filter at a time, like in render_thumbnails, 
+	# so the object on the screen never waits long behind this)
+	for i in range(0, number_images):
+		if (image_flux_value_err_cat[id_value_index, i] > -9999):
+			with thumbnail_render_lock:
+				make_cutout(mosaics[i].data, position, size, mosaics[i].wcs, cutout_cache, all_image_paths[i], all_image_extension_number[i],
+					lambda: pixel_positions.cutout_slice(id_value_index, i, ra_dec_size_value))
+	filled_cutout_indices.add(fill_key)
+
+def schedule_cutout_cache_fill():
+	# Whenever the user moves, the filler starts again from the current position
+	if (cutout_cache_filler is None):
+		return
+	cutout_cache_filler.touch()
+	cutout_cache_filler.set_items(ID_list_indices[ID_iterator+1:])
+
+def save_session():
+	# Save where we are (and the thumbnail settings) to the session file. The
+	# list is only saved if it isn't the whole catalog, and then only once, to
+	# the list file that the session file points to.
+	global session_list_hash
+
+	session = {'ID_iterator':int(ID_iterator), 'current_id':int(ID_list[ID_iterator]), 'stretch':defaultstretch,
+		'ra_dec_size_value':ra_dec_size_value, 'crosshair':make_crosshair, 'ID_list_file':None, 'ID_list_hash':None}
+	try:
+		if (ID_list is not ID_values):
+			if (session_list_hash is None):
+				session_list_hash = write_session_list(session_list_file, ID_list)
+			session['ID_list_file'] = session_list_file
+			session['ID_list_hash'] = session_list_hash
+		write_session(session_file, session)
+	except (IOError, OSError) as e:
+		print("Could not save the session to "+session_file+": "+str(e))
+
+def warm_caches(positions):
+	# Get the SED plots (into the HTTP cache) and the cutouts (into the cutout
+	# cache) for these positions in the list, one object at a time in a thread 
+	# of its own, rather than in the fetcher's threads, so that none of it holds
+	# up the plots for the objects being looked at
+	if ((http_cache is None) & (cutout_cache is None)):
+		return
+	def warm_positions():
+		for position in positions:
+			if (http_cache is not None):
+				for SED_function in SED_image_functions(ID_list[position]).values():
+					try:
+						SED_function()
+					except Exception:
+						# (A missing plot is reported when the object is shown)
+						pass
+			if (cutout_cache is not None):
+				try:
+					fill_cutout_cache(ID_list_indices[position])
+				except Exception as e:
+					print("Filling the cutout cache failed for "+str(ID_list[position])+": "+str(e))
+	warm_thread = threading.Thread(target = warm_positions)
+	warm_thread.daemon = True
+	warm_thread.start()
+
+def display_object(current_id, current_index):
 	global photo
 	global new_photo
 	global item4
 	global item5
 	global canvas   
 	global fig_photo_objects
-	global defaultstretch
+	global current_cutouts
+	global canvas_contents
 
 	global eazy_positionx, eazy_positiony
-	global eazytext_positionx, eazytext_positiony
 	global beagle_positionx, beagle_positiony
-	global beagletext_positionx, beagletext_positiony
 
-	#global eazy_results_IDs, eazy_results_zpeak
-	#global beagle_results_IDs, eazy_results_zavg
-	
-	notes_values[current_index] = e2.get()
-	e2.delete(0,END)
+	# Use the prefetched object if it's there, otherwise prepare it now
+	prepared = None
+	if (prefetcher is not None):
+		prepared = prefetcher.get(object_key(current_id, current_index))
+		if (timer_verbose):
+			print("Object "+str(current_id)+" was prefetched: "+str(prepared is not None))
+	if (prepared is None):
+		prepared = prepare_object(*object_key(current_id, current_index))
 
-	if (ID_iterator < len(ID_list)-1):
-		ID_iterator = ID_iterator+1
-#	else:
-#		len(ID_list)-1
-#		save_destroy()
-	
 	if (item4 is not None):
 		canvas.delete(item4)
 
 	if (item5 is not None):
 		canvas.delete(item5)
 
-		
-	current_index = ID_list_indices[ID_iterator]
-	current_id = ID_list[ID_iterator]
-	e2.insert(0, notes_values[current_index])
-
-	#image = Image.open(EAZY_files+str(current_id)+"_EAZY_SED.png")
 	if (EAZY_plots_exist == True):
-		image = getEAZYimage(current_id)
-		start_time = time.time()
-		image = cropEAZY(image)
-		end_time = time.time()
-		if (timer_verbose):
-			print("Cropping the EAZY image: " +str(end_time - start_time))
-		start_time = time.time()
-		photo = resizeimage(image)
-		end_time = time.time()
-		if (timer_verbose):
-			print("Resizing the EAZY image: " +str(end_time - start_time))
 		start_time = time.time()
+		photo = ImageTk.PhotoImage(prepared['EAZY'])
 		item4 = canvas.create_image(eazy_positionx, eazy_positiony, image=photo)
 		end_time = time.time()
 		if (timer_verbose):
 			print("Creating the EAZY canvas: " +str(end_time - start_time))
 	
 	if (BEAGLE_plots_exist == True):
-		#new_image = Image.open(BEAGLE_files+str(current_id)+"_BEAGLE_SED.png")
-		new_image = getBEAGLEimage(current_id)
-		start_time = time.time()
-		new_photo = resizeimage(new_image)
-		end_time = time.time()
-		if (timer_verbose):
-			print("Resizing the BEAGLE image: " +str(end_time - start_time))
 		start_time = time.time()
+		new_photo = ImageTk.PhotoImage(prepared['BEAGLE'])
 		item5 = canvas.create_image(beagle_positionx, beagle_positiony, image=new_photo)
 		end_time = time.time()
 		if (timer_verbose):
 			print("Creating the BEAGLE canvas: " +str(end_time - start_time))
 	
-	start_time = time.time()
-	fig_photo_objects = create_thumbnails(canvas, fig_photo_objects, current_id, current_index, defaultstretch)
-	end_time = time.time()
+	fig_photo_objects = draw_thumbnails(canvas, prepared['thumbnails'])
+	current_cutouts = prepared['cutouts']
+	canvas_contents = dict(prepared)
+	if ((timer_verbose) & (thumbnail_cache is not None)):
+		print(thumbnail_cache.stats())
 	if (timer_verbose):
-		print("Creating the thumbnails: " +str(end_time - start_time))
+		print(interval_cache.stats())
 		
 	object_label.configure(text="Object "+str(current_id))  
 
 	canvas.delete("separator")
 	redshift_separator = canvas.create_rectangle(1100*sf, (toprow_y-320.0)*sf, 1940*sf, (toprow_y-310.0)*sf, outline="#0abdc6", fill="#0abdc6", tags="separator")
-	if (EAZY_results_file_exists):
-		update_eazy_text(current_id, eazy_results_IDs, eazy_results_zpeak)
-	if (BEAGLE_results_file_exists):
-		update_beagle_text(current_id, beagle_results_IDs, beagle_results_zavg)
-	if (NN_results_file_exists):
-		update_NN_text(current_id, NN_results_IDs, NN_results_zpred)
-	if (color_selection_results_file_exists):
-		update_color_selection_text(current_id, color_selection_IDs, color_selection_F090W_dropouts, color_selection_F115W_dropouts, color_selection_F150W_dropouts)
-	if (BAGPIPES_results_file_exists):
-		update_BAGPIPES_text(current_id, BAGPIPES_results_IDs, BAGPIPES_results_zphot)
+	update_results_text(current_index)
 
+	schedule_prefetch()
+	schedule_cutout_cache_fill()
+	save_session()
 
-def previousobject():
+def nextobject():
+	global e2
 	global ID_iterator
 	global current_index
-	global e2
 	global ID_list
 	global ID_list_indices
-	global photo
-	global new_photo
-	global item4
-	global item5
-	global canvas   
-	global fig_photo_objects
-	global defaultstretch
 
-	global eazy_positionx, eazy_positiony
-	global eazytext_positionx, eazytext_positiony
-	global beagle_positionx, beagle_positiony
-	global beagletext_positionx, beagletext_positiony
+	review_state.set_note(current_index, e2.get())
+	e2.delete(0,END)
 
-	#global eazy_results_IDs, eazy_results_zpeak
-	#global beagle_results_IDs, eazy_results_zavg
+	if (ID_iterator < len(ID_list)-1):
+		ID_iterator = ID_iterator+1
+#	else:
+#		len(ID_list)-1
+#		save_destroy()
+		
+	current_index = ID_list_indices[ID_iterator]
+	current_id = ID_list[ID_iterator]
+	e2.insert(0, review_state.note(current_index))
+
+	display_object(current_id, current_index)
 
-	notes_values[current_index] = e2.get()
+
+def previousobject():
+	global ID_iterator
+	global current_index
+	global e2
+	global ID_list
+	global ID_list_indices
+
+	review_state.set_note(current_index, e2.get())
 	e2.delete(0,END)
 
 	if (ID_iterator > 0):
@@ -350,39 +531,9 @@ def previousobject():
 	
 	current_index = ID_list_indices[ID_iterator]
 	current_id = ID_list[ID_iterator]
-	e2.insert(0, notes_values[current_index])
-
-	if (EAZY_plots_exist == True):
-		canvas.delete(item4)
-		#image = Image.open(EAZY_files+str(current_id)+"_EAZY_SED.png")
-		image = getEAZYimage(current_id)
-		image = cropEAZY(image)
-		photo = resizeimage(image)
-		item4 = canvas.create_image(eazy_positionx, eazy_positiony, image=photo)
-		
-	if (BEAGLE_plots_exist == True):
-		canvas.delete(item5)
-		#new_image = Image.open(BEAGLE_files+str(current_id)+"_BEAGLE_SED.png")
-		new_image = getBEAGLEimage(current_id)
-		new_photo = resizeimage(new_image)
-		item5 = canvas.create_image(beagle_positionx, beagle_positiony, image=new_photo)
-
-	fig_photo_objects = create_thumbnails(canvas, fig_photo_objects, current_id, current_index, defaultstretch)
-
-	object_label.configure(text="Object "+str(current_id))  
+	e2.insert(0, review_state.note(current_index))
 
-	canvas.delete("separator")
-	redshift_separator = canvas.create_rectangle(1100*sf, (toprow_y-320.0)*sf, 1940*sf, (toprow_y-310.0)*sf, outline="#0abdc6", fill="#0abdc6", tags="separator")
-	if (EAZY_results_file_exists):
-		update_eazy_text(current_id, eazy_results_IDs, eazy_results_zpeak)
-	if (BEAGLE_results_file_exists):
-		update_beagle_text(current_id, beagle_results_IDs, beagle_results_zavg)
-	if (NN_results_file_exists):
-		update_NN_text(current_id, NN_results_IDs, NN_results_zpred)
-	if (color_selection_results_file_exists):
-		update_color_selection_text(current_id, color_selection_IDs, color_selection_F090W_dropouts, color_selection_F115W_dropouts, color_selection_F150W_dropouts)
-	if (BAGPIPES_results_file_exists):
-		update_BAGPIPES_text(current_id, BAGPIPES_results_IDs, BAGPIPES_results_zphot)
+	display_object(current_id, current_index)
 
 
 def gotoobject():
@@ -392,65 +543,31 @@ def gotoobject():
 	global e2
 	global ID_list
 	global ID_list_indices
-	global photo
-	global new_photo
-	global item4
-	global item5
-	global canvas   
-	global fig_photo_objects
-	global defaultstretch
 
-	global eazy_positionx, eazy_positiony
-	global eazytext_positionx, eazytext_positiony
-	global beagle_positionx, beagle_positiony
-	global beagletext_positionx, beagletext_positiony
+	if (e1.get().isdigit() == True):
 
-	#global eazy_results_IDs, eazy_results_zpeak
-	#global beagle_results_IDs, eazy_results_zavg
+		# Make sure the object is there before leaving this one (and its note)
+		goto_positions = np.where(ID_list == int(e1.get()))[0]
+		if (len(goto_positions) == 0):
+			print("Object "+e1.get()+" isn't in the list.")
+			return
 
-	notes_values[current_index] = e2.get()
-	e2.delete(0,END)
+		review_state.set_note(current_index, e2.get())
+		e2.delete(0,END)
 
-	if (e1.get().isdigit() == True):
+		# We're jumping somewhere else, so whatever was being prefetched 
+		# around the old position isn't needed anymore.
+		if (prefetcher is not None):
+			prefetcher.cancel()
 
 		#current_id = int(e1.get())
-		ID_iterator = np.where(ID_list == int(e1.get()))[0][0]
+		ID_iterator = goto_positions[0]
 
 		current_index = ID_list_indices[ID_iterator]
 		current_id = ID_list[ID_iterator]
-		e2.insert(0, notes_values[current_index])
-	
-		#image = Image.open(EAZY_files+str(current_id)+"_EAZY_SED.png")
-		if (EAZY_plots_exist == True):
-			canvas.delete(item4)
-			image = getEAZYimage(current_id)
-			image = cropEAZY(image)
-			photo = resizeimage(image)
-			item4 = canvas.create_image(eazy_positionx, eazy_positiony, image=photo)
-		
-		if (BEAGLE_plots_exist == True):
-			canvas.delete(item5)
-			#new_image = Image.open(BEAGLE_files+str(current_id)+"_BEAGLE_SED.png")
-			new_image = getBEAGLEimage(current_id)
-			new_photo = resizeimage(new_image)
-			item5 = canvas.create_image(beagle_positionx, beagle_positiony, image=new_photo)
+		e2.insert(0, review_state.note(current_index))
 	
-		fig_photo_objects = create_thumbnails(canvas, fig_photo_objects, current_id, current_index, defaultstretch)
-
-		object_label.configure(text="Object "+str(current_id))  
-
-		canvas.delete("separator")
-		redshift_separator = canvas.create_rectangle(1100*sf, (toprow_y-320.0)*sf, 1940*sf, (toprow_y-310.0)*sf, outline="#0abdc6", fill="#0abdc6", tags="separator")
-		if (EAZY_results_file_exists):
-			update_eazy_text(current_id, eazy_results_IDs, eazy_results_zpeak)
-		if (BEAGLE_results_file_exists):
-			update_beagle_text(current_id, beagle_results_IDs, beagle_results_zavg)
-		if (NN_results_file_exists):
-			update_NN_text(current_id, NN_results_IDs, NN_results_zpred)
-		if (color_selection_results_file_exists):
-			update_color_selection_text(current_id, color_selection_IDs, color_selection_F090W_dropouts, color_selection_F115W_dropouts, color_selection_F150W_dropouts)
-		if (BAGPIPES_results_file_exists):
-			update_BAGPIPES_text(current_id, BAGPIPES_results_IDs, BAGPIPES_results_zphot)
+		display_object(current_id, current_index)
 
 	else:
 		print("That's not a valid ID number.")
@@ -474,7 +591,9 @@ def togglecrosshair():
 		make_crosshair = False
 		btn12.config(font=('helvetica', textsizevalue))
 		
-	fig_photo_objects = create_thumbnails(canvas, fig_photo_objects, ID_list[ID_iterator], ID_list_indices[ID_iterator], defaultstretch)
+	# The crosshair is drawn on top of the thumbnails, so we just show or hide it
+	canvas.itemconfigure("crosshair", state=crosshair_state())
+	save_session()
 
 # This will remove the thumbnails, for future work
 def cropEAZY(img):
@@ -511,6 +630,8 @@ def linearstretch():
 
 	defaultstretch = 'LinearStretch'	
 	fig_photo_objects = create_thumbnails(canvas, fig_photo_objects, ID_list[ID_iterator], ID_list_indices[ID_iterator], defaultstretch)
+	schedule_prefetch()
+	save_session()
 
 def logstretch():
 	global sf
@@ -531,6 +652,8 @@ def logstretch():
 
 	defaultstretch = 'LogStretch'
 	fig_photo_objects = create_thumbnails(canvas, fig_photo_objects, ID_list[ID_iterator], ID_list_indices[ID_iterator], defaultstretch)
+	schedule_prefetch()
+	save_session()
 
 def asinhstretch():
 	global sf
@@ -551,108 +674,30 @@ def asinhstretch():
 
 	defaultstretch = 'AsinhStretch'
 	fig_photo_objects = create_thumbnails(canvas, fig_photo_objects, ID_list[ID_iterator], ID_list_indices[ID_iterator], defaultstretch)
+	schedule_prefetch()
+	save_session()
 
-# This is kind of a hack to make sure that the image thumbnail size is printed on
-# the output files, since none of the labels or buttons are printed when you use
-# canvas.postscript()
+# The image is made from what's on the canvas (the SED plots and thumbnails, 
+# which are already rendered, and the labels) with PIL, rather than through 
+# canvas.postscript() and Ghostscript, so nothing has to be drawn on the canvas
+# and there's no EPS file to clean up
 def save_canvas():
-	global thumbnailsize
-	global sf
-	global canvas
 	global ID_list
 	global ID_iterator
 	global e3
 
 	current_id = ID_list[ID_iterator]
+	current_index = ID_list_indices[ID_iterator]
 
 	ra_dec_size_value = float(e3.get())
 
-	fig = plt.figure(figsize=(thumbnailsize*2.51,thumbnailsize/4.0))
-	ax8 = fig.add_axes([0, 0, 1, 1])
-	ax8.text(0.02, 0.5, "Image Size: "+str(ra_dec_size_value)+"\" x "+str(ra_dec_size_value)+"\"", transform=ax8.transAxes, fontsize=12, fontweight='bold', ha='left', va='center', color = 'black')
-	fig_x = 20*sf
-	if (number_images <= 6):
-		fig_y = 760*sf
-	if ((number_images > 6) & (number_images <= 12)):
-		fig_y = 900*sf
-	if (number_images > 12):
-		fig_y = 1040*sf	
-
-	fig_size_object = draw_figure(canvas, fig, loc=(fig_x, fig_y))
-
-	#fig = plt.figure(figsize=(thumbnailsize*2.51,thumbnailsize/4.0))
-	fig2 = plt.figure(figsize=(7, 2.5))
-	ax9 = fig2.add_axes([0, 0, 1, 1])
-	if (EAZY_results_file_exists):
-		eazy_z_peak = getfile_value(current_id, eazy_results_IDs, eazy_results_zpeak, 4)
-		eazy_z_a = getfile_value(current_id, eazy_results_IDs, eazy_results_za, 4)
-		eazy_l68 = getfile_value(current_id, eazy_results_IDs, eazy_results_zl68, 4)
-		eazy_u68 = getfile_value(current_id, eazy_results_IDs, eazy_results_zu68, 4)
-		ax9.text(0.02, 0.9, "z_EAZY, peak = "+str(eazy_z_peak)+" ("+str(eazy_l68)+" - "+str(eazy_u68)+")", transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='left', va='center', color = '#133e7c')
-		ax9.text(0.02, 0.8, "z_EAZY, peak = "+str(eazy_z_a), transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='left', va='center', color = '#133e7c')
-	if (BEAGLE_results_file_exists):
-		beagle_z_avg = getfile_value(current_id, beagle_results_IDs, beagle_results_zavg, 4)
-		beagle_z_l68 = getfile_value(current_id, beagle_results_IDs, beagle_results_zl68, 4)
-		beagle_z_u68 = getfile_value(current_id, beagle_results_IDs, beagle_results_zu68, 4)
-		
-		beagle_z_1 = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_1, 4)
-		beagle_z_1_err = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_err_1, 4)
-		beagle_z_2 = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_2, 4)
-		beagle_z_2_err = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_err_2, 4)
-	
-		beagle_Pzgt2p0 = getfile_value(current_id, beagle_results_IDs, beagle_results_Pzgt2p0, 2)
-		beagle_Pzgt4p0 = getfile_value(current_id, beagle_results_IDs, beagle_results_Pzgt4p0, 2)
-		beagle_Pzgt6p0 = getfile_value(current_id, beagle_results_IDs, beagle_results_Pzgt6p0, 2)
-
-		ax9.text(0.02, 0.7, "z_BEAGLE,avg = "+str(beagle_z_avg)+" ("+str(beagle_z_l68)+" - "+str(beagle_z_u68)+")", transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='left', va='center', color = '#711c91')
-		ax9.text(0.02, 0.6, "z_BEAGLE,1 = "+str(beagle_z_1)+" +/- "+str(beagle_z_1_err), transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='left', va='center', color = '#711c91')
-		ax9.text(0.02, 0.5, "z_BEAGLE,2 = "+str(beagle_z_2)+" +/- "+str(beagle_z_2_err), transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='left', va='center', color = '#711c91')
-		ax9.text(0.02, 0.4, "P(z > 2) = "+str(beagle_Pzgt2p0)+", P(z > 4) = "+str(beagle_Pzgt4p0)+", P(z > 4) = "+str(beagle_Pzgt6p0), transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='left', va='center', color = '#711c91')
-	if (NN_results_file_exists):
-		NN_zpred = getfile_value(current_id, NN_results_IDs, NN_results_zpred, 4)
-		ax9.text(0.98, 0.9, "z_NN = "+str(NN_zpred), transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='right', va='center', color = '#091833')		
-		if (use_zspec == True):
-			NN_zspec = getfile_value(current_id, NN_results_IDs, NN_results_zspec, 4)
-			ax9.text(0.98, 0.8, "z_spec = "+str(NN_zspec), transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='right', va='center', color = 'red')		
-	if (color_selection_results_file_exists):
-		is_F090W_dropout = getfile_true_or_false(current_id, color_selection_IDs, color_selection_F090W_dropouts)
-		is_F115W_dropout = getfile_true_or_false(current_id, color_selection_IDs, color_selection_F115W_dropouts)
-		is_F150W_dropout = getfile_true_or_false(current_id, color_selection_IDs, color_selection_F150W_dropouts)
-
-		if (is_F090W_dropout):
-			ax9.text(0.98, 0.1, "F090W Dropout", transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='right', va='center', color = 'black')
-		elif (is_F115W_dropout):
-			ax9.text(0.98, 0.1, "F115W Dropout", transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='right', va='center', color = 'black')
-		elif (is_F150W_dropout):
-			ax9.text(0.98, 0.1, "F150W Dropout", transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='right', va='center', color = 'black')
-	if (BAGPIPES_results_file_exists):
-		BAGPIPES_zpred = getfile_value(current_id-1, BAGPIPES_results_IDs, BAGPIPES_results_zphot, 4)
-		ax9.text(0.98, 0.3, "z_BAGPIPES = "+str(BAGPIPES_zpred), transform=ax9.transAxes, fontsize=14, fontweight='bold', ha='right', va='center', color = '#091833')		
-
-
-	fig2_x = 950
-	fig2_y = 650
-	
-	fig2_size_object = draw_figure(canvas, fig2, loc=(fig2_x, fig2_y))
-	#fig.close()
-
-	# The text needs to be at: 1100, 600
-	#fig2 = plt.figure(figsize=(500,200))
-	#ax9 = fig.add_axes([0, 0, 1, 1])
-	#ax9.text(0.1, 0.1, "z_EAZY = "+str(eazy_z)+" ("+str(eazy_l68)+" - "+str(eazy_u68)+")", transform=ax9.transAxes, fontsize=12, fontweight='bold', ha='left', va='center', color = 'black')
-	#fig_x = 1100
-	#fig_y = 600
-	#fig_redshift_object = draw_figure(canvas, fig2, loc=(fig_x, fig_y))
-	#fig2.close()
-
+	start_time = time.time()
+	panel = compose_panel(current_id, current_index, canvas_contents, make_crosshair, ra_dec_size_value)
 	output_filename = str(current_id)+'_JADESView'
-	canvas.postscript(file=output_filename+'.eps', colormode='color')
-	
-	# use PIL to convert to PNG 
-	img = Image.open(output_filename+'.eps') 
-	os.system('rm '+output_filename+'.eps')
-	#print output_filename+'.png'
-	img.save(output_filename+'.png', 'png') 
+	panel.save(output_filename+'.png', 'png') 
+	end_time = time.time()
+	if (timer_verbose):
+		print("Saving the canvas: " +str(end_time - start_time))
 
 def changeradecsize():
 	global ID_iterator
@@ -666,44 +711,71 @@ def changeradecsize():
 
 	ra_dec_size_value = float(e3.get())
 	fig_photo_objects = create_thumbnails(canvas, fig_photo_objects, ID_list[ID_iterator], ID_list_indices[ID_iterator], defaultstretch)
+	schedule_prefetch()
+	save_session()
+
+
+def create_thumbnails(canvas, fig_photo_objects, id_value, id_value_index, stretch):
+	global ra_dec_size_value
+	global current_cutouts
 
+	# The cutouts of the current object are kept, so changing the stretch only
+	# has to apply the new stretch to them
+	thumbnails, current_cutouts = render_thumbnails(id_value_index, stretch, ra_dec_size_value, current_cutouts)
+	fig_photo_objects = draw_thumbnails(canvas, thumbnails)
+	canvas_contents['thumbnails'] = thumbnails
 
-def draw_figure(canvas, figure, loc=(0, 0)):
-    """ Draw a matplotlib figure onto a Tk canvas
+	return fig_photo_objects
 
-    loc: location of top-left corner of figure on canvas in pixels.
-    Inspired by matplotlib source: lib/matplotlib/backends/backend_tkagg.py
-    """
-    figure_canvas_agg = FigureCanvasAgg(figure)
-    figure_canvas_agg.draw()
-    figure_x, figure_y, figure_w, figure_h = figure.bbox.bounds
-    figure_w, figure_h = int(figure_w), int(figure_h)
-    photo = PhotoImage(master=canvas, width=figure_w, height=figure_h)
+def crosshair_state():
+	if (make_crosshair == True):
+		return 'normal'
+	return 'hidden'
 
-    # Position: convert from top-left anchor to center anchor
-    canvas.create_image(loc[0] + figure_w/2, loc[1] + figure_h/2, image=photo)
+def draw_thumbnails(canvas, thumbnails):
+	# Put the rendered thumbnails on the canvas (this has to happen in the main
+	# thread), replacing the ones that are there now.
+	canvas.delete("thumbnail")
+	fig_photo_objects = []
+	for fig_x, fig_y, thumbnail_image in thumbnails:
+		photo = ImageTk.PhotoImage(thumbnail_image, master=canvas)
+		figure_w, figure_h = thumbnail_image.size
 
-    # Unfortunately, there's no accessor for the pointer to the native renderer
-    tkagg.blit(photo, figure_canvas_agg.get_renderer()._renderer, colormode=2)
+		# Position: convert from top-left anchor to center anchor
+		canvas.create_image(fig_x + figure_w/2, fig_y + figure_h/2, image=photo, tags="thumbnail")
 
-    # Return a handle which contains a reference to the photo object
-    # which must be kept live or else the picture disappears
-    return photo
+		# Keep this handle alive, or else the thumbnail will disappear
+		fig_photo_objects.append(photo)
 
-def create_thumbnails(canvas, fig_photo_objects, id_value, id_value_index, stretch):
+		# The crosshair goes on top, and is hidden unless it's turned on
+		for (x1, y1, x2, y2) in crosshair_lines(figure_w, figure_h):
+			canvas.create_line(fig_x + x1, fig_y + y1, fig_x + x2, fig_y + y2, fill="white", width=crosshair_line_width, 
+				tags=("thumbnail", "crosshair"), state=crosshair_state())
+
+	return fig_photo_objects
+
+def thumbnail_key(id_value, filter_name, ra_dec_size_value, stretch):
+	return (id_value, filter_name, ra_dec_size_value, stretch)
+
+def render_thumbnails(id_value_index, stretch, ra_dec_size_value, retained_cutouts = None):
 	#global ID_values
 	global thumbnailsize
 	global RA_values
 	global DEC_values
-	global ra_dec_size_value
-	global image_all
-	global image_hdu_all
-	global image_wcs_all
+	global mosaics
 	global image_flux_value_err_cat
 	global all_images_filter_name
 	global number_images
 	global SNR_values
 	
+	# This doesn't touch Tk, so it can be run in the prefetching threads. It 
+	# returns a list of (fig_x, fig_y, image) for each of the thumbnails, where 
+	# the image is a PIL image, and the cutouts that were used, as a dictionary
+	# of (cutout data, interval) keyed by (index, filter number, size). Cutouts 
+	# passed in through retained_cutouts are used instead of cutting them out 
+	# again. The WCS objects are not thread-safe, so only one object is cut out 
+	# at a time.
+
 	# Let's associate the selected object with it's RA and DEC		
 	# Create the object thumbnails. 
 	#idx_cat = np.where(ID_values == id_value)[0]
@@ -717,191 +789,335 @@ def create_thumbnails(canvas, fig_photo_objects, id_value, id_value_index, stret
 	position = SkyCoord(str(objRA)+'d '+str(objDEC)+'d', frame='fk5')
 	size = u.Quantity((ra_dec_size_value, ra_dec_size_value), u.arcsec)
 	
-	fig_photo_objects = np.empty(0, dtype = 'object')
+	# Only hold on to the cutouts of this object at this size
+	cutouts = {}
+	if (retained_cutouts is not None):
+		for cutout_key in retained_cutouts:
+			if ((cutout_key[0] == idx_cat) & (cutout_key[2] == ra_dec_size_value)):
+				cutouts[cutout_key] = retained_cutouts[cutout_key]
+
+	# Start with the thumbnails that have already been rendered with these settings
+	thumbnails = []
+	filters_to_render = []
 	for i in range(0, number_images):
-		image = image_hdu_all[i].data
-		image_hdu = image_hdu_all[i]
-		image_wcs = image_wcs_all[i]
-				
-#		if (all_images_filter_name[i] == 'HST_F814W'):
-#			image_wcs.sip = None
-		
 		if (image_flux_value_err_cat[idx_cat, i] > -9999):
+			cached_image = None
+			if (thumbnail_cache is not None):
+				cached_image = thumbnail_cache.get(thumbnail_key(ID_values[idx_cat], all_images_filter_name[i], ra_dec_size_value, stretch))
+			if (cached_image is not None):
+				fig_x, fig_y = thumbnail_position(i)
+				thumbnails.append((fig_x, fig_y, cached_image))
+				# Hold on to its cutout too, so a new stretch doesn't have to cut
+				# it out again
+				cutout_key = (idx_cat, i, ra_dec_size_value)
+				if ((cutout_key not in cutouts) & (cutout_memory_cache is not None)):
+					cached_cutout = cutout_memory_cache.get(cutout_key)
+					if (cached_cutout is not None):
+						cutouts[cutout_key] = cached_cutout
+			else:
+				filters_to_render.append(i)
+
+	if (len(filters_to_render) == 0):
+		return thumbnails, cutouts
+
+	# The thumbnails are thumbnailsize inches at 100 dpi, the same size as the 
+	# matplotlib figures that they used to be
+	thumbnail_pixels = int(thumbnailsize*100)
+
+	# Make the cutouts that we don't already have
+	new_filters = []
+	for i in filters_to_render:
+		cutout_key = (idx_cat, i, ra_dec_size_value)
+		if ((cutout_key not in cutouts) & (cutout_memory_cache is not None)):
+			cached_cutout = cutout_memory_cache.get(cutout_key)
+			if (cached_cutout is not None):
+				cutouts[cutout_key] = cached_cutout
+		if cutout_key not in cutouts:
+			image = mosaics[i].data
+			image_wcs = mosaics[i].wcs
+					
+	#		if (all_images_filter_name[i] == 'HST_F814W'):
+	#			image_wcs.sip = None
+			
 			# Make the cutout
 			#print(all_images_filter_name[i])
 			start_time = time.time()
-			image_cutout = Cutout2D(image, position, size, wcs=image_wcs)
+			with thumbnail_render_lock:
+				image_cutout = make_cutout(image, position, size, image_wcs, cutout_cache, all_image_paths[i], all_image_extension_number[i],
+					lambda: pixel_positions.cutout_slice(idx_cat, i, ra_dec_size_value))
 			#end_time = time.time()
 			#print("       Running Cutout2D: " +str(end_time - start_time))
-			
-			SNR_fontsize_large = int(15.0*sf)
-			SNR_fontsize_small = int(12.0*sf)
-			
-			# Create the wcs axes
-			plt.clf()
-			fig = plt.figure(figsize=(thumbnailsize,thumbnailsize))
-			ax3 = fig.add_axes([0, 0, 1, 1], projection=image_cutout.wcs)
-			if (all_images_filter_name[i] == 'SEGMAP'):
-				ax3.text(0.51, 0.96, all_images_filter_name[i], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'black')
-				ax3.text(0.5, 0.95, all_images_filter_name[i], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'white')
-			
-			else:
-				ax3.text(0.51, 0.96, all_images_filter_name[i].split('_')[1], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'black')
-				ax3.text(0.5, 0.95, all_images_filter_name[i].split('_')[1], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'white')
-			if (number_images <= 18):
+			cutouts[cutout_key] = (image_cutout.data, None)
+			new_filters.append(i)
+
+	# The zscale intervals only depend on the pixels, so they're worked out once
+	# for each cutout, all of the filters together (the segmentation map is 
+	# shown over its full range)
+	zscale_filters = []
+	for i in new_filters:
+		thumbnail = cutouts[(idx_cat, i, ra_dec_size_value)][0]
+		if (all_images_filter_name[i] == 'SEGMAP'):
+			cutouts[(idx_cat, i, ra_dec_size_value)] = (thumbnail, (np.nanmin(thumbnail), np.nanmax(thumbnail)))
+		else:
+			zscale_filters.append(i)
+	interval_keys = [(ID_values[idx_cat], all_images_filter_name[i], ra_dec_size_value) for i in zscale_filters]
+	intervals = interval_cache.intervals(interval_keys, [cutouts[(idx_cat, i, ra_dec_size_value)][0] for i in zscale_filters])
+	for i, interval in zip(zscale_filters, intervals):
+		cutouts[(idx_cat, i, ra_dec_size_value)] = (cutouts[(idx_cat, i, ra_dec_size_value)][0], interval)
+	if (cutout_memory_cache is not None):
+		for i in new_filters:
+			cutout_memory_cache.put((idx_cat, i, ra_dec_size_value), cutouts[(idx_cat, i, ra_dec_size_value)])
+
+	for i in filters_to_render:
+		start_time = time.time()
+		thumbnail, interval = cutouts[(idx_cat, i, ra_dec_size_value)]
+		
+		SNR_fontsize_large = int(15.0*sf)
+		SNR_fontsize_small = int(12.0*sf)
+
+		if (all_images_filter_name[i] == 'SEGMAP'):
+			thumbnail_label = all_images_filter_name[i]
+		else:
+			thumbnail_label = all_images_filter_name[i].split('_')[1]
+
+		snr_text = None
+		snr_fontsize = SNR_fontsize_large
+		if (number_images <= 18):
+			#if (all_images_filter_name[i] != 'SEGMAP'):
+			if (SNR_values[idx_cat, i] != -9999):
 				if (SNR_values[idx_cat, i] > -100):
-					#if (all_images_filter_name[i] != 'SEGMAP'):
-					if (SNR_values[idx_cat, i] != -9999):
-						ax3.text(0.96, 0.06, 'SNR = '+str(round(SNR_values[idx_cat, i],2)), transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', horizontalalignment='right', color = 'black')
-						ax3.text(0.95, 0.05, 'SNR = '+str(round(SNR_values[idx_cat, i],2)), transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', horizontalalignment='right', color = 'white')
+					snr_text = 'SNR = '+str(round(SNR_values[idx_cat, i],2))
 				else:
-					#if (all_images_filter_name[i] != 'SEGMAP'):
-					if (SNR_values[idx_cat, i] != -9999):					
-						ax3.text(0.96, 0.06, 'SNR < -100', transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', horizontalalignment='right', color = 'black')
-						ax3.text(0.95, 0.05, 'SNR < -100', transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', horizontalalignment='right', color = 'white')
-			else:
+					snr_text = 'SNR < -100'
+		else:
+			snr_fontsize = SNR_fontsize_small
+			if (all_images_filter_name[i] != 'SEGMAP'):
 				if (SNR_values[idx_cat, i] > -100):
-					if (all_images_filter_name[i] != 'SEGMAP'):
-						ax3.text(0.96, 0.06, 'SNR = '+str(round(SNR_values[idx_cat, i],2)), transform=ax3.transAxes, fontsize=SNR_fontsize_small, fontweight='bold', horizontalalignment='right', color = 'black')
-						ax3.text(0.95, 0.05, 'SNR = '+str(round(SNR_values[idx_cat, i],2)), transform=ax3.transAxes, fontsize=SNR_fontsize_small, fontweight='bold', horizontalalignment='right', color = 'white')
+					snr_text = 'SNR = '+str(round(SNR_values[idx_cat, i],2))
 				else:
-					if (all_images_filter_name[i] != 'SEGMAP'):
-						ax3.text(0.96, 0.06, 'SNR < -100', transform=ax3.transAxes, fontsize=SNR_fontsize_small, fontweight='bold', horizontalalignment='right', color = 'black')
-						ax3.text(0.95, 0.05, 'SNR < -100', transform=ax3.transAxes, fontsize=SNR_fontsize_small, fontweight='bold', horizontalalignment='right', color = 'white')
-			
-			if (make_crosshair == True):
-				ax3.plot([0.5, 0.5], [0.65, 0.8], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-				ax3.plot([0.5, 0.5], [0.2, 0.35], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-				ax3.plot([0.2, 0.35], [0.5, 0.5], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-				ax3.plot([0.65, 0.8], [0.5, 0.5], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-						
-			# Set the color map
-			plt.set_cmap('gray')
-			
-			indexerror = 0		
-			# Normalize the image using the min-max interval and a square root stretch
-			thumbnail = image_cutout.data
-			#start_time = time.time()
-			if (stretch == 'AsinhStretch'):
-				try:
-					norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=AsinhStretch())
-				except IndexError:
-					indexerror = 1
-				except UnboundLocalError:
-					indexerror = 1
-			if (stretch == 'LogStretch'):
-				try:
-					norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=LogStretch(100))
-				except IndexError:
-					indexerror = 1
-				except UnboundLocalError:
-					indexerror = 1
-			if (stretch == 'LinearStretch'):
-				try:
-					norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=LinearStretch())
-				except IndexError:
-					indexerror = 1
-				except UnboundLocalError:
-					indexerror = 1
-			#end_time = time.time()
-			#print("       Stretching Image: " +str(end_time - start_time))
-			
-			#start_time = time.time()
-			if (all_images_filter_name[i] == 'SEGMAP'):
-				ax3.imshow(thumbnail, origin = 'lower', aspect='equal')
-			elif (indexerror == 0):
-				ax3.imshow(thumbnail, origin = 'lower', aspect='equal', norm = norm)
-			else:
-				ax3.imshow(thumbnail, origin = 'lower', aspect='equal')
-			#end_time = time.time()
-			#print("       Plotting Thumbnail: " +str(end_time - start_time))
-			
-			if (number_images <= 18):
-				if (i <= 5):
-					fig_x, fig_y = (20*sf)+(175*i*sf), 500*sf
-				if ((i > 5) & (i <= 11)):
-					fig_x, fig_y = (20*sf)+(175*(i-6)*sf), 675*sf
-				if ((i > 11) & (i <= 17)):
-					fig_x, fig_y = (20*sf)+(175*(i-12)*sf), 850*sf
-			if ((number_images > 18) & (number_images <= 24)):
-				if (i <= 7):
-					fig_x, fig_y = (20*sf)+(130*i*sf), 500*sf
-				if ((i > 7) & (i <= 15)):
-					fig_x, fig_y = (20*sf)+(130*(i-8)*sf), 675*sf
-				if ((i > 15) & (i <= 23)):
-					fig_x, fig_y = (20*sf)+(130*(i-16)*sf), 850*sf
-			if ((number_images > 24) & (number_images <= 32)):
-				if (i <= 7):
-					fig_x, fig_y = (20*sf)+(130*i*sf), 500*sf
-				if ((i > 7) & (i <= 15)):
-					fig_x, fig_y = (20*sf)+(130*(i-8)*sf), 625*sf
-				if ((i > 15) & (i <= 23)):
-					fig_x, fig_y = (20*sf)+(130*(i-16)*sf), 750*sf
-				if ((i > 23) & (i <= 31)):
-					fig_x, fig_y = (20*sf)+(130*(i-24)*sf), 875*sf
-							
-			# Keep this handle alive, or else figure will disappear
-			fig_photo_objects = np.append(fig_photo_objects, draw_figure(canvas, fig, loc=(fig_x, fig_y)))
-			plt.close('all')
-			end_time = time.time()
-			if (timer_verbose):
-				print("       Plotting Thumbnail: " +str(end_time - start_time))
-
-	return fig_photo_objects
+					snr_text = 'SNR < -100'
 
+		# Normalize the image using the zscale interval and the stretch (the 
+		# segmentation map is shown with a linear stretch over its full range)
+		if (all_images_filter_name[i] == 'SEGMAP'):
+			thumbnail_image = render_thumbnail(thumbnail, 'LinearStretch', thumbnail_pixels, thumbnail_label, SNR_fontsize_large, 
+				snr_text, snr_fontsize, interval = interval)
+		else:
+			thumbnail_image = render_thumbnail(thumbnail, stretch, thumbnail_pixels, thumbnail_label, SNR_fontsize_large, 
+				snr_text, snr_fontsize, interval = interval)
+		
+		fig_x, fig_y = thumbnail_position(i)
+		thumbnails.append((fig_x, fig_y, thumbnail_image))
+		if (thumbnail_cache is not None):
+			thumbnail_cache.put(thumbnail_key(ID_values[idx_cat], all_images_filter_name[i], ra_dec_size_value, stretch), thumbnail_image)
+		end_time = time.time()
+		if (timer_verbose):
+			print("       Plotting Thumbnail: " +str(end_time - start_time))
+
+	return thumbnails, cutouts
+
+def thumbnail_position(i):
+	# The top-left corner of the i-th thumbnail on the canvas
+	if (number_images <= 18):
+		if (i <= 5):
+			fig_x, fig_y = (20*sf)+(175*i*sf), 500*sf
+		if ((i > 5) & (i <= 11)):
+			fig_x, fig_y = (20*sf)+(175*(i-6)*sf), 675*sf
+		if ((i > 11) & (i <= 17)):
+			fig_x, fig_y = (20*sf)+(175*(i-12)*sf), 850*sf
+	if ((number_images > 18) & (number_images <= 24)):
+		if (i <= 7):
+			fig_x, fig_y = (20*sf)+(130*i*sf), 500*sf
+		if ((i > 7) & (i <= 15)):
+			fig_x, fig_y = (20*sf)+(130*(i-8)*sf), 675*sf
+		if ((i > 15) & (i <= 23)):
+			fig_x, fig_y = (20*sf)+(130*(i-16)*sf), 850*sf
+	if ((number_images > 24) & (number_images <= 32)):
+		if (i <= 7):
+			fig_x, fig_y = (20*sf)+(130*i*sf), 500*sf
+		if ((i > 7) & (i <= 15)):
+			fig_x, fig_y = (20*sf)+(130*(i-8)*sf), 625*sf
+		if ((i > 15) & (i <= 23)):
+			fig_x, fig_y = (20*sf)+(130*(i-16)*sf), 750*sf
+		if ((i > 23) & (i <= 31)):
+			fig_x, fig_y = (20*sf)+(130*(i-24)*sf), 875*sf
+
+	return fig_x, fig_y
+
+
+def image_size_position():
+	# Where the "Image Size" text goes, below the thumbnails
+	if (number_images <= 6):
+		return 20*sf, 760*sf
+	if ((number_images > 6) & (number_images <= 12)):
+		return 20*sf, 900*sf
+	return 20*sf, 1040*sf
+
+def draw_label_text(draw, x, y, text, fontsize, color, bold = False):
+	# Text where a Tk label placed at (x, y) would show it (the labels have a
+	# couple of pixels of border and padding around their text)
+	draw.text((x + 2, y + 2), text, fill = color, font = load_font(fontsize, bold))
+
+def compose_panel(current_id, current_index, prepared, crosshair, ra_dec_size_value):
+	# The canvas for an object (the SED plots, the thumbnails, and the redshift
+	# labels) as a PIL image, made from a prepared object (see prepare_object,
+	# or canvas_contents for what's on the screen) without Tk, so that it can
+	# be saved without a display
+	panel = Image.new('RGB', (int(canvaswidth), int(canvasheight)), 'white')
+	draw = ImageDraw.Draw(panel)
+
+	# The SED plots are centered on their positions, like on the canvas (the
+	# BAGPIPES or SEDz plot takes the place of the BEAGLE one when it's shown)
+	SED_positions = [('EAZY', eazy_positionx, eazy_positiony, "EAZY FIT", eazytext_positionx, eazytext_positiony),
+		('BEAGLE', beagle_positionx, beagle_positiony, "BEAGLE FIT ", beagletext_positionx, beagletext_positiony),
+		('BAGPIPES', bagpipes_positionx, bagpipes_positiony, "BAGPIPES FIT", beagletext_positionx, beagletext_positiony),
+		('SEDz', beagle_positionx, beagle_positiony, None, None, None)]
+	for (SED_name, position_x, position_y, title, title_x, title_y) in SED_positions:
+		if (SED_name in prepared):
+			SED_image = prepared[SED_name]
+			box = (int(position_x - SED_image.size[0]/2), int(position_y - SED_image.size[1]/2))
+			if (SED_image.mode in ('RGBA', 'LA')):
+				panel.paste(SED_image, box, SED_image)
+			else:
+				panel.paste(SED_image, box)
+			if (title is not None):
+				draw_label_text(draw, title_x, title_y, title, int(textsizevalue*1.5), 'black')
+	draw_label_text(draw, objectID_positionx, objectID_positiony, "Object "+str(current_id), int(textsizevalue*1.5), 'black')
+
+	for fig_x, fig_y, thumbnail_image in prepared['thumbnails']:
+		panel.paste(thumbnail_image, (int(fig_x), int(fig_y)))
+		if (crosshair == True):
+			figure_w, figure_h = thumbnail_image.size
+			for (x1, y1, x2, y2) in crosshair_lines(figure_w, figure_h):
+				draw.line([(fig_x + x1, fig_y + y1), (fig_x + x2, fig_y + y2)], fill = 'white', width = crosshair_line_width)
+	image_size_x, image_size_y = image_size_position()
+	draw_label_text(draw, image_size_x, image_size_y, "Image Size: "+str(ra_dec_size_value)+"\" x "+str(ra_dec_size_value)+"\"", 12, 'black', bold = True)
+
+	draw.rectangle([1100*sf, (toprow_y-320.0)*sf, 1940*sf, (toprow_y-310.0)*sf], outline = "#0abdc6", fill = "#0abdc6")
+	for name in results_text_functions:
+		record = results_catalogs.record(name, current_index)
+		if (record is None):
+			continue
+		for (label_name, text, color) in results_text_functions[name](record):
+			label_x, label_y, bold = results_label_positions[label_name]
+			draw_label_text(draw, label_x*sf, (toprow_y+label_y)*sf, text, textsizevalue, color, bold)
+
+	return panel
+
+def batch_initializer():
+	# Each worker process makes its own pool of connections (the one in the 
+	# main process, and its threads, don't come along when it forks)
+	global sed_fetcher
+	sed_fetcher = SEDFetcher(fenrir_username, fenrir_password, fetch_workers, fetch_connect_timeout, fetch_read_timeout, http_cache, args.offline)
+
+def batch_render(current_index):
+	# Render the panel for one object and save it as a png (in a worker process),
+	# and give back how it used the cutout cache, since each worker has its own
+	# copy of the counts
+	current_id = ID_values[current_index]
+	start_time = time.time()
+	output_filename = os.path.join(batch_directory, str(current_id)+'_JADESView.png')
+	cache_counts = (0, 0)
+	if (cutout_cache is not None):
+		cache_counts = (cutout_cache.hits, cutout_cache.misses)
+	try:
+		prepared = prepare_object(current_id, current_index, defaultstretch, ra_dec_size_value)
+		panel = compose_panel(current_id, current_index, prepared, make_crosshair, ra_dec_size_value)
+		# (Written to a temporary file first, so a stopped batch never leaves half a png)
+		panel.save(output_filename+'.tmp', 'png')
+		os.replace(output_filename+'.tmp', output_filename)
+		result = time.time() - start_time
+	except Exception as e:
+		output_filename = None
+		result = str(e)
+	if (cutout_cache is not None):
+		cache_counts = (cutout_cache.hits - cache_counts[0], cutout_cache.misses - cache_counts[1])
+	return current_id, output_filename, result, cache_counts
+
+def run_batch(indices, workers):
+	# Render the panels for all of these objects across a pool of processes,
+	# printing the progress as they come in
+	number_done = 0
+	number_failed = 0
+	cache_hits = 0
+	cache_misses = 0
+	start_time = time.time()
+	if (workers > 1):
+		# The workers are forked, so they start with the mosaics (memory-mapped),
+		# the photometry, and the results catalogs that are already loaded
+		pool = multiprocessing.get_context('fork').Pool(workers, initializer = batch_initializer)
+		results = pool.imap_unordered(batch_render, indices)
+	else:
+		pool = None
+		batch_initializer()
+		results = map(batch_render, indices)
+	try:
+		for current_id, output_filename, result, cache_counts in results:
+			number_done = number_done + 1
+			cache_hits = cache_hits + cache_counts[0]
+			cache_misses = cache_misses + cache_counts[1]
+			if (output_filename is None):
+				number_failed = number_failed + 1
+				print("Could not render object "+str(current_id)+": "+result)
+			elif (timer_verbose):
+				print("Rendered "+output_filename+": "+str(round(result, 2))+" s")
+			if ((number_done % 100 == 0) | (number_done == len(indices))):
+				elapsed_time = time.time() - start_time
+				print("   "+str(number_done)+" / "+str(len(indices))+" ("+str(round(number_done / max(elapsed_time, 1e-6), 2))+" objects/s)")
+	except KeyboardInterrupt:
+		print("Stopping, the panels that were finished are in "+batch_directory)
+		if (pool is not None):
+			pool.terminate()
+		sys.exit(1)
+	if (pool is not None):
+		pool.close()
+		pool.join()
+	else:
+		# (The pool of connections that batch_initializer made in this process)
+		sed_fetcher.shutdown()
 
+	elapsed_time = time.time() - start_time
+	print("Rendered "+str(number_done - number_failed)+" panels to "+batch_directory+" in "+str(round(elapsed_time, 1))+" s, "+str(number_failed)+" failed.")
+	if (cutout_cache is not None):
+		print("Cutout cache ("+cutout_cache.cache_directory+"): "+str(cache_hits)+" hits, "+str(cache_misses)+" misses")
 
 def save_destroy():
 	global ID_values
 	global current_index
 	global ID_iterator
-	global highZflag_array
 	global output_flags_file
 	global output_notes_file
 	global e2 
 	
-	if (os.path.exists(output_flags_file)):
-		os.system('rm '+output_flags_file)
-	if (os.path.exists(output_notes_file)):
-		os.system('rm '+output_notes_file)
-
-	# First, let's make the dtype and colnames arrays
-	colnames = np.zeros(4, dtype ='S20')
-	dtype = np.zeros(4, dtype ='str')
-	colnames[0] = 'ID'
-	colnames[1] = 'HighZFlag'
-	colnames[2] = 'BadFitFlag'
-	colnames[3] = 'BadDataFlag'
-	dtype[0] = 'I'
-	dtype[1] = 'I'
-	dtype[2] = 'I'
-	dtype[3] = 'I'
-	
-	# And now let's assemble the data array
-	output_data = np.zeros([number_objects, 4])
-	output_data[:,0] = ID_values
-	output_data[:,1] = highZflag_array
-	output_data[:,2] = badfitflag_array
-	output_data[:,3] = baddataflag_array
-	
-	# And finally, let's write out the output file.
-	outtab = Table(output_data, names=colnames, dtype=dtype)
-	outtab.write(output_flags_file)
-
-	#notes_values[ID_iterator] = e2.get()
-	current_id = ID_list[ID_iterator]
-	notes_values[current_index] = e2.get()
-
-	w = open(output_notes_file, 'a')
-	w.write('#ID    Notes \n')
-	for z in range(0, len(ID_values)):
-		if (notes_values[z] != ''):
-			w.write(str(ID_values[z])+'    '+str(notes_values[z])+'\n')
-	w.close()
+	# Everything is already in the review journal, so this just writes the
+	# output files from it
+	review_state.set_note(current_index, e2.get())
+	review_state.compact(output_flags_file, output_notes_file)
+	review_journal.close()
+	save_session()
+
+	if (prefetcher is not None):
+		prefetcher.shutdown()
+	sed_fetcher.shutdown()
+	results_catalogs.shutdown()
+
+	if (thumbnail_cache is not None):
+		print(thumbnail_cache.stats())
+	print(interval_cache.stats())
+	if (cutout_cache is not None):
+		print(cutout_cache.stats())
+	if (http_cache is not None):
+		print(http_cache.stats())
 
 	quit()
 	#root.destroy()
 
+def set_other_fit(SED_name, image):
+	# Keep track of which plot is in the place of the BEAGLE one, for save_canvas
+	for other_name in ['BEAGLE', 'BAGPIPES', 'SEDz']:
+		canvas_contents.pop(other_name, None)
+	canvas_contents[SED_name] = image
+
 def plotbeagle():
 	global e2
 	global ID_iterator
@@ -921,23 +1137,25 @@ def plotbeagle():
 	global beagle_positionx, beagle_positiony
 	global beagletext_positionx, beagletext_positiony
 
-	notes_values[current_index] = e2.get()
+	review_state.set_note(current_index, e2.get())
 	e2.delete(0,END)
 
 	canvas.delete(item5)
 		
 	current_index = ID_list_indices[ID_iterator]
 	current_id = ID_list[ID_iterator]
-	e2.insert(0, notes_values[current_index])
+	e2.insert(0, review_state.note(current_index))
 
 	new_image = getBEAGLEimage(current_id)
 	start_time = time.time()
-	new_photo = resizeimage(new_image)
+	new_image = scaleimage(new_image, baseplotwidth)
+	new_photo = ImageTk.PhotoImage(new_image)
 	end_time = time.time()
 	if (timer_verbose):
 		print("Resizing the BEAGLE image: " +str(end_time - start_time))
 	start_time = time.time()
 	item5 = canvas.create_image(beagle_positionx, beagle_positiony, image=new_photo)
+	set_other_fit('BEAGLE', new_image)
 	end_time = time.time()
 	if (timer_verbose):
 		print("Creating the BEAGLE canvas: " +str(end_time - start_time))
@@ -963,7 +1181,7 @@ def plotbagpipes():
 
 	global bagpipes_positionx, bagpipes_positiony
 
-	notes_values[current_index] = e2.get()
+	review_state.set_note(current_index, e2.get())
 	e2.delete(0,END)
 
 	if (item5 is not None):
@@ -971,17 +1189,19 @@ def plotbagpipes():
 		
 	current_index = ID_list_indices[ID_iterator]
 	current_id = ID_list[ID_iterator]
-	e2.insert(0, notes_values[current_index])
+	e2.insert(0, review_state.note(current_index))
 
 	new_image = getBAGPIPESimage(current_id)
 	new_image = cropBAGPIPES(new_image)
 	start_time = time.time()
-	new_photo = resizeBAGPIPESimage(new_image)
+	new_image = scaleimage(new_image, BAGPIPESbaseplotwidth)
+	new_photo = ImageTk.PhotoImage(new_image)
 	end_time = time.time()
 	if (timer_verbose):
 		print("Resizing the BAGPIPES image: " +str(end_time - start_time))
 	start_time = time.time()
 	item5 = canvas.create_image(bagpipes_positionx, bagpipes_positiony, image=new_photo)
+	set_other_fit('BAGPIPES', new_image)
 	end_time = time.time()
 	if (timer_verbose):
 		print("Creating the BAGPIPES canvas: " +str(end_time - start_time))
@@ -1010,23 +1230,25 @@ def plotsedz():
 	global beagle_positionx, beagle_positiony
 	global beagletext_positionx, beagletext_positiony
 
-	notes_values[current_index] = e2.get()
+	review_state.set_note(current_index, e2.get())
 	e2.delete(0,END)
 
 	canvas.delete(item5)
 		
 	current_index = ID_list_indices[ID_iterator]
 	current_id = ID_list[ID_iterator]
-	e2.insert(0, notes_values[current_index])
+	e2.insert(0, review_state.note(current_index))
 
 	new_image = getSEDzimage(current_id)
 	start_time = time.time()
-	new_photo = resizeimage(new_image)
+	new_image = scaleimage(new_image, baseplotwidth)
+	new_photo = ImageTk.PhotoImage(new_image)
 	end_time = time.time()
 	if (timer_verbose):
 		print("Resizing the SEDz image: " +str(end_time - start_time))
 	start_time = time.time()
 	item5 = canvas.create_image(beagle_positionx, beagle_positiony, image=new_photo)
+	set_other_fit('SEDz', new_image)
 	end_time = time.time()
 	if (timer_verbose):
 		print("Creating the SEDz canvas: " +str(end_time - start_time))
@@ -1035,17 +1257,17 @@ def plotsedz():
 	#btn11.config(font=('helvetica bold', textsizevalue))
 
 
-def getfile_value(current_id, results_IDs, results_values, round_value):
-	find_value_index = np.where(results_IDs == current_id)[0]
-	if (len(find_value_index) > 0):
-		return round(results_values[find_value_index[0]],round_value)
+# The values for an object come from its row in a joined results catalog (see
+# JADESView_catalogs.py), which says whether the object was in the catalog
+def getfile_value(record, field, round_value):
+	if (record['found']):
+		return round(record[field],round_value)
 	else:
 		return -9999
 
-def getfile_true_or_false(current_id, results_IDs, results_values):
-	find_value_index = np.where(results_IDs == current_id)[0]
-	if (len(find_value_index) > 0):
-		return results_values[find_value_index[0]] 
+def getfile_true_or_false(record, field):
+	if (record['found']):
+		return record[field] 
 	else:
 		return False
 
@@ -1108,6 +1330,54 @@ parser.add_argument(
 )
 
 
+# Fill the cutout cache
+parser.add_argument(
+  '-fillcache',
+  help="Fill the cutout cache for the rest of the list while idle?",
+  action="store_true",
+  dest="fillcache",
+  required=False
+)
+
+parser.add_argument(
+  '-offline',
+  help="Only use SED plots and catalogs from the HTTP cache?",
+  action="store_true",
+  dest="offline",
+  required=False
+)
+
+# Resume the last session
+parser.add_argument(
+  '-resume',
+  help="Pick up where the last session left off?",
+  action="store_true",
+  dest="resume",
+  required=False
+)
+
+# Render the panels for the objects to pngs, without the GUI
+parser.add_argument(
+  '-batch',
+  help="Folder to save the panels for all of the objects in, without opening the GUI?",
+  action="store",
+  type=str,
+  dest="batch",
+  required=False
+)
+
+# The number of processes for -batch
+parser.add_argument(
+  '-workers',
+  help="Number of processes to render the panels with in -batch (default: number of CPUs)",
+  action="store",
+  type=int,
+  dest="workers",
+  default=os.cpu_count(),
+  required=False
+)
+
+
 args=parser.parse_args()
 
 if (args.input):
@@ -1145,87 +1415,116 @@ for i in range(0, number_input_lines):
 	if (input_lines[i,0] == 'EAZY_results'):
 		EAZY_results_file = input_lines[i,1]
 		EAZY_results_file_exists = True
-		EAZY_results_file_exists = os.path.exists(EAZY_results_file)
+		EAZY_results_file_exists = (EAZY_results_file.startswith('http') or os.path.exists(EAZY_results_file))
 	if (input_lines[i,0] == 'BEAGLE_files'):
 		BEAGLE_files = input_lines[i,1]
 		BEAGLE_plots_exist = True
 	if (input_lines[i,0] == 'BEAGLE_results'):
 		BEAGLE_results_file = input_lines[i,1]
 		BEAGLE_results_file_exists = True
-		BEAGLE_results_file_exists = os.path.exists(BEAGLE_results_file)
+		BEAGLE_results_file_exists = (BEAGLE_results_file.startswith('http') or os.path.exists(BEAGLE_results_file))
 	if (input_lines[i,0] == 'BAGPIPES_files'):
 		BAGPIPES_files = input_lines[i,1]
 		BAGPIPES_plots_exist = True
 	if (input_lines[i,0] == 'BAGPIPES_results'):
 		BAGPIPES_results_file = input_lines[i,1]
 		BAGPIPES_results_file_exists = True
-		BAGPIPES_results_file_exists = os.path.exists(BAGPIPES_results_file)
+		BAGPIPES_results_file_exists = (BAGPIPES_results_file.startswith('http') or os.path.exists(BAGPIPES_results_file))
 	if (input_lines[i,0] == 'SEDz_files'):
 		SEDz_files = input_lines[i,1]
 	if (input_lines[i,0] == 'NN_results'):
 		NN_results_file = input_lines[i,1]
 		NN_results_file_exists = True
-		NN_results_file_exists = os.path.exists(NN_results_file)
+		NN_results_file_exists = (NN_results_file.startswith('http') or os.path.exists(NN_results_file))
 	if (input_lines[i,0] == 'color_selection_results'):
 		color_selection_results_file = input_lines[i,1]
 		color_selection_results_file_exists = True
-		color_selection_results_file_exists = os.path.exists(color_selection_results_file)
+		color_selection_results_file_exists = (color_selection_results_file.startswith('http') or os.path.exists(color_selection_results_file))
 	if (input_lines[i,0] == 'output_flags_file'):
 		output_flags_file = input_lines[i,1]
 	if (input_lines[i,0] == 'output_notes_file'):
 		output_notes_file = input_lines[i,1]
+	if (input_lines[i,0] == 'review_journal'):
+		review_journal_file = input_lines[i,1]
+	if (input_lines[i,0] == 'session_file'):
+		session_file = input_lines[i,1]
+	if (input_lines[i,0] == 'resume_warm_depth'):
+		resume_warm_depth = int(input_lines[i,1])
 	if (input_lines[i,0] == 'canvaswidth'):
 		canvaswidth = float(input_lines[i,1])
 	if (input_lines[i,0] == 'defaultstretch'):
 		defaultstretch = input_lines[i,1]
 	if (input_lines[i,0] == 'ra_dec_size_value'):
 		ra_dec_size_value = float(input_lines[i,1])
+	if (input_lines[i,0] == 'prefetch_depth'):
+		prefetch_depth = int(input_lines[i,1])
+	if (input_lines[i,0] == 'thumbnail_cache_size'):
+		thumbnail_cache_size = float(input_lines[i,1])
+	if (input_lines[i,0] == 'cutout_cache_dir'):
+		cutout_cache_directory = input_lines[i,1]
+	if (input_lines[i,0] == 'cutout_cache_size'):
+		cutout_cache_size = float(input_lines[i,1])
+	if (input_lines[i,0] == 'mosaic_workers'):
+		mosaic_workers = int(input_lines[i,1])
+	if (input_lines[i,0] == 'header_cache_dir'):
+		header_cache_directory = input_lines[i,1]
 	if (input_lines[i,0] == 'fenrir_username'):
 		fenrir_username = input_lines[i,1]
 	if (input_lines[i,0] == 'fenrir_password'):
 		fenrir_password = input_lines[i,1]
+	if (input_lines[i,0] == 'fetch_workers'):
+		fetch_workers = int(input_lines[i,1])
+	if (input_lines[i,0] == 'fetch_connect_timeout'):
+		fetch_connect_timeout = float(input_lines[i,1])
+	if (input_lines[i,0] == 'fetch_read_timeout'):
+		fetch_read_timeout = float(input_lines[i,1])
+	if (input_lines[i,0] == 'http_cache_dir'):
+		http_cache_directory = input_lines[i,1]
+	if (input_lines[i,0] == 'http_cache_size'):
+		http_cache_size = float(input_lines[i,1])
+
+# One pool of connections for all of the downloads, going through the cache
+# on disk if there is one
+if (http_cache_directory is not None):
+	http_cache = HTTPDiskCache(http_cache_directory, http_cache_size)
+else:
+	http_cache = None
+if ((args.offline) & (http_cache is None)):
+	print("Running offline without an http_cache_dir, so only local files can be used.")
+sed_fetcher = SEDFetcher(fenrir_username, fenrir_password, fetch_workers, fetch_connect_timeout, fetch_read_timeout, http_cache, args.offline)
+
+# Start loading the results catalogs now, so that they're coming in while the 
+# mosaics and the photometry are being opened (see JADESView_catalogs.py)
+results_catalogs = ResultsCatalogs(sed_fetcher)
+if (EAZY_results_file_exists):
+	results_catalogs.load('EAZY', EAZY_results_file)
+if (BEAGLE_results_file_exists):
+	results_catalogs.load('BEAGLE', BEAGLE_results_file)
+if (NN_results_file_exists):
+	results_catalogs.load('NN', NN_results_file)
+if (color_selection_results_file_exists):
+	results_catalogs.load('color_selection', color_selection_results_file)
+if (BAGPIPES_results_file_exists):
+	results_catalogs.load('BAGPIPES', BAGPIPES_results_file)
 
 #base64string = base64.b64encode('%s:%s' % (fenrir_username, fenrir_password))
 
 # # # # # # # # # # # # # # # # # # 
 # Let's open up all the input files
 
-# Open up the image list file
-images_all_txt = np.loadtxt(all_images_file_name, dtype='str')
-if (len(images_all_txt[0]) > 2):
-	# First, if the user specifies where the science data extension is, they'll put 
-	# them in the second column.
-	all_images_filter_name = images_all_txt[:,0]
-	all_image_extension_number = images_all_txt[:,1].astype('int')
-	all_image_paths = images_all_txt[:,2]
-else:
-	# Here, we assume that the science extension is 1 
-	all_images_filter_name = images_all_txt[:,0]
-	all_image_extension_number = np.zeros(len(all_images_filter_name))+1
-	all_image_paths = images_all_txt[:,1]
-
+# Open up the image list file (the filters, the science extensions, and the
+# paths to the mosaics)
+all_images_filter_name, all_image_extension_number, all_image_paths = read_image_list(all_images_file_name)
 number_image_filters = len(all_images_filter_name)
 number_images = len(all_image_paths)
 
-# astropy.io.fits.open(...,memmap='True',lazy_load_hdus='True')
-
-image_all = np.empty(0)
-image_hdu_all = np.empty(0)
-image_wcs_all = np.empty(0)
-for i in range(0, number_images):
-	print("Opening up image: "+all_image_paths[i])
-	if (all_image_paths[i] == 'NoImage'):
-		all_image_paths[i] = 'NoImage.fits'
-	image_all = np.append(image_all, fits.open(all_image_paths[i]))
-	try:
-		#image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i])[1])
-		image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i])[all_image_extension_number[i]])
-	except IndexError:
-		#print('IndexError')
-		image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i]))
-		#print('Running fits.open('+str(all_image_paths[i])+')')
-	#print('Running WCS(image_hdu_all[i].header)')
-	image_wcs_all = np.append(image_wcs_all, WCS(image_hdu_all[i].header))
+# The mosaics are memory-mapped, and are all opened (and have their WCS made)
+# at the same time in a pool of threads
+header_cache = None
+if (header_cache_directory is not None):
+	header_cache = MosaicHeaderCache(header_cache_directory)
+mosaics = MosaicRegistry(all_images_filter_name, all_image_paths, all_image_extension_number, header_cache)
+mosaics.initialize(mosaic_workers)
 
 
 sf = canvaswidth / 2000.0 # This is the "shrinkfactor" by which all of the canvas
@@ -1268,6 +1567,9 @@ RA_values = fitsinput[1].data['RA']
 DEC_values = fitsinput[1].data['DEC']
 number_objects = len(ID_values)
 
+# The results catalogs are joined onto the rows of the photometric catalog
+results_catalogs.set_photometric_IDs(ID_values)
+
 image_flux_value_cat = np.zeros([number_objects, number_image_filters])
 image_flux_value_err_cat = np.zeros([number_objects, number_image_filters])
 SNR_values = np.zeros([number_objects, number_image_filters])
@@ -1290,84 +1592,14 @@ for j in range(0, number_image_filters):
 number_input_objects = len(ID_values)
 ID_iterator = 0
 
-if (EAZY_results_file_exists):
-	if (EAZY_results_file.startswith('http')):
-		response = requests.get(EAZY_results_file, auth=HTTPBasicAuth(fenrir_username, fenrir_password))
-		eazy_fits_file = BytesIO(response.content)
-	else:
-		eazy_fits_file = EAZY_results_file
-	eazy_results_fits = fits.open(eazy_fits_file)
-	eazy_results_IDs = eazy_results_fits[1].data['ID'].astype('int')
-	eazy_results_zpeak = eazy_results_fits[1].data['z_peak']
-	eazy_results_za = eazy_results_fits[1].data['z_a']
-	eazy_results_zl68 = eazy_results_fits[1].data['l68']
-	eazy_results_zu68 = eazy_results_fits[1].data['u68']
-	#eazy_results_zl95 = eazy_results_fits[1].data['l95']
-	#eazy_results_zu95 = eazy_results_fits[1].data['u95']
-
+# Work out where every object is in every mosaic, so that making the cutouts 
+# is just slicing. This is done in the background, and until a mosaic is done,
+# the positions of the objects being looked at are worked out on their own.
+pixel_positions = PixelPositionTable(RA_values, DEC_values, mosaics)
+pixel_positions_thread = threading.Thread(target = pixel_positions.compute_all)
+pixel_positions_thread.daemon = True
+pixel_positions_thread.start()
 
-if (BEAGLE_results_file_exists):
-	if (BEAGLE_results_file.startswith('http')):
-		response = requests.get(BEAGLE_results_file, auth=HTTPBasicAuth(fenrir_username, fenrir_password))
-		beagle_fits_file = BytesIO(response.content)
-	else:
-		beagle_fits_file = BEAGLE_results_file
-		
-	beagle_results_fits = fits.open(beagle_fits_file)
-	beagle_ID_str = beagle_results_fits[1].data['ID']
-	beagle_results_IDs = np.zeros(len(beagle_ID_str), dtype = 'int')
-	for j in range(0, len(beagle_ID_str)):
-		beagle_results_IDs[j] = int(beagle_ID_str[j])
-
-	beagle_results_zavg = beagle_results_fits[1].data['redshift_beagle_mean']
-	beagle_results_redshift_1 = beagle_results_fits[1].data['redshift_beagle_1']
-	beagle_results_redshift_err_1 = beagle_results_fits[1].data['redshift_beagle_err_1']
-	beagle_results_redshift_2 = beagle_results_fits[1].data['redshift_beagle_2']
-	beagle_results_redshift_err_2 = beagle_results_fits[1].data['redshift_beagle_err_2']
-	beagle_results_zl68 = beagle_results_fits[1].data['redshift_68.0_low']
-	beagle_results_zu68 = beagle_results_fits[1].data['redshift_68.0_up']
-	beagle_results_Pzgt2p0 = beagle_results_fits[1].data['redshift_p_gt_2.0']
-	beagle_results_Pzgt4p0 = beagle_results_fits[1].data['redshift_p_gt_4.0']
-	beagle_results_Pzgt6p0 = beagle_results_fits[1].data['redshift_p_gt_6.0']
-
-if (NN_results_file_exists):
-	if (NN_results_file.startswith('http')):
-		response = requests.get(NN_results_file, auth=HTTPBasicAuth(fenrir_username, fenrir_password))
-		NN_fits_file = BytesIO(response.content)
-	else:
-		NN_fits_file = NN_results_file
-
-	NN_results_fits = fits.open(NN_fits_file)
-	NN_results_IDs = NN_results_fits[1].data['ID_PHOTOMETRIC'].astype('int')
-	NN_results_zpred = NN_results_fits[1].data['pred_z']
-	NN_results_zspec = NN_results_fits[1].data['true_z']
-	NN_results_use = NN_results_fits[1].data['USE']
-
-if (color_selection_results_file_exists):
-	if (color_selection_results_file.startswith('http')):
-		response = requests.get(color_selection_results_file, auth=HTTPBasicAuth(fenrir_username, fenrir_password))
-		color_selection_file = BytesIO(response.content)
-	else:
-		color_selection_file = color_selection_results_file
-
-	color_selection_fits = fits.open(color_selection_file)
-	color_selection_IDs = color_selection_fits[1].data['ID'].astype('int')
-	color_selection_F090W_dropouts = color_selection_fits[1].data['NRC_F090W_Dropout_SNR3.0']
-	color_selection_F115W_dropouts = color_selection_fits[1].data['NRC_F115W_Dropout_SNR3.0']
-	color_selection_F150W_dropouts = color_selection_fits[1].data['NRC_F150W_Dropout_SNR3.0']
-
-if (BAGPIPES_results_file_exists):
-	if (BAGPIPES_results_file.startswith('http')):
-		response = requests.get(BAGPIPES_results_file, auth=HTTPBasicAuth(fenrir_username, fenrir_password))
-		BAGPIPES_fits_file = BytesIO(response.content)
-	else:
-		BAGPIPES_fits_file = BAGPIPES_results_file
-
-	BAGPIPES_results_fits = fits.open(BAGPIPES_fits_file)
-	BAGPIPES_results_IDs = BAGPIPES_results_fits[1].data['ID'].astype('int')
-	BAGPIPES_results_zphot = BAGPIPES_results_fits[1].data['redshift_mean']
-
-	
 # Decide whether or not the user requested an ID number or an id number list
 if (args.id_number):
 	ID_list = ID_values
@@ -1392,47 +1624,150 @@ if not (args.id_number):
 		if (len(ID_input_file.shape) > 1):
 			ID_numbers_to_view = ID_input_file[:,0].astype(int)
 		else:
-			ID_numbers_to_view = ID_input_file.astype(int)
-		number_id_list = len(ID_numbers_to_view)
-	
-		# Set up index array for 
-		ID_list_indices = np.zeros(number_id_list, dtype = int)
-		for x in range(0, number_id_list):
-			ID_list_indices[x] = np.where(ID_values == ID_numbers_to_view[x])[0]
-	
-		ID_list = ID_numbers_to_view
-		current_index = ID_list_indices[ID_iterator]
-		current_id = ID_values[current_index]
+			ID_numbers_to_view = np.atleast_1d(ID_input_file).astype(int)
 
 	if (args.idarglist):
-		ID_numbers_to_view = np.array(ast.literal_eval(args.idarglist))
-	
-		number_id_list = len(ID_numbers_to_view)
-	
-		# Set up index array for 
-		ID_list_indices = np.zeros(number_id_list, dtype = int)
-		for x in range(0, number_id_list):
-			#print(np.where(ID_values == ID_numbers_to_view[x])[0])
-			#print(len(np.where(ID_values == ID_numbers_to_view[x])[0]))
-			if (len(np.where(ID_values == ID_numbers_to_view[x])[0]) > 0):
-				ID_list_indices[x] = np.where(ID_values == ID_numbers_to_view[x])[0]
-			else:
-				sys.exit("Object "+str(ID_numbers_to_view[x])+" does not appear in this catalog. Exiting.")
-					
-		ID_list = ID_numbers_to_view
+		ID_numbers_to_view = np.atleast_1d(np.array(ast.literal_eval(args.idarglist))).astype(int)
+
+	if ((args.id_number_list) or (args.idarglist)):
+		# Find all of the objects in the catalog at once, and report the ones
+		# that aren't there together
+		ID_list_indices, missing_IDs = resolve_IDs(ID_numbers_to_view, ID_values)
+		if (len(missing_IDs) > 0):
+			print(str(len(missing_IDs))+" of the "+str(len(ID_numbers_to_view))+" objects do not appear in this catalog, skipping them: "+
+				" ".join(str(x) for x in missing_IDs[0:100])+(" ..." if len(missing_IDs) > 100 else ""))
+		if (len(ID_list_indices) == 0):
+			sys.exit("None of the objects appear in this catalog. Exiting.")
+
+		ID_list = ID_values[ID_list_indices]
 		current_index = ID_list_indices[ID_iterator]
 		current_id = ID_values[current_index]
 
 
-# Create the notes array
-notes_values = np.array([''], dtype = 'object')
-for x in range(0, number_input_objects-1):
-	notes_values = np.append(notes_values, ['']) 
+# Set up the cache of rendered thumbnails
+# (and their cutouts, so that a cached thumbnail can be restretched)
+if (thumbnail_cache_size > 0):
+	thumbnail_cache = ThumbnailCache(thumbnail_cache_size)
+	cutout_memory_cache = CutoutMemoryCache(thumbnail_cache_size)
+else:
+	thumbnail_cache = None
+	cutout_memory_cache = None
+
+# The zscale intervals of the cutouts, so they're only worked out once each
+interval_cache = IntervalCache()
+
+# Set up the cache of cutouts on disk, and, if asked for, start filling it
+# for the rest of the list whenever the user is idle
+if (cutout_cache_directory is not None):
+	cutout_cache = CutoutDiskCache(cutout_cache_directory, cutout_cache_size)
+else:
+	cutout_cache = None
+
+# Render the panels for all of the objects in the list to pngs (in a pool of 
+# processes), without opening the GUI, and stop there
+if (args.batch):
+	batch_directory = args.batch
+	os.makedirs(batch_directory, exist_ok = True)
+	# Nothing is shown twice, so there's no point in keeping the thumbnails
+	# (or their cutouts)
+	thumbnail_cache = None
+	cutout_memory_cache = None
+	# (With -id, just that object)
+	if (args.id_number):
+		batch_indices = [current_index]
+	else:
+		batch_indices = ID_list_indices
+	print("Rendering "+str(len(batch_indices))+" panels to "+batch_directory+" with "+str(args.workers)+" processes.")
+
+	# Everything that the workers need has to be loaded before they're forked
+	mosaics.wait()
+	pixel_positions_thread.join()
+	for name in results_text_functions:
+		results_catalogs.wait(name)
+	sed_fetcher.shutdown()
+
+	run_batch(batch_indices, args.workers)
+	results_catalogs.shutdown()
+	sys.exit()
+
+# Pick up the last session where it left off: the same list, at the same 
+# object, with the same stretch, size, and crosshair
+if (session_file is None):
+	session_file = os.path.splitext(output_flags_file)[0]+'_session.json'
+session_list_file = os.path.splitext(session_file)[0]+'_list.json'
+session_list_hash = None
+resumed_session = None
+if (args.resume):
+	resumed_session = read_session(session_file)
+	if (resumed_session is None):
+		print("There's no session to resume in "+session_file+", starting from the beginning.")
+if (resumed_session is not None):
+	if ((args.id_number) or (args.id_number_list) or (args.idarglist)):
+		print("Resuming the last session from "+session_file+" instead of the -id, -idlist, or -idarglist given.")
+	resumed_IDs = None
+	if (resumed_session.get('ID_list_file') is not None):
+		resumed_IDs = read_session_list(resumed_session['ID_list_file'], resumed_session['ID_list_hash'])
+		if (resumed_IDs is None):
+			print("The list from the last session ("+resumed_session['ID_list_file']+") is missing or has changed, resuming with the whole catalog.")
+	elif (resumed_session.get('ID_list') is not None):
+		# (A session file from before the list had a file of its own)
+		resumed_IDs = resumed_session['ID_list']
+	if (resumed_IDs is None):
+		ID_list = ID_values
+		ID_list_indices = np.arange(len(ID_values), dtype = int)
+	else:
+		ID_list_indices, missing_IDs = resolve_IDs(resumed_IDs, ID_values)
+		if (len(missing_IDs) > 0):
+			print(str(len(missing_IDs))+" of the objects in the resumed list do not appear in this catalog, skipping them.")
+		if (len(ID_list_indices) == 0):
+			sys.exit("None of the objects in the resumed list appear in this catalog. Exiting.")
+		ID_list = ID_values[ID_list_indices]
+
+	# Go back to the same object, even if the list has lost some objects
+	resumed_positions = np.where(ID_list == resumed_session['current_id'])[0]
+	if (len(resumed_positions) > 0):
+		ID_iterator = resumed_positions[0]
+	else:
+		ID_iterator = min(resumed_session['ID_iterator'], len(ID_list) - 1)
+	current_index = ID_list_indices[ID_iterator]
+	current_id = ID_values[current_index]
+
+	defaultstretch = resumed_session['stretch']
+	ra_dec_size_value = resumed_session['ra_dec_size_value']
+	make_crosshair = resumed_session['crosshair']
+	print("Resuming at object "+str(current_id)+" ("+str(ID_iterator+1)+" of "+str(len(ID_list))+")")
+
+# The flags and notes (only what's been set is stored), which are written to 
+# the review journal as they're made. Pick up the ones from the journal (from 
+# earlier sessions, or one that crashed), and write them to the output files.
+if (review_journal_file is None):
+	review_journal_file = os.path.splitext(output_flags_file)[0]+'_journal.jsonl'
+review_journal = ReviewJournal(review_journal_file)
+review_state = ReviewState(ID_values, journal = review_journal)
+journal_records = review_journal.replay()
+review_state.replay(journal_records)
+if (len(journal_records) > 0):
+	print("Picked up "+str(len(journal_records))+" flags and notes from the review journal "+review_journal_file)
+	review_state.compact(output_flags_file, output_notes_file)
+elif (review_journal.damaged_lines > 0):
+	# There's nothing to pick up, but the damaged lines have to go
+	review_journal.rewrite(review_state.records())
+else:
+	review_journal.open()
+
+filled_cutout_indices = set()
+if ((args.fillcache) & (cutout_cache is not None)):
+	cutout_cache_filler = CutoutCacheFiller(fill_cutout_cache)
+else:
+	if (args.fillcache):
+		print("You need to specify a cutout_cache_dir in the input file to fill the cutout cache.")
+	cutout_cache_filler = None
 
-# Create the flag arrays
-highZflag_array = np.zeros(number_input_objects, dtype = 'int')
-badfitflag_array = np.zeros(number_input_objects, dtype = 'int')
-baddataflag_array = np.zeros(number_input_objects, dtype = 'int')
+# Set up the prefetching of the objects around the one being displayed
+if (prefetch_depth > 0):
+	prefetcher = Prefetcher(prepare_object, depth = prefetch_depth)
+else:
+	prefetcher = None
 
 # So, now, there are three arrays:
 #   ID_list (which is the list of the ID values that will be viewed)
@@ -1448,15 +1783,22 @@ baddataflag_array = np.zeros(number_input_objects, dtype = 'int')
 # Now, everything is set up, so let's start creating the GUI
 
 # Start by creating the GUI as root
+# The window comes up as soon as the mosaics for the first object are ready,
+# and the rest keep going in the background
+mosaics.wait(np.where(image_flux_value_err_cat[current_index] > -9999)[0])
+
 root=Tk()
 root.wm_title("JADESView")
 
 # Create the canvas 
 canvas=Canvas(root, height=canvasheight, width=canvaswidth, bg="#ffffff")
 
-# Plot the EAZY SED
+# Fetch the SED plots for the first object (all at the same time)
 #image = Image.open(EAZY_files+str(current_id)+"_EAZY_SED.png")
-image = getEAZYimage(current_id)
+first_SED_images = sed_fetcher.fetch_all(SED_image_functions(current_id))
+
+# The rendered images that are on the canvas, for save_canvas
+canvas_contents = dict(first_SED_images)
 
 # Put the object label 
 object_label = Label(root, text="Object "+str(current_id), font = "Helvetica "+str(int(textsizevalue*1.5)), fg="black", bg="white")
@@ -1464,8 +1806,7 @@ object_label.place(x=objectID_positionx, y = objectID_positiony)
 
 # Crop out the thumbnails
 if (EAZY_plots_exist == True):
-	image = cropEAZY(image)
-	photo = resizeimage(image)
+	photo = ImageTk.PhotoImage(first_SED_images['EAZY'])
 	item4 = canvas.create_image(eazy_positionx, eazy_positiony, image=photo)
 	Label(root, text="EAZY FIT", fg='black', bg='white', font=('helvetica', int(textsizevalue*1.5))).place(x=eazytext_positionx, y = eazytext_positiony)
 else:
@@ -1474,8 +1815,7 @@ else:
 # Plot the BEAGLE SED
 #new_image = Image.open(BEAGLE_files+str(current_id)+"_BEAGLE_SED.png")
 if (BEAGLE_plots_exist == True):
-	new_image = getBEAGLEimage(current_id)
-	new_photo = resizeimage(new_image)
+	new_photo = ImageTk.PhotoImage(first_SED_images['BEAGLE'])
 	item5 = canvas.create_image(beagle_positionx, beagle_positiony, image=new_photo)
 	otherfit_label = Label(root, text="BEAGLE FIT ", font = "Helvetica "+str(int(textsizevalue*1.5)), fg="black", bg="white")
 	otherfit_label.place(x=beagletext_positionx, y = beagletext_positiony)
@@ -1487,8 +1827,25 @@ canvas.pack(side = TOP, expand=True, fill=BOTH)
 
 # Plot the thumbnails
 fig_photo_objects = np.empty(0, dtype = 'object')
+current_cutouts = None
 fig_photo_objects = create_thumbnails(canvas, fig_photo_objects, current_id, current_index, defaultstretch)
 
+# And start preparing the next objects in the list in the background
+schedule_prefetch()
+schedule_cutout_cache_fill()
+save_session()
+
+# When resuming, also fill the caches for a wider window around where we left
+# off (beyond what the prefetcher is already preparing)
+if (resumed_session is not None):
+	prefetched_positions = prefetch_window(ID_iterator, len(ID_list), prefetch_depth)
+	warm_positions = []
+	for step in range(1, resume_warm_depth+1):
+		for position in [ID_iterator + step, ID_iterator - step]:
+			if ((position >= 0) & (position < len(ID_list)) & (position not in prefetched_positions)):
+				warm_positions.append(position)
+	warm_caches(warm_positions)
+
 # # # # # # # # # # # # # # 
 # Place Labels with Redshift 
 
@@ -1498,86 +1855,64 @@ fig_photo_objects = create_thumbnails(canvas, fig_photo_objects, current_id, cur
 redshift_separator = canvas.create_rectangle(1100*sf, (toprow_y-320.0)*sf, 1940*sf, (toprow_y-310.0)*sf, outline="#0abdc6", fill="#0abdc6", tags="separator")
 
 
+# The labels start out empty, and are filled in by update_results_text once
+# their catalogs have been loaded (see JADESView_catalogs.py)
+results_labels = {}
+results_first_labels = {}
+
 # Make the EAZY redshift label
 if (EAZY_results_file_exists == True):
-	eazy_z_peak = getfile_value(current_id, eazy_results_IDs, eazy_results_zpeak, 4)
-	eazy_z_a = getfile_value(current_id, eazy_results_IDs, eazy_results_za, 4)
-	eazy_l68 = getfile_value(current_id, eazy_results_IDs, eazy_results_zl68, 4)
-	eazy_u68 = getfile_value(current_id, eazy_results_IDs, eazy_results_zu68, 4)
-
-	eazy_label_zpeak = Label(root, text="z_EAZY, peak = "+str(eazy_z_peak)+" ("+str(eazy_l68)+" - "+str(eazy_u68)+")", font = "Helvetica "+str(textsizevalue), fg="#133e7c", bg="#ffffff")
+	eazy_label_zpeak = Label(root, text="z_EAZY (loading...)", font = "Helvetica "+str(textsizevalue), fg="#133e7c", bg="#ffffff")
 	eazy_label_zpeak.place(x=1100*sf, y = (toprow_y-290.0)*sf)
-	eazy_label_za = Label(root, text="z_EAZY, a = "+str(eazy_z_a), font = "Helvetica "+str(textsizevalue), fg="#133e7c", bg="#ffffff")
+	eazy_label_za = Label(root, text=" ", font = "Helvetica "+str(textsizevalue), fg="#133e7c", bg="#ffffff")
 	eazy_label_za.place(x=1100*sf, y = (toprow_y-250.0)*sf)
+	results_labels['eazy_label_zpeak'] = eazy_label_zpeak
+	results_labels['eazy_label_za'] = eazy_label_za
+	results_first_labels['EAZY'] = eazy_label_zpeak
 
 
 # Make the BEAGLE redshift labels
 if (BEAGLE_results_file_exists == True):
-	beagle_z_avg = getfile_value(current_id, beagle_results_IDs, beagle_results_zavg, 4)
-	beagle_z_l68 = getfile_value(current_id, beagle_results_IDs, beagle_results_zl68, 4)
-	beagle_z_u68 = getfile_value(current_id, beagle_results_IDs, beagle_results_zu68, 4)
-	
-	beagle_label = Label(root, text="z_BEAGLE,avg = "+str(beagle_z_avg)+" ("+str(beagle_z_l68)+" - "+str(beagle_z_u68)+")", font = "Helvetica "+str(textsizevalue), fg="#711c91", bg="#ffffff")
+	beagle_label = Label(root, text="z_BEAGLE (loading...)", font = "Helvetica "+str(textsizevalue), fg="#711c91", bg="#ffffff")
 	beagle_label.place(x=1100*sf, y = (toprow_y-210.0)*sf)
-	
-	beagle_z_1 = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_1, 4)
-	beagle_z_1_err = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_err_1, 4)
-	beagle_z1_label = Label(root, text="z_BEAGLE,1 = "+str(beagle_z_1)+" +/- "+str(beagle_z_1_err), font = "Helvetica "+str(textsizevalue), fg="#711c91", bg="#ffffff")
+	beagle_z1_label = Label(root, text=" ", font = "Helvetica "+str(textsizevalue), fg="#711c91", bg="#ffffff")
 	beagle_z1_label.place(x=1100*sf, y = (toprow_y-170.0)*sf)
-	
-	beagle_z_2 = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_2, 4)
-	beagle_z_2_err = getfile_value(current_id, beagle_results_IDs, beagle_results_redshift_err_2, 4)
-	beagle_z2_label = Label(root, text="z_BEAGLE,2 = "+str(beagle_z_2)+" +/- "+str(beagle_z_2_err), font = "Helvetica "+str(textsizevalue), fg="#711c91", bg="#ffffff")
+	beagle_z2_label = Label(root, text=" ", font = "Helvetica "+str(textsizevalue), fg="#711c91", bg="#ffffff")
 	beagle_z2_label.place(x=1100*sf, y = (toprow_y-130.0)*sf)
-
-	beagle_Pzgt2p0 = getfile_value(current_id, beagle_results_IDs, beagle_results_Pzgt2p0, 2)
-	beagle_Pzgt4p0 = getfile_value(current_id, beagle_results_IDs, beagle_results_Pzgt4p0, 2)
-	beagle_Pzgt6p0 = getfile_value(current_id, beagle_results_IDs, beagle_results_Pzgt6p0, 2)
-	beagle_prob_label = Label(root, text="P(z > 2) = "+str(beagle_Pzgt2p0)+", P(z > 4) = "+str(beagle_Pzgt4p0)+", P(z > 4) = "+str(beagle_Pzgt6p0), font = "Helvetica "+str(textsizevalue), fg="#711c91", bg="#ffffff")
+	beagle_prob_label = Label(root, text=" ", font = "Helvetica "+str(textsizevalue), fg="#711c91", bg="#ffffff")
 	beagle_prob_label.place(x=1100*sf, y = (toprow_y-90.0)*sf)
+	results_labels['beagle_label'] = beagle_label
+	results_labels['beagle_z1_label'] = beagle_z1_label
+	results_labels['beagle_z2_label'] = beagle_z2_label
+	results_labels['beagle_prob_label'] = beagle_prob_label
+	results_first_labels['BEAGLE'] = beagle_label
 
 #NN_z = 5.000
 if (NN_results_file_exists):
-	NN_zpred = getfile_value(current_id, NN_results_IDs, NN_results_zpred, 4)
-	NN_zspec = getfile_value(current_id, NN_results_IDs, NN_results_zspec, 4)
-	NN_use = getfile_true_or_false(current_id, NN_results_IDs, NN_results_use)
-	
-	if (NN_use == True):
-		nn_label = Label(root, text="z_NN = "+str(NN_zpred), font = "Helvetica "+str(textsizevalue), fg="#091833", bg="#ffffff")
-	if (NN_use == False):
-		nn_label = Label(root, text="z_NN = "+str(NN_zpred)+" (USE = F)", font = "Helvetica "+str(textsizevalue), fg="grey", bg="#ffffff")
+	nn_label = Label(root, text="z_NN (loading...)", font = "Helvetica "+str(textsizevalue), fg="#091833", bg="#ffffff")
 	#nn_label.place(x=1800*sf, y = (toprow_y-210.0)*sf)
 	nn_label.place(x=1740*sf, y = (toprow_y-290.0)*sf)
 	if (use_zspec == True):
-		nn_label_zspec = Label(root, text="z_spec = "+str(NN_zspec), font = "Helvetica "+str(textsizevalue)+" bold", fg="red", bg="#ffffff")
+		nn_label_zspec = Label(root, text=" ", font = "Helvetica "+str(textsizevalue)+" bold", fg="red", bg="#ffffff")
 		nn_label_zspec.place(x=1740*sf, y = (toprow_y-250.0)*sf)
+		results_labels['nn_label_zspec'] = nn_label_zspec
+	results_labels['nn_label'] = nn_label
+	results_first_labels['NN'] = nn_label
 
 if (color_selection_results_file_exists):
-	is_F090W_dropout = getfile_true_or_false(current_id, color_selection_IDs, color_selection_F090W_dropouts)
-	is_F115W_dropout = getfile_true_or_false(current_id, color_selection_IDs, color_selection_F115W_dropouts)
-	is_F150W_dropout = getfile_true_or_false(current_id, color_selection_IDs, color_selection_F150W_dropouts)
-	
-	if(is_F090W_dropout):
-		color_selection_label = Label(root, text="F090W Dropout", font = "Helvetica "+str(textsizevalue), fg="#091833", bg="#ffffff")
-		color_selection_label.place(x=1760*sf, y = (toprow_y-90.0)*sf)
-	
-	elif(is_F115W_dropout):
-		color_selection_label = Label(root, text="F115W Dropout", font = "Helvetica "+str(textsizevalue), fg="#091833", bg="#ffffff")
-		color_selection_label.place(x=1760*sf, y = (toprow_y-90.0)*sf)
-
-	elif(is_F150W_dropout):
-		color_selection_label = Label(root, text="F150W Dropout", font = "Helvetica "+str(textsizevalue), fg="#091833", bg="#ffffff")
-		color_selection_label.place(x=1760*sf, y = (toprow_y-90.0)*sf)
-
-	else:
-		color_selection_label = Label(root, text=" ", font = "Helvetica "+str(textsizevalue), fg="#091833", bg="#ffffff")
-		color_selection_label.place(x=1760*sf, y = (toprow_y-90.0)*sf)
+	color_selection_label = Label(root, text=" ", font = "Helvetica "+str(textsizevalue), fg="#091833", bg="#ffffff")
+	color_selection_label.place(x=1760*sf, y = (toprow_y-90.0)*sf)
+	results_labels['color_selection_label'] = color_selection_label
+	results_first_labels['color_selection'] = color_selection_label
 
 if (BAGPIPES_results_file_exists):
-	BAGPIPES_zpred = getfile_value(current_id-1, BAGPIPES_results_IDs, BAGPIPES_results_zphot, 4)
-
-	bagpipes_label = Label(root, text="z_BAGPIPES = "+str(BAGPIPES_zpred), font = "Helvetica "+str(textsizevalue), fg="grey", bg="#ffffff")
+	bagpipes_label = Label(root, text="z_BAGPIPES (loading...)", font = "Helvetica "+str(textsizevalue), fg="grey", bg="#ffffff")
 	bagpipes_label.place(x=1740*sf, y = (toprow_y-150.0)*sf)
+	results_labels['bagpipes_label'] = bagpipes_label
+	results_first_labels['BAGPIPES'] = bagpipes_label
+
+# Whatever has already been loaded is shown now, and the rest as it arrives
+check_results_catalogs()
 
 
 #SEDz_z = 5.000
@@ -1621,7 +1956,8 @@ btn2 = Button(root, text = 'Next Object', bd = '5', command = nextobject)
 btn2.config(height = int(2*sf), width = int(20*sf), fg='black', highlightbackground='white', font=('helvetica', textsizevalue), padx = 3, pady = 3)
 btn2.place(x = 917*sf, y = bottomrow_y*sf)
 
-if ((args.id_number_list is None) & (args.idarglist is None)):
+# (Only when looking through the whole catalog, however the list was chosen)
+if (ID_list is ID_values):
 	# Create the Object Entry Field and Button
 	Label(root, text="Display Object: ", font=('helvetica', textsizevalue), fg="#000000", bg="#ffffff").place(x=1220*sf, y = (bottomrow_y+10.0)*sf)
 	e1 = Entry(root, width = int(5*sf), font=('helvetica', textsizevalue), fg="#000000", bg="#ffffff")
@@ -1686,7 +2022,7 @@ btn7.place(x = 400*sf, y = (bottomrow_y+10.0)*sf)
 Label(root, text="Notes", font = "Helvetica 20", fg="#000000", bg="#ffffff").place(x=1220*sf, y = (toprow_y+5.0)*sf)
 e2 = Entry(root, width = int(50*sf), font=('helvetica', textsizevalue), fg="#000000", bg="#ffffff")
 e2.place(x = 1300*sf, y = toprow_y*sf)
-e2.insert(0, notes_values[current_index])
+e2.insert(0, review_state.note(current_index))
 
 # Create the RA and DEC size field 
 Label(root, text="RA/DEC size", font=('helvetica', textsizevalue), fg="#000000", bg="#ffffff").place(x=20*sf, y = (toprow_y+15.0)*sf)
@@ -1699,7 +2035,10 @@ btn8.config(height = 1, width = int(10*sf), fg='blue', highlightbackground = 'wh
 btn8.place(x = 400*sf, y = (toprow_y+13.0)*sf)
 
 btn12 = Button(root, text = 'Crosshair', bd = '5', command = togglecrosshair)  
-btn12.config(height = 1, width = int(10*sf), fg='blue', highlightbackground = 'white', font=('helvetica', textsizevalue))
+if (make_crosshair == True):
+	btn12.config(height = 1, width = int(10*sf), fg='blue', highlightbackground = 'white', font=('helvetica bold', textsizevalue))
+else:
+	btn12.config(height = 1, width = int(10*sf), fg='blue', highlightbackground = 'white', font=('helvetica', textsizevalue))
 btn12.place(x = 400*sf, y = (toprow_y-25.0)*sf)
 
 
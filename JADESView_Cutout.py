@@ -7,14 +7,12 @@ import math
 import time 
 import scipy
 import argparse
+import multiprocessing
 import requests
 import tarfile
 from requests.auth import HTTPBasicAuth
 from io import BytesIO
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 from astropy.io import fits
 from astropy.io import ascii
 from astropy.table import Table
@@ -24,7 +22,7 @@ from astropy import units as u
 from astropy.coordinates import SkyCoord
 from astropy.wcs import WCS
 
-from astropy.visualization import (MinMaxInterval, ZScaleInterval, LogStretch, ImageNormalize, AsinhStretch, SinhStretch, LinearStretch)
+from astropy.visualization import (MinMaxInterval, LogStretch, ImageNormalize, AsinhStretch, SinhStretch, LinearStretch)
 
 #import matplotlib.backends.tkagg as tkagg
 #from matplotlib.backends.backend_agg import FigureCanvasAgg
@@ -36,6 +34,11 @@ from astropy.visualization import (MinMaxInterval, ZScaleInterval, LogStretch, I
 #    from tkinter import *
 #import PIL
 #from PIL import ImageTk, Image, ImageGrab
+from PIL import Image
+
+from JADESView_cache import CutoutDiskCache, IntervalCache, make_cutout
+from JADESView_mosaics import MosaicRegistry, MosaicHeaderCache, PixelPositionTable, read_image_list
+from JADESView_render import stretch_thumbnail, render_stretched, figure_dpi
 
 JADESView_input_file = 'JADESView_input_file.dat'
 
@@ -48,22 +51,38 @@ ra_dec_size_value = 2.0
 # The default is to not make the crosshair
 make_crosshair = False
 
-def print_nearest_objects(ID_values, catalog_ra, catalog_dec, ra_value, dec_value, distance):
+# The folder for keeping the raw cutouts between sessions (None turns this off),
+# and how big (in MB) it's allowed to get
+cutout_cache_directory = None
+cutout_cache_size = 2048
+
+# The number of mosaics that are opened (and have their WCS made) at the same
+# time at startup
+mosaic_workers = 8
+
+# The folder for the sidecar files that keep the mosaic headers and WCS between
+# sessions (None turns this off)
+header_cache_directory = None
+
+def nearest_objects_text(ID_values, catalog_ra, catalog_dec, ra_value, dec_value, distance):
+	# The objects in the catalog near the position, as text to print
+	lines = []
 	c = SkyCoord(ra=catalog_ra*u.degree, dec=catalog_dec*u.degree)
 	object_ra_dec = SkyCoord(ra=ra_value*u.degree, dec=dec_value*u.degree)
 	close_objects = np.where(object_ra_dec.separation(c) < distance*u.arcsec)
 	
-	print("     ------------------------------------------------------------------------------------------")
+	lines.append("     ------------------------------------------------------------------------------------------")
 	if (len(close_objects[0]) < 1):
-		print("     There are no objects within "+str(distance)+" arcseconds of the position.")
+		lines.append("     There are no objects within "+str(distance)+" arcseconds of the position.")
 	if (len(close_objects[0]) == 1):
-		print("      This object is within "+str(distance)+" arcseconds of the position RA = "+str(round(ra_value,6))+", DEC = "+str(round(dec_value,6))+":")
-		print("            "+str(ID_values[close_objects[0]][0])+", RA = "+str(catalog_ra[close_objects[0]][0])+", DEC = "+str(catalog_dec[close_objects[0]][0])+", distance = "+str(round(object_ra_dec.separation(c)[close_objects[0][0]].arcsec,3))+" arcsec")
+		lines.append("      This object is within "+str(distance)+" arcseconds of the position RA = "+str(round(ra_value,6))+", DEC = "+str(round(dec_value,6))+":")
+		lines.append("            "+str(ID_values[close_objects[0]][0])+", RA = "+str(catalog_ra[close_objects[0]][0])+", DEC = "+str(catalog_dec[close_objects[0]][0])+", distance = "+str(round(object_ra_dec.separation(c)[close_objects[0][0]].arcsec,3))+" arcsec")
 	if (len(close_objects[0]) > 1):
-		print("     These objects are within "+str(distance)+" arcseconds of the position RA = "+str(round(ra_value,6))+", DEC = "+str(round(dec_value,6))+":")
+		lines.append("     These objects are within "+str(distance)+" arcseconds of the position RA = "+str(round(ra_value,6))+", DEC = "+str(round(dec_value,6))+":")
 		for q in range(0, len(close_objects[0])):
-			print("       "+str(ID_values[close_objects[0]][q])+", RA = "+str(catalog_ra[close_objects[0]][q])+", DEC = "+str(catalog_dec[close_objects[0]][q])+", distance = "+str(round(object_ra_dec.separation(c)[close_objects[0][q]].arcsec,3))+" arcsec")
-	print("     ------------------------------------------------------------------------------------------")
+			lines.append("       "+str(ID_values[close_objects[0]][q])+", RA = "+str(catalog_ra[close_objects[0]][q])+", DEC = "+str(catalog_dec[close_objects[0]][q])+", distance = "+str(round(object_ra_dec.separation(c)[close_objects[0][q]].arcsec,3))+" arcsec")
+	lines.append("     ------------------------------------------------------------------------------------------")
+	return '\n'.join(lines)
 
 # 110.7431250 -73.4758056
 def parse_ra_dec(ra_dec_string):
@@ -115,6 +134,137 @@ def findthumbnailradec(ra_value, dec_value, ra_dec_size_value, id_cat, ra_cat, d
 	else:
 		return np.array([-9999]), np.array([-9999]), np.array([-9999])
 
+def object_output_file_name(obj):
+	# The name of the folder (and the start of the file names) for an object
+	if (args.id_number):
+		return 'Object_'+str(objID_list[obj])
+	elif (args.use_ra_dec_list_id):
+		return 'Object_'+str(objID_list[obj])
+	else:
+		return 'obj_ra_+'+str(round(objRA_list[obj],6))+'_dec_'+str(round(objDEC_list[obj],6))
+
+def prepare_filter_cutout(obj, i, position, size):
+	# The cutout of an object in one filter, and the cutout with the interval
+	# and the stretch applied (as an 8-bit image, with the origin at the top, 
+	# see JADESView_render.py). These are only worked out once, and the images
+	# and the fits file are all made from them.
+	image_cutout = make_cutout(mosaics[i].data, position, size, mosaics[i].wcs, cutout_cache, all_image_paths[i], all_image_extension_number[i],
+		lambda: pixel_positions.cutout_slice(obj, i, ra_dec_size_value))
+
+	# Normalize the image using the zscale interval and the stretch (the 
+	# segmentation map is shown with a linear stretch over its full range)
+	thumbnail = image_cutout.data
+	if (all_images_filter_name[i] == 'SEGMAP'):
+		stretched_cutout = stretch_thumbnail(thumbnail, 'LinearStretch', np.nanmin(thumbnail), np.nanmax(thumbnail))
+	else:
+		vmin, vmax = interval_cache.interval((obj, all_images_filter_name[i], ra_dec_size_value), thumbnail)
+		stretched_cutout = stretch_thumbnail(thumbnail, stretch, vmin, vmax)
+	return image_cutout, stretched_cutout
+
+def filter_label(filter_name):
+	# The filter name without the instrument (NRC_F200W is F200W)
+	try:
+		return filter_name.split('_')[1]
+	except IndexError:
+		return filter_name
+
+def render_cutout(filter_name, stretched_cutout, thumbnail_pixels):
+	# A stretched cutout as a thumbnail_pixels x thumbnail_pixels image (made
+	# bigger by whole pixels, if thumbnail_pixels is a multiple of its size), 
+	# with the filter name at the top and, if asked for, the crosshair. The 
+	# filter name is a twentieth of the height of the image.
+	label_fontsize = max(6.0, 0.05 * thumbnail_pixels * 72.0 / figure_dpi)
+	return render_stretched(stretched_cutout, thumbnail_pixels, filter_label(filter_name), label_fontsize, crosshair = make_crosshair)
+
+def make_grid(stretched_cutouts):
+	# All of the filters in one image, six to a row, with each of them at the
+	# size of the biggest one (in pixels), times -upscale
+	tile_pixels = max([max(stretched_cutout.shape) for stretched_cutout in stretched_cutouts]) * args.upscale
+	spacer = max(1, tile_pixels // 10)
+	number_rows = int(math.ceil(len(stretched_cutouts) / 6.0))
+	grid = Image.new('L', (6*tile_pixels + 7*spacer, number_rows*tile_pixels + (number_rows+1)*spacer), 255)
+	for i in range(0, len(stretched_cutouts)):
+		tile = render_cutout(all_images_filter_name[i], stretched_cutouts[i], tile_pixels)
+		grid.paste(tile, (spacer + (i % 6)*(tile_pixels + spacer), spacer + (i // 6)*(tile_pixels + spacer)))
+	return grid
+
+def save_image(image, file_name):
+	# Save an image in the -image_format (the extension is added here)
+	if (args.image_format == 'png'):
+		image.save(file_name+'.png', 'PNG', compress_level = args.png_compress_level)
+	elif (args.image_format == 'webp'):
+		image.save(file_name+'.webp', 'WEBP', quality = args.image_quality)
+	elif (args.image_format == 'jpeg'):
+		image.save(file_name+'.jpg', 'JPEG', quality = args.image_quality)
+
+def make_object_cutouts(obj):
+	# Make the cutouts of one object in every filter, and save the images (and
+	# the fits files, and the tarball). This can be run in a worker process, so
+	# it hands back what it has to say (the objects near the position) instead 
+	# of printing it.
+	objRA = objRA_list[obj]
+	objDEC = objDEC_list[obj]
+
+	obj_output_file_name = object_output_file_name(obj)
+
+	if (not os.path.exists(output_folder+obj_output_file_name+'/')):
+		os.makedirs(output_folder+obj_output_file_name+'/')
+	if (args.make_fits):
+		if (not os.path.exists(output_folder+obj_output_file_name+'/fits/')):
+			os.makedirs(output_folder+obj_output_file_name+'/fits/')
+
+	cosdec_center = math.cos(objDEC * 3.141593 / 180.0)
+	
+	nearest_objects = nearest_objects_text(ID_values, RA_values, DEC_values, objRA, objDEC, ra_dec_size_value/2.0)
+	
+	# Set the position of the object
+	position = SkyCoord(str(objRA)+'d '+str(objDEC)+'d', frame='fk5')
+	size = u.Quantity((ra_dec_size_value, ra_dec_size_value), u.arcsec)
+	
+	stretched_cutouts = []
+	for i in range(0, number_images):
+		
+		# Make the cutout, and stretch it, once, and make everything from that
+		image_cutout, stretched_cutout = prepare_filter_cutout(obj, i, position, size)
+		stretched_cutouts.append(stretched_cutout)
+
+		# The individual thumbnail images, at the pixel scale of the mosaic 
+		# (times -upscale)
+		thumbnail_pixels = max(stretched_cutout.shape) * args.upscale
+		save_image(render_cutout(all_images_filter_name[i], stretched_cutout, thumbnail_pixels), 
+			output_folder+obj_output_file_name+'/'+obj_output_file_name+'_'+str(all_images_filter_name[i]))
+		
+		if (args.make_fits):
+			# And now, let's save the fits file, in a new HDU with a copy of the 
+			# mosaic header, so that the mosaic itself (which is shared by every
+			# object) is left alone
+			hdu_cutout = fits.ImageHDU(header = mosaics[i].hdu.header.copy())
+			hdu_cutout.data = image_cutout.data
+			hdu_cutout.header.update(image_cutout.wcs.to_header())
+			hdu_cutout.writeto(output_folder+obj_output_file_name+'/fits/'+obj_output_file_name+'_'+str(all_images_filter_name[i])+'.fits', overwrite = True)
+
+	# And the image with all of the filters
+	save_image(make_grid(stretched_cutouts), output_folder+obj_output_file_name+'/'+obj_output_file_name+'_All_Filters')
+	
+	# Create the tarfile
+	if (args.create_tarball):
+		tar = tarfile.open(output_folder+obj_output_file_name+".tar.gz", "w:gz")
+		for name in [output_folder+obj_output_file_name]:
+		    tar.add(name)
+		tar.close()
+		
+		# And remove the original file 
+
+	return obj_output_file_name, nearest_objects, None
+
+def run_make_object_cutouts(obj):
+	# make_object_cutouts, but an object that fails is reported instead of 
+	# stopping the whole list
+	try:
+		return make_object_cutouts(obj)
+	except Exception as e:
+		return object_output_file_name(obj), None, str(e)
+
 parser = argparse.ArgumentParser()
 
 ######################
@@ -189,6 +339,62 @@ parser.add_argument(
   required=False
 )
 
+# The format of the images
+parser.add_argument(
+  '-image_format','--image_format',
+  help="Format of the images: png, webp, or jpeg (default: png)",
+  action="store",
+  type=str,
+  dest="image_format",
+  choices=['png', 'webp', 'jpeg'],
+  default='png',
+  required=False
+)
+
+# How hard to compress the png images
+parser.add_argument(
+  '-png_compress_level','--png_compress_level',
+  help="Compression level of the png images, from 0 (none) to 9 (smallest) (default: 6)",
+  action="store",
+  type=int,
+  dest="png_compress_level",
+  default=6,
+  required=False
+)
+
+# The quality of the webp and jpeg images
+parser.add_argument(
+  '-image_quality','--image_quality',
+  help="Quality of the webp and jpeg images, from 0 to 100 (default: 90)",
+  action="store",
+  type=int,
+  dest="image_quality",
+  default=90,
+  required=False
+)
+
+# How many times bigger than the mosaic pixels the images are
+parser.add_argument(
+  '-upscale','--upscale',
+  help="Make each pixel of the cutouts this many pixels across in the images (default: 4, 1 is the pixels of the mosaic)",
+  action="store",
+  type=int,
+  dest="upscale",
+  default=4,
+  required=False
+)
+
+# The number of processes to make the cutouts with
+parser.add_argument(
+  '-workers','--workers',
+  help="Number of processes to make the cutouts with (default: 1)",
+  action="store",
+  type=int,
+  dest="workers",
+  default=1,
+  required=False
+)
+
 # Timer Verbose
 parser.add_argument(
   '-create_tarball',
@@ -226,6 +432,23 @@ for i in range(0, number_input_lines):
 		fenrir_username = input_lines[i,1]
 	if (input_lines[i,0] == 'fenrir_password'):
 		fenrir_password = input_lines[i,1]
+	if (input_lines[i,0] == 'cutout_cache_dir'):
+		cutout_cache_directory = input_lines[i,1]
+	if (input_lines[i,0] == 'cutout_cache_size'):
+		cutout_cache_size = float(input_lines[i,1])
+	if (input_lines[i,0] == 'mosaic_workers'):
+		mosaic_workers = int(input_lines[i,1])
+	if (input_lines[i,0] == 'header_cache_dir'):
+		header_cache_directory = input_lines[i,1]
+
+# The cache of cutouts on disk, shared with JADESView
+if (cutout_cache_directory is not None):
+	cutout_cache = CutoutDiskCache(cutout_cache_directory, cutout_cache_size)
+else:
+	cutout_cache = None
+
+# The zscale intervals of the cutouts, so they're only worked out once each
+interval_cache = IntervalCache()
 
 # # # # # # # # # # # # # # # # # # 
 # Let's open up all the input files
@@ -241,52 +464,20 @@ RA_values = fitsinput[1].data['RA']
 DEC_values = fitsinput[1].data['DEC']
 number_objects = len(ID_values)
 
-# Open up the image list file
-images_all_txt = np.loadtxt(all_images_file_name, dtype='str')
-#all_images_filter_name = images_all_txt[:,0]
-#all_image_paths = images_all_txt[:,1]
-if (len(images_all_txt[0]) > 2):
-	# First, if the user specifies where the science data extension is, they'll put 
-	# them in the second column.
-	all_images_filter_name = images_all_txt[:,0]
-	all_image_extension_number = images_all_txt[:,1].astype('int')
-	all_image_paths = images_all_txt[:,2]
-else:
-	# Here, we assume that the science extension is 1 
-	all_images_filter_name = images_all_txt[:,0]
-	all_image_extension_number = np.zeros(len(all_images_filter_name))+1
-	all_image_paths = images_all_txt[:,1]
+# Open up the image list file (the filters, the science extensions, and the
+# paths to the mosaics)
+all_images_filter_name, all_image_extension_number, all_image_paths = read_image_list(all_images_file_name)
 number_image_filters = len(all_images_filter_name)
 number_images = len(all_image_paths)
 
-
-image_all = np.empty(0)
-image_hdu_all = np.empty(0)
-image_wcs_all = np.empty(0)
-#for i in range(0, number_images):
-#	#print "Opening up image: "+all_image_paths[i]
-#	if (all_image_paths[i] == 'NoImage'):
-#		all_image_paths[i] = 'NoImage.fits'
-#	image_all = np.append(image_all, fits.open(all_image_paths[i]))
-#	try:
-#		image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i])[1])
-#	except IndexError:
-#		image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i]))
-#	image_wcs_all = np.append(image_wcs_all, WCS(image_hdu_all[i].header))
-for i in range(0, number_images):
-	print("Opening up image: "+all_image_paths[i])
-	if (all_image_paths[i] == 'NoImage'):
-		all_image_paths[i] = 'NoImage.fits'
-	image_all = np.append(image_all, fits.open(all_image_paths[i]))
-	try:
-		#image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i])[1])
-		image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i])[all_image_extension_number[i]])
-	except IndexError:
-		print('IndexError')
-		image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i]))
-		#print('Running fits.open('+str(all_image_paths[i])+')')
-	#print('Running WCS(image_hdu_all[i].header)')
-	image_wcs_all = np.append(image_wcs_all, WCS(image_hdu_all[i].header))
+# The mosaics are memory-mapped, and are all opened (and have their WCS made)
+# at the same time in a pool of threads
+header_cache = None
+if (header_cache_directory is not None):
+	header_cache = MosaicHeaderCache(header_cache_directory)
+mosaics = MosaicRegistry(all_images_filter_name, all_image_paths, all_image_extension_number, header_cache)
+mosaics.initialize(mosaic_workers)
+mosaics.wait()
 
 
 
@@ -373,6 +564,10 @@ if (args.id_number):
 number_ra_dec_list = len(objRA_list)
 current_ra_dec_index = 0
 
+# Work out where all of the objects are in all of the mosaics in one go
+pixel_positions = PixelPositionTable(objRA_list, objDEC_list, mosaics)
+pixel_positions.compute_all()
+
 make_crosshair = False
 
 stretch = defaultstretch
@@ -383,219 +578,40 @@ else:
 	output_folder = './'
 
 
-for obj in range(0, number_ra_dec_list):
 
-	objRA = objRA_list[obj]
-	objDEC = objDEC_list[obj]
 
-	if (args.id_number):
-		obj_output_file_name = 'Object_'+str(objID_list[obj])
-	elif (args.use_ra_dec_list_id):
-		obj_output_file_name = 'Object_'+str(objID_list[obj])
-	else:
-		obj_output_file_name = 'obj_ra_+'+str(round(objRA,6))+'_dec_'+str(round(objDEC,6))
-
-	print(obj_output_file_name)
-
-	if (not os.path.exists(output_folder+obj_output_file_name+'/')):
-		os.makedirs(output_folder+obj_output_file_name+'/')
-	if (args.make_fits):
-		if (not os.path.exists(output_folder+obj_output_file_name+'/fits/')):
-			os.makedirs(output_folder+obj_output_file_name+'/fits/')
-
-	cosdec_center = math.cos(objDEC * 3.141593 / 180.0)
-	
-	print_nearest_objects(ID_values, RA_values, DEC_values, objRA, objDEC, ra_dec_size_value/2.0)
-	
-	# Set the position of the object
-	position = SkyCoord(str(objRA)+'d '+str(objDEC)+'d', frame='fk5')
-	size = u.Quantity((ra_dec_size_value, ra_dec_size_value), u.arcsec)
-	
-	#fig_photo_objects = np.empty(0, dtype = 'object')
-
-	number_rows = np.floor(number_images/6)+1
-	figure_y_min = 2
-	#fig, axs = plt.subplots(nrows=number_rows, ncols=6, figsize=(12, 2*number_rows))
-	fig = plt.figure(figsize=(12, 2*number_rows))
-	
-	x_spacer = 0.02
-	x_width = (1.0 - (7.0*x_spacer)) / 6.0
-	y_spacer = 0.02
-	y_width = (1.0 - ((number_rows + 1)*x_spacer)) / number_rows
-
-	for i in range(0, number_images):
-		
-		# First, let's create the image with all of the thumbnails. 
-		#print(all_images_filter_name[i])
-		image = image_hdu_all[i].data
-		image_hdu = image_hdu_all[i]
-		image_wcs = image_wcs_all[i]
-		
-		if (args.make_fits):
-			hdu_cutout = image_hdu
-		
-		row_position = (number_rows + 1) - (np.floor((i)/6)+1)
-		col_position = ((i)%6)+1
-
-		ax_pos_x1 = (col_position) * x_spacer + (col_position - 1) * x_width #x_spacer + ((col_position-1) * (x_spacer + x_width))
-		ax_pos_x2 = (col_position) * (x_spacer + x_width) #x_spacer + ((col_position-1) * (x_width))
-		ax_pos_y1 = (row_position) * y_spacer + (row_position - 1) * y_width #x_spacer + ((col_position-1) * (x_spacer + x_width))
-		ax_pos_y2 = (row_position) * (y_spacer + y_width) #x_spacer + ((col_position-1) * (x_width))
-				
-		#print(i, row_position, col_position, ax_pos_x1, ax_pos_x2, ax_pos_y1, ax_pos_y2, )
-		
-		# Make the cutout
-		#start_time = time.time()
-		image_cutout = Cutout2D(image, position, size, wcs=image_wcs)
-		#end_time = time.time()
-		#print("       Running Cutout2D: " +str(end_time - start_time))
-
-		SNR_fontsize_large = int(15.0*sf)
-		SNR_fontsize_small = int(12.0*sf)
-						
-		# Create the wcs axes
-		#plt.clf()
-		#fig = plt.figure(figsize=(thumbnailsize,thumbnailsize))
-		#ax3 = fig.add_axes([0, 0, 1, 1], projection=image_cutout.wcs)
-		ax3 = fig.add_axes([ax_pos_x1, ax_pos_y1, x_width, y_width], projection=image_cutout.wcs)
-		
-		try:
-			ax3.text(0.51, 0.96, all_images_filter_name[i].split('_')[1], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'black')
-			ax3.text(0.5, 0.95, all_images_filter_name[i].split('_')[1], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'white')
-		except IndexError:
-			ax3.text(0.51, 0.96, all_images_filter_name[i], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'black')
-			ax3.text(0.5, 0.95, all_images_filter_name[i], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'white')
-			
-		if (make_crosshair == True):
-			ax3.plot([0.5, 0.5], [0.65, 0.8], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-			ax3.plot([0.5, 0.5], [0.2, 0.35], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-			ax3.plot([0.2, 0.35], [0.5, 0.5], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-			ax3.plot([0.65, 0.8], [0.5, 0.5], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-								
-		# Set the color map
-		plt.set_cmap('gray')
-			
-		indexerror = 0
-		# Normalize the image using the min-max interval and a square root stretch
-		thumbnail = image_cutout.data
-		#start_time = time.time()
-		if (stretch == 'SinhStretch'):
-			try:
-				norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=SinhStretch())
-			except IndexError:
-				indexerror = 1
-			except UnboundLocalError:
-				indexerror = 1
-		if (stretch == 'LogStretch'):
-			try:
-				norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=LogStretch(100))
-			except IndexError:
-				indexerror = 1
-			except UnboundLocalError:
-				indexerror = 1
-		if (stretch == 'LinearStretch'):
-			try:
-				norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=LinearStretch())
-			except IndexError:
-				indexerror = 1
-			except UnboundLocalError:
-				indexerror = 1
-
-		
-		#start_time = time.time()
-		if (all_images_filter_name[i] == 'SEGMAP'):
-			ax3.imshow(thumbnail, origin = 'lower', aspect='equal')		
-		else:		
-			if (indexerror == 0):
-				ax3.imshow(thumbnail, origin = 'lower', aspect='equal', norm = norm)
-			else:
-				ax3.imshow(thumbnail, origin = 'lower', aspect='equal')
-		#end_time = time.time()
-		#print("       Plotting Thumbnail: " +str(end_time - start_time))
-										
-		# Keep this handle alive, or else figure will disappear
-		#fig_photo_objects = np.append(fig_photo_objects, draw_figure(canvas, fig, loc=(fig_x, fig_y)))
-		
-		#plt.close('all')
-		#end_time = time.time()
-
-		ax3.set_axis_off()
-
-		# Now, let's create the individual thumbnail images. 
-
-		fig2 = plt.figure(figsize=(4, 4))
-		ax3 = fig2.add_axes([0, 0, 1, 1], projection=image_cutout.wcs)
-		
-		try:
-			ax3.text(0.51, 0.96, all_images_filter_name[i].split('_')[1], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'black')
-			ax3.text(0.5, 0.95, all_images_filter_name[i].split('_')[1], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'white')
-		except IndexError:
-			ax3.text(0.51, 0.96, all_images_filter_name[i], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'black')
-			ax3.text(0.5, 0.95, all_images_filter_name[i], transform=ax3.transAxes, fontsize=SNR_fontsize_large, fontweight='bold', ha='center', va='top', color = 'white')
-			
-		if (make_crosshair == True):
-			ax3.plot([0.5, 0.5], [0.65, 0.8], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-			ax3.plot([0.5, 0.5], [0.2, 0.35], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-			ax3.plot([0.2, 0.35], [0.5, 0.5], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-			ax3.plot([0.65, 0.8], [0.5, 0.5], linewidth=2.0, transform=ax3.transAxes, color = 'white')
-								
-		# Set the color map
-		plt.set_cmap('gray')
-			
-		indexerror = 0
-		# Normalize the image using the min-max interval and a square root stretch
-		thumbnail = image_cutout.data
-		#start_time = time.time()
-		if (stretch == 'SinhStretch'):
-			try:
-				norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=SinhStretch())
-			except IndexError:
-				indexerror = 1
-			except UnboundLocalError:
-				indexerror = 1
-		if (stretch == 'LogStretch'):
-			try:
-				norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=LogStretch(100))
-			except IndexError:
-				indexerror = 1
-			except UnboundLocalError:
-				indexerror = 1
-		if (stretch == 'LinearStretch'):
-			try:
-				norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=LinearStretch())
-			except IndexError:
-				indexerror = 1
-			except UnboundLocalError:
-				indexerror = 1
-
-		
-		#start_time = time.time()
-		if (all_images_filter_name[i] == 'SEGMAP'):
-			ax3.imshow(thumbnail, origin = 'lower', aspect='equal')		
-		else:		
-			if (indexerror == 0):
-				ax3.imshow(thumbnail, origin = 'lower', aspect='equal', norm = norm)
-			else:
-				ax3.imshow(thumbnail, origin = 'lower', aspect='equal')
-
-		fig2.savefig(output_folder+obj_output_file_name+'/'+obj_output_file_name+'_'+str(all_images_filter_name[i])+'.png', dpi = 300)
-		plt.close(fig2)
-		
-		if (args.make_fits):
-			# And now, let's save the fits file
-			
-			hdu_cutout.data = image_cutout.data
-			hdu_cutout.header.update(image_cutout.wcs.to_header())
-			hdu_cutout.writeto(output_folder+obj_output_file_name+'/fits/'+obj_output_file_name+'_'+str(all_images_filter_name[i])+'.fits', overwrite = True)
-
-	fig.savefig(output_folder+obj_output_file_name+'/'+obj_output_file_name+'_All_Filters.png', dpi = 300)
-	plt.close(fig)
-	
-	# Create the tarfile
-	if (args.create_tarball):
-		tar = tarfile.open(output_folder+obj_output_file_name+".tar.gz", "w:gz")
-		for name in [output_folder+obj_output_file_name]:
-		    tar.add(name)
-		tar.close()
-		
-		# And remove the original file 
+# Make the cutouts for all of the objects, spread over -workers processes. The
+# workers are forked, so they all share the mosaics (memory-mapped) and the 
+# pixel positions that were opened and worked out above.
+start_time = time.time()
+number_done = 0
+number_failed = 0
+if (args.workers > 1):
+	pool = multiprocessing.get_context('fork').Pool(args.workers)
+	results = pool.imap(run_make_object_cutouts, range(0, number_ra_dec_list))
+else:
+	pool = None
+	results = map(run_make_object_cutouts, range(0, number_ra_dec_list))
+
+try:
+	for obj_output_file_name, nearest_objects, error in results:
+		number_done = number_done + 1
+		print(obj_output_file_name)
+		if (nearest_objects is None):
+			number_failed = number_failed + 1
+			print("     Could not make the cutouts: "+error)
+		else:
+			print(nearest_objects)
+		if ((number_ra_dec_list > 1) & ((number_done % 100 == 0) | (number_done == number_ra_dec_list))):
+			elapsed_time = time.time() - start_time
+			print("   "+str(number_done)+" / "+str(number_ra_dec_list)+" objects ("+str(round(number_done / max(elapsed_time, 1e-6), 2))+" objects/s)")
+except KeyboardInterrupt:
+	if (pool is not None):
+		pool.terminate()
+	sys.exit(1)
+if (pool is not None):
+	pool.close()
+	pool.join()
+
+if (number_failed > 0):
+	print("Could not make the cutouts for "+str(number_failed)+" of the "+str(number_ra_dec_list)+" objects.")
@@ -23,7 +23,7 @@ from astropy import units as u
 from astropy.coordinates import SkyCoord
 from astropy.wcs import WCS
 
-from astropy.visualization import (MinMaxInterval, ZScaleInterval, LogStretch, ImageNormalize, AsinhStretch, SinhStretch, LinearStretch)
+from astropy.visualization import (MinMaxInterval, LogStretch, ImageNormalize, AsinhStretch, SinhStretch, LinearStretch)
 
 import matplotlib.backends.tkagg as tkagg
 from matplotlib.backends.backend_agg import FigureCanvasAgg
@@ -34,7 +34,11 @@ try:
 except ImportError:
     from tkinter import *
 import PIL
-from PIL import ImageTk, Image, ImageGrab
+from PIL import ImageTk, Image, ImageGrab, ImageDraw
+
+from JADESView_cache import CutoutDiskCache, IntervalCache, make_cutout
+from JADESView_mosaics import MosaicRegistry, MosaicHeaderCache, read_image_list
+from JADESView_render import load_font
 
 JADESView_input_file = 'JADESView_input_file.dat'
 
@@ -47,6 +51,19 @@ ra_dec_size_value = 2.0
 # The default is to not make the crosshair
 make_crosshair = False
 
+# The folder for keeping the raw cutouts between sessions (None turns this off),
+# and how big (in MB) it's allowed to get
+cutout_cache_directory = None
+cutout_cache_size = 2048
+
+# The number of mosaics that are opened (and have their WCS made) at the same
+# time at startup
+mosaic_workers = 8
+
+# The folder for the sidecar files that keep the mosaic headers and WCS between
+# sessions (None turns this off)
+header_cache_directory = None
+
 def print_nearest_objects(ID_values, catalog_ra, catalog_dec, ra_value, dec_value, distance):
 	c = SkyCoord(ra=catalog_ra*u.degree, dec=catalog_dec*u.degree)
 	object_ra_dec = SkyCoord(ra=ra_value*u.degree, dec=dec_value*u.degree)
@@ -319,16 +336,16 @@ def draw_figure(canvas, figure, loc=(0, 0)):
     tkagg.blit(photo, figure_canvas_agg.get_renderer()._renderer, colormode=2)
 
     # Return a handle which contains a reference to the photo object
-    # which must be kept live or else the picture disappears
-    return photo
+    # which must be kept live or else the picture disappears, and the
+    # figure as a PIL image (which save_canvas puts together)
+    figure_image = Image.frombuffer('RGBA', (figure_w, figure_h), figure_canvas_agg.buffer_rgba(), 'raw', 'RGBA', 0, 1).copy()
+    return photo, figure_image
 
 def create_thumbnails_ra_dec(canvas, fig_photo_objects, ra_value, dec_value, stretch, id_cat, ra_cat, dec_cat):
 	#global ID_values
 	global thumbnailsize
 	global ra_dec_size_value
-	global image_all
-	global image_hdu_all
-	global image_wcs_all
+	global mosaics
 	global image_flux_value_err_cat
 	global all_images_filter_name
 	global number_images
@@ -348,15 +365,17 @@ def create_thumbnails_ra_dec(canvas, fig_photo_objects, ra_value, dec_value, str
 	position = SkyCoord(str(objRA)+'d '+str(objDEC)+'d', frame='fk5')
 	size = u.Quantity((ra_dec_size_value, ra_dec_size_value), u.arcsec)
 	
+	global canvas_thumbnails
+
 	fig_photo_objects = np.empty(0, dtype = 'object')
+	canvas_thumbnails = []
 	for i in range(0, number_images):
-		image = image_hdu_all[i].data
-		image_hdu = image_hdu_all[i]
-		image_wcs = image_wcs_all[i]
+		image = mosaics[i].data
+		image_wcs = mosaics[i].wcs
 				
 		# Make the cutout
 		start_time = time.time()
-		image_cutout = Cutout2D(image, position, size, wcs=image_wcs)
+		image_cutout = make_cutout(image, position, size, image_wcs, cutout_cache, all_image_paths[i], all_image_extension_number[i])
 		#end_time = time.time()
 		#print("       Running Cutout2D: " +str(end_time - start_time))
 
@@ -390,41 +409,24 @@ def create_thumbnails_ra_dec(canvas, fig_photo_objects, ra_value, dec_value, str
 		# Set the color map
 		plt.set_cmap('gray')
 			
-		indexerror = 0
-		# Normalize the image using the min-max interval and a square root stretch
+		# Normalize the image using the zscale interval (which is only worked out
+		# once for each cutout) and the stretch
 		thumbnail = image_cutout.data
+		vmin, vmax = interval_cache.interval((round(objRA, 8), round(objDEC, 8), all_images_filter_name[i], ra_dec_size_value), thumbnail)
 		#start_time = time.time()
 		if (stretch == 'SinhStretch'):
-			try:
-				norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=SinhStretch())
-			except IndexError:
-				indexerror = 1
-			except UnboundLocalError:
-				indexerror = 1
+			norm = ImageNormalize(vmin=vmin, vmax=vmax, stretch=SinhStretch())
 		if (stretch == 'LogStretch'):
-			try:
-				norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=LogStretch(100))
-			except IndexError:
-				indexerror = 1
-			except UnboundLocalError:
-				indexerror = 1
+			norm = ImageNormalize(vmin=vmin, vmax=vmax, stretch=LogStretch(100))
 		if (stretch == 'LinearStretch'):
-			try:
-				norm = ImageNormalize(thumbnail, interval=ZScaleInterval(), stretch=LinearStretch())
-			except IndexError:
-				indexerror = 1
-			except UnboundLocalError:
-				indexerror = 1
+			norm = ImageNormalize(vmin=vmin, vmax=vmax, stretch=LinearStretch())
 
 		
 		#start_time = time.time()
 		if (all_images_filter_name[i] == 'SEGMAP'):
 			ax3.imshow(thumbnail, origin = 'lower', aspect='equal')		
 		else:		
-			if (indexerror == 0):
-				ax3.imshow(thumbnail, origin = 'lower', aspect='equal', norm = norm)
-			else:
-				ax3.imshow(thumbnail, origin = 'lower', aspect='equal')
+			ax3.imshow(thumbnail, origin = 'lower', aspect='equal', norm = norm)
 		#end_time = time.time()
 		#print("       Plotting Thumbnail: " +str(end_time - start_time))
 			
@@ -453,7 +455,9 @@ def create_thumbnails_ra_dec(canvas, fig_photo_objects, ra_value, dec_value, str
 				fig_x, fig_y = (20*sf)+(130*(i-24)*sf), 425*sf
 							
 		# Keep this handle alive, or else figure will disappear
-		fig_photo_objects = np.append(fig_photo_objects, draw_figure(canvas, fig, loc=(fig_x, fig_y)))
+		photo, thumbnail_image = draw_figure(canvas, fig, loc=(fig_x, fig_y))
+		fig_photo_objects = np.append(fig_photo_objects, photo)
+		canvas_thumbnails.append((fig_x, fig_y, thumbnail_image))
 		plt.close('all')
 		end_time = time.time()
 #		if (timer_verbose):
@@ -461,48 +465,29 @@ def create_thumbnails_ra_dec(canvas, fig_photo_objects, ra_value, dec_value, str
 
 	return fig_photo_objects
 
-# This is kind of a hack to make sure that the image thumbnail size is printed on
-# the output files, since none of the labels or buttons are printed when you use
-# canvas.postscript()
+# The image is put together with PIL from the thumbnails that are already
+# rendered (and the labels), rather than through canvas.postscript() and 
+# Ghostscript, so nothing has to be drawn on the canvas and there's no EPS
+# file to clean up
 def save_canvas():
-	global thumbnailsize
-	global sf
-	global canvas
 	global e3
 
 	ra_dec_size_value = float(e3.get())
 
-	fig = plt.figure(figsize=(thumbnailsize*2.51,thumbnailsize/4.0))
-	ax8 = fig.add_axes([0, 0, 1, 1])
-	ax8.text(0.02, 0.5, "Image Size: "+str(ra_dec_size_value)+"\" x "+str(ra_dec_size_value)+"\"", transform=ax8.transAxes, fontsize=12, fontweight='bold', ha='left', va='center', color = 'black')
-	fig_x = 20*sf
-	if (number_images <= 6):
-		fig_y = 760*sf
-	if ((number_images > 6) & (number_images <= 12)):
-		fig_y = 900*sf
-	if (number_images > 12):
-		fig_y = 1040*sf	
-
-	fig_size_object = draw_figure(canvas, fig, loc=(fig_x, fig_y))
-
-	#fig = plt.figure(figsize=(thumbnailsize*2.51,thumbnailsize/4.0))
-	fig2 = plt.figure(figsize=(7, 2.5))
-	ax9 = fig2.add_axes([0, 0, 1, 1])
-
-	fig2_x = 950
-	fig2_y = 650
-	
-	fig2_size_object = draw_figure(canvas, fig2, loc=(fig2_x, fig2_y))
-	#fig.close()
+	panel = Image.new('RGB', (int(canvaswidth), int(canvasheight)), 'white')
+	draw = ImageDraw.Draw(panel)
+	bottom_y = 0
+	for fig_x, fig_y, thumbnail_image in canvas_thumbnails:
+		panel.paste(thumbnail_image, (int(fig_x), int(fig_y)), thumbnail_image)
+		bottom_y = max(bottom_y, fig_y + thumbnail_image.size[1])
+
+	# (The labels have a couple of pixels of border and padding around their text)
+	draw.text((10 + 2, 9 + 2), "RA = "+str(np.round(objRA_list[current_ra_dec_index],6))+", DEC = "+str(np.round(objDEC_list[current_ra_dec_index],6)),
+		fill = 'black', font = load_font(int(textsizevalue*1.5), bold = False))
+	draw.text((20*sf, bottom_y + 5*sf), "Image Size: "+str(ra_dec_size_value)+"\" x "+str(ra_dec_size_value)+"\"", fill = 'black', font = load_font(12))
 
 	output_filename = 'Object_RA_'+str(np.round(objRA_list[current_ra_dec_index],6))+'_DEC_'+str(np.round(objDEC_list[current_ra_dec_index],6))+'_JADESView'
-	canvas.postscript(file=output_filename+'.eps', colormode='color')
-	
-	# use PIL to convert to PNG 
-	img = Image.open(output_filename+'.eps') 
-	os.system('rm '+output_filename+'.eps')
-	#print output_filename+'.png'
-	img.save(output_filename+'.png', 'png') 
+	panel.save(output_filename+'.png', 'png') 
 
 def save_destroy():
 	quit()
@@ -580,6 +565,23 @@ for i in range(0, number_input_lines):
 		fenrir_username = input_lines[i,1]
 	if (input_lines[i,0] == 'fenrir_password'):
 		fenrir_password = input_lines[i,1]
+	if (input_lines[i,0] == 'cutout_cache_dir'):
+		cutout_cache_directory = input_lines[i,1]
+	if (input_lines[i,0] == 'cutout_cache_size'):
+		cutout_cache_size = float(input_lines[i,1])
+	if (input_lines[i,0] == 'mosaic_workers'):
+		mosaic_workers = int(input_lines[i,1])
+	if (input_lines[i,0] == 'header_cache_dir'):
+		header_cache_directory = input_lines[i,1]
+
+# The cache of cutouts on disk, shared with JADESView
+if (cutout_cache_directory is not None):
+	cutout_cache = CutoutDiskCache(cutout_cache_directory, cutout_cache_size)
+else:
+	cutout_cache = None
+
+# The zscale intervals of the cutouts, so they're only worked out once each
+interval_cache = IntervalCache()
 
 # # # # # # # # # # # # # # # # # # 
 # Let's open up all the input files
@@ -591,52 +593,20 @@ RA_values = fitsinput[1].data['RA']
 DEC_values = fitsinput[1].data['DEC']
 number_objects = len(ID_values)
 
-# Open up the image list file
-images_all_txt = np.loadtxt(all_images_file_name, dtype='str')
-#all_images_filter_name = images_all_txt[:,0]
-#all_image_paths = images_all_txt[:,1]
-if (len(images_all_txt[0]) > 2):
-	# First, if the user specifies where the science data extension is, they'll put 
-	# them in the second column.
-	all_images_filter_name = images_all_txt[:,0]
-	all_image_extension_number = images_all_txt[:,1].astype('int')
-	all_image_paths = images_all_txt[:,2]
-else:
-	# Here, we assume that the science extension is 1 
-	all_images_filter_name = images_all_txt[:,0]
-	all_image_extension_number = np.zeros(len(all_images_filter_name))+1
-	all_image_paths = images_all_txt[:,1]
+# Open up the image list file (the filters, the science extensions, and the
+# paths to the mosaics)
+all_images_filter_name, all_image_extension_number, all_image_paths = read_image_list(all_images_file_name)
 number_image_filters = len(all_images_filter_name)
 number_images = len(all_image_paths)
 
-
-image_all = np.empty(0)
-image_hdu_all = np.empty(0)
-image_wcs_all = np.empty(0)
-#for i in range(0, number_images):
-#	#print "Opening up image: "+all_image_paths[i]
-#	if (all_image_paths[i] == 'NoImage'):
-#		all_image_paths[i] = 'NoImage.fits'
-#	image_all = np.append(image_all, fits.open(all_image_paths[i]))
-#	try:
-#		image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i])[1])
-#	except IndexError:
-#		image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i]))
-#	image_wcs_all = np.append(image_wcs_all, WCS(image_hdu_all[i].header))
-for i in range(0, number_images):
-	print("Opening up image: "+all_image_paths[i])
-	if (all_image_paths[i] == 'NoImage'):
-		all_image_paths[i] = 'NoImage.fits'
-	image_all = np.append(image_all, fits.open(all_image_paths[i]))
-	try:
-		#image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i])[1])
-		image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i])[all_image_extension_number[i]])
-	except IndexError:
-		print('IndexError')
-		image_hdu_all = np.append(image_hdu_all, fits.open(all_image_paths[i]))
-		#print('Running fits.open('+str(all_image_paths[i])+')')
-	#print('Running WCS(image_hdu_all[i].header)')
-	image_wcs_all = np.append(image_wcs_all, WCS(image_hdu_all[i].header))
+# The mosaics are memory-mapped, and are all opened (and have their WCS made)
+# at the same time in a pool of threads
+header_cache = None
+if (header_cache_directory is not None):
+	header_cache = MosaicHeaderCache(header_cache_directory)
+mosaics = MosaicRegistry(all_images_filter_name, all_image_paths, all_image_extension_number, header_cache)
+mosaics.initialize(mosaic_workers)
+mosaics.wait()
 
 
 
@@ -0,0 +1,430 @@
+#! /usr/bin/env python
+
+# Caches used by JADESView to avoid redoing work when revisiting objects.
+
+import os
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+from astropy.io import fits
+from astropy import units as u
+from astropy.wcs import WCS
+from astropy.nddata import Cutout2D
+
+from JADESView_mosaics import SlicedCutout, mosaic_identity
+from JADESView_zscale import zscale_intervals
+
+class ThumbnailCache(object):
+	# A memory-bounded least-recently-used cache of rendered thumbnails (PIL
+	# images), keyed by (ID, filter, ra_dec_size_value, stretch). It is
+	# shared between the main thread and the prefetching threads.
+
+	def __init__(self, max_megabytes = 256):
+		self.max_bytes = int(max_megabytes * 1024 * 1024)
+		self.current_bytes = 0
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		with self.lock:
+			entry = self.entries.get(key)
+			if (entry is None):
+				self.misses = self.misses + 1
+				return None
+			self.entries.move_to_end(key)
+			self.hits = self.hits + 1
+			return entry[0]
+
+	def put(self, key, image):
+		nbytes = image.size[0] * image.size[1] * len(image.getbands())
+		if (nbytes > self.max_bytes):
+			return
+		with self.lock:
+			if key in self.entries:
+				self.current_bytes = self.current_bytes - self.entries.pop(key)[1]
+			self.entries[key] = (image, nbytes)
+			self.current_bytes = self.current_bytes + nbytes
+			# Throw away the least recently used thumbnails until we fit
+			while (self.current_bytes > self.max_bytes):
+				old_key, (old_image, old_nbytes) = self.entries.popitem(last = False)
+				self.current_bytes = self.current_bytes - old_nbytes
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.current_bytes = 0
+
+	def stats(self):
+		with self.lock:
+			total = self.hits + self.misses
+			hit_rate = 0.0
+			if (total > 0):
+				hit_rate = 100.0 * self.hits / total
+			return ("Thumbnail cache: "+str(self.hits)+" hits, "+str(self.misses)+" misses ("+str(round(hit_rate,1))+"%), "
+				+str(len(self.entries))+" thumbnails, "+str(round(self.current_bytes / (1024.0*1024.0),1))+" of "
+				+str(round(self.max_bytes / (1024.0*1024.0),1))+" MB")
+
+
+class CutoutMemoryCache(object):
+	# The cutouts (the pixels and the zscale interval) of the thumbnails that
+	# have been rendered, keyed by (index, filter number, ra_dec_size_value), 
+	# so that a thumbnail that came out of the ThumbnailCache can still be given
+	# a new stretch without cutting it out again. Like the ThumbnailCache, this
+	# is bounded by memory, and the least recently used cutouts go first.
+
+	def __init__(self, max_megabytes = 256):
+		self.max_bytes = int(max_megabytes * 1024 * 1024)
+		self.current_bytes = 0
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		with self.lock:
+			entry = self.entries.get(key)
+			if (entry is None):
+				return None
+			self.entries.move_to_end(key)
+			return entry[0]
+
+	def put(self, key, cutout):
+		nbytes = np.asarray(cutout[0]).nbytes
+		if (nbytes > self.max_bytes):
+			return
+		with self.lock:
+			if key in self.entries:
+				self.current_bytes = self.current_bytes - self.entries.pop(key)[1]
+			self.entries[key] = (cutout, nbytes)
+			self.current_bytes = self.current_bytes + nbytes
+			while (self.current_bytes > self.max_bytes):
+				old_key, (old_cutout, old_nbytes) = self.entries.popitem(last = False)
+				self.current_bytes = self.current_bytes - old_nbytes
+
+
+class IntervalCache(object):
+	# The zscale intervals (vmin, vmax) of the cutouts, keyed by (ID, filter,
+	# ra_dec_size_value), so that they are only worked out once for each cutout
+	# no matter how many times it is drawn or with which stretch. The intervals
+	# are tiny, so this holds up to max_entries of them.
+
+	def __init__(self, max_entries = 100000):
+		self.max_entries = max_entries
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		with self.lock:
+			interval = self.entries.get(key)
+			if (interval is None):
+				self.misses = self.misses + 1
+				return None
+			self.entries.move_to_end(key)
+			self.hits = self.hits + 1
+			return interval
+
+	def put(self, key, interval):
+		with self.lock:
+			self.entries[key] = interval
+			self.entries.move_to_end(key)
+			while (len(self.entries) > self.max_entries):
+				self.entries.popitem(last = False)
+
+	def intervals(self, keys, data_list):
+		# The intervals for a list of cutouts (for example, all of the filters of
+		# an object), with the ones that aren't in the cache worked out together
+		intervals = [self.get(key) for key in keys]
+		missing = [k for k in range(0, len(keys)) if intervals[k] is None]
+		if (len(missing) > 0):
+			new_intervals = zscale_intervals([data_list[k] for k in missing])
+			for k, (vmin, vmax) in zip(missing, new_intervals):
+				intervals[k] = (vmin, vmax)
+				self.put(keys[k], intervals[k])
+		return intervals
+
+	def interval(self, key, data):
+		return self.intervals([key], [data])[0]
+
+	def stats(self):
+		with self.lock:
+			return ("Interval cache: "+str(self.hits)+" hits, "+str(self.misses)+" misses, "+str(len(self.entries))+" intervals")
+
+
+def cached_files(cache_directory, suffix):
+	# The (modification time, size, path) of each of the files in a cache 
+	# folder that end with suffix
+	files = []
+	for entry in os.scandir(cache_directory):
+		if entry.name.endswith(suffix):
+			entry_stat = entry.stat()
+			files.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+	return files
+
+
+def evict_cached_files(cache_directory, suffix, max_bytes, other_suffixes = []):
+	# Remove the least recently used files (and the files with the same name
+	# and other_suffixes that go along with them) until the files ending with 
+	# suffix are down to 90% of max_bytes, and give back how many bytes are left
+	files = sorted(cached_files(cache_directory, suffix))
+	total_bytes = sum([nbytes for mtime, nbytes, path in files])
+	for mtime, nbytes, path in files:
+		if (total_bytes <= 0.9 * max_bytes):
+			break
+		try:
+			os.remove(path)
+			total_bytes = total_bytes - nbytes
+			for other_suffix in other_suffixes:
+				os.remove(path[:-len(suffix)]+other_suffix)
+		except OSError:
+			pass
+	return total_bytes
+
+
+class CachedCutout(object):
+	# Looks like the parts of a Cutout2D that JADESView uses
+	def __init__(self, data, wcs):
+		self.data = data
+		self.wcs = wcs
+
+
+class CutoutDiskCache(object):
+	# A persistent cache of raw cutouts (the pixels plus the cutout WCS) on disk,
+	# so that sessions going over the same objects don't have to cut them out of
+	# the mosaics again. The cutouts are keyed by the identity of the mosaic 
+	# (path, size, and modification time, so a new version of a mosaic is never
+	# confused with the old one), the position, and the box size. When the cache
+	# gets bigger than max_megabytes, the least recently used cutouts are removed.
+
+	def __init__(self, cache_directory, max_megabytes = 2048):
+		# (The folder can come from np.loadtxt as a numpy string, which makes
+		# os.scandir give back bytes, so it's made into a plain str)
+		self.cache_directory = str(cache_directory)
+		self.max_bytes = int(max_megabytes * 1024 * 1024)
+		self.mosaic_identities = {}
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+		if (not os.path.exists(self.cache_directory)):
+			os.makedirs(self.cache_directory)
+		self.current_bytes = sum([nbytes for mtime, nbytes, path in cached_files(self.cache_directory, '.npz')])
+
+	def mosaic_identity(self, mosaic_path, extension):
+		# The mosaics don't change during a session, so we only stat them once
+		identity = self.mosaic_identities.get((mosaic_path, extension))
+		if (identity is None):
+			identity = mosaic_identity(mosaic_path, extension)
+			self.mosaic_identities[(mosaic_path, extension)] = identity
+		return identity
+
+	def cutout_file_name(self, mosaic_path, extension, ra, dec, size_arcsec):
+		key = (self.mosaic_identity(mosaic_path, extension)+'|'+repr(round(float(ra), 8))+'|'+repr(round(float(dec), 8))
+			+'|'+repr(round(float(size_arcsec[0]), 6))+'|'+repr(round(float(size_arcsec[1]), 6)))
+		return os.path.join(self.cache_directory, hashlib.sha1(key.encode('utf-8')).hexdigest()+'.npz')
+
+	def get(self, mosaic_path, extension, ra, dec, size_arcsec):
+		cutout_file = self.cutout_file_name(mosaic_path, extension, ra, dec, size_arcsec)
+		try:
+			with np.load(cutout_file) as cached:
+				data = cached['data']
+				wcs_header = str(cached['wcs_header'])
+		except (IOError, OSError, KeyError, ValueError):
+			with self.lock:
+				self.misses = self.misses + 1
+			return None
+
+		# Mark it as recently used
+		try:
+			os.utime(cutout_file, None)
+		except OSError:
+			pass
+		with self.lock:
+			self.hits = self.hits + 1
+		return CachedCutout(data, WCS(fits.Header.fromstring(wcs_header)))
+
+	def put(self, mosaic_path, extension, ra, dec, size_arcsec, image_cutout):
+		cutout_file = self.cutout_file_name(mosaic_path, extension, ra, dec, size_arcsec)
+		
+		# Write to a temporary file first, so that a crash (or another process
+		# reading the cache) never sees a half-written cutout
+		temporary_file = cutout_file+'.'+str(os.getpid())+'.'+str(threading.get_ident())+'.tmp'
+		with open(temporary_file, 'wb') as f:
+			np.savez(f, data = np.asarray(image_cutout.data), wcs_header = np.array(image_cutout.wcs.to_header_string(relax = True)))
+		os.replace(temporary_file, cutout_file)
+
+		with self.lock:
+			self.current_bytes = self.current_bytes + os.path.getsize(cutout_file)
+			if (self.current_bytes > self.max_bytes):
+				self.evict()
+
+	def evict(self):
+		# Remove the least recently used cutouts until we're at 90% of the limit
+		self.current_bytes = evict_cached_files(self.cache_directory, '.npz', self.max_bytes)
+
+	def stats(self):
+		with self.lock:
+			return ("Cutout cache ("+self.cache_directory+"): "+str(self.hits)+" hits, "+str(self.misses)+" misses, "
+				+str(round(self.current_bytes / (1024.0*1024.0),1))+" of "+str(round(self.max_bytes / (1024.0*1024.0),1))+" MB")
+
+
+class HTTPDiskCache(object):
+	# Files downloaded over HTTP (the SED plots and the results catalogs), kept
+	# on disk along with their ETag and Last-Modified headers, so that the next
+	# time they're asked for the server only has to say that they haven't 
+	# changed. Each URL has a .body file with the contents and a .json file with
+	# the headers. When the cache gets bigger than max_megabytes, the least
+	# recently used files are removed.
+
+	def __init__(self, cache_directory, max_megabytes = 2048):
+		# (A plain str, like for the CutoutDiskCache)
+		self.cache_directory = str(cache_directory)
+		self.max_bytes = int(max_megabytes * 1024 * 1024)
+		self.hits = 0
+		self.revalidated = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+		if (not os.path.exists(self.cache_directory)):
+			os.makedirs(self.cache_directory)
+		self.current_bytes = sum([nbytes for mtime, nbytes, path in cached_files(self.cache_directory, '.body')])
+
+	def file_names(self, url):
+		base_name = os.path.join(self.cache_directory, hashlib.sha1(url.encode('utf-8')).hexdigest())
+		return base_name+'.body', base_name+'.json'
+
+	def get(self, url):
+		# The (contents, headers) for a URL, or None if it isn't in the cache
+		body_file, header_file = self.file_names(url)
+		try:
+			with open(header_file, 'r') as f:
+				headers = json.load(f)
+			with open(body_file, 'rb') as f:
+				content = f.read()
+		except (IOError, OSError, ValueError):
+			return None
+		if ((headers.get('url') != url) | (headers.get('size') != len(content))):
+			return None
+		return content, headers
+
+	def touch(self, url):
+		# Mark it as recently used
+		body_file, header_file = self.file_names(url)
+		try:
+			os.utime(body_file, None)
+		except OSError:
+			pass
+
+	def count(self, outcome):
+		# Keep track of how the cache was used ('hit', 'revalidated', or 'miss')
+		with self.lock:
+			if (outcome == 'hit'):
+				self.hits = self.hits + 1
+			elif (outcome == 'revalidated'):
+				self.revalidated = self.revalidated + 1
+			else:
+				self.misses = self.misses + 1
+
+	def put(self, url, content, etag = None, last_modified = None):
+		body_file, header_file = self.file_names(url)
+		headers = {'url': url, 'size': len(content), 'etag': etag, 'last_modified': last_modified, 'stored': time.time()}
+
+		# Write to temporary files first, so that a crash never leaves a 
+		# half-written file in the cache (and the sizes are checked on the way
+		# back out, in case the body and headers are from different versions)
+		temporary_suffix = '.'+str(os.getpid())+'.'+str(threading.get_ident())+'.tmp'
+		with open(body_file+temporary_suffix, 'wb') as f:
+			f.write(content)
+		with open(header_file+temporary_suffix, 'w') as f:
+			json.dump(headers, f)
+		os.replace(body_file+temporary_suffix, body_file)
+		os.replace(header_file+temporary_suffix, header_file)
+
+		with self.lock:
+			self.current_bytes = self.current_bytes + len(content)
+			if (self.current_bytes > self.max_bytes):
+				self.evict()
+
+	def evict(self):
+		# Remove the least recently used files (and their headers) until we're 
+		# at 90% of the limit
+		self.current_bytes = evict_cached_files(self.cache_directory, '.body', self.max_bytes, ['.json'])
+
+	def stats(self):
+		with self.lock:
+			return ("HTTP cache ("+self.cache_directory+"): "+str(self.hits)+" hits, "+str(self.revalidated)+" revalidated, "
+				+str(self.misses)+" misses, "+str(round(self.current_bytes / (1024.0*1024.0),1))+" of "
+				+str(round(self.max_bytes / (1024.0*1024.0),1))+" MB")
+
+
+def make_cutout(image, position, size, wcs, cutout_cache = None, mosaic_path = None, extension = None, pixel_slice = None):
+	# Cutout2D(image, position, size, wcs=wcs), going through the cutout cache 
+	# on disk when there is one. If the pixel position of the object in the 
+	# mosaic and the size of the cutout in pixels can be looked up (pixel_slice
+	# gives them back, from a PixelPositionTable), the cutout is just a slice of
+	# the mosaic. They're only looked up if the cutout isn't in the cache.
+	if (cutout_cache is not None):
+		ra = position.ra.deg
+		dec = position.dec.deg
+		size_arcsec = (size[0].to(u.arcsec).value, size[1].to(u.arcsec).value)
+		image_cutout = cutout_cache.get(mosaic_path, extension, ra, dec, size_arcsec)
+		if (image_cutout is not None):
+			return image_cutout
+
+	if (pixel_slice is not None):
+		pixel_position, pixel_shape = pixel_slice()
+		image_cutout = SlicedCutout(image, pixel_position, pixel_shape, wcs)
+	else:
+		image_cutout = Cutout2D(image, position, size, wcs=wcs)
+
+	if (cutout_cache is not None):
+		cutout_cache.put(mosaic_path, extension, ra, dec, size_arcsec, image_cutout)
+	return image_cutout
+
+
+class CutoutCacheFiller(object):
+	# Fills the cutout cache for the rest of the active ID list in a background
+	# thread, but only while the user is idle (nothing has happened for 
+	# idle_seconds), so that it doesn't slow down looking at objects.
+
+	def __init__(self, fill_function, idle_seconds = 2.0):
+		self.fill_function = fill_function
+		self.idle_seconds = idle_seconds
+		self.last_activity = time.time()
+		self.items = deque()
+		self.condition = threading.Condition()
+		self.thread = threading.Thread(target = self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def set_items(self, items):
+		# The items (for example, indices into the photometric catalog) still to 
+		# be filled, in the order they should be done.
+		with self.condition:
+			self.items = deque(items)
+			self.condition.notify()
+
+	def touch(self):
+		# The user did something, so hold off for a bit
+		self.last_activity = time.time()
+
+	def run(self):
+		while True:
+			with self.condition:
+				while (len(self.items) == 0):
+					self.condition.wait()
+			idle_time = time.time() - self.last_activity
+			if (idle_time < self.idle_seconds):
+				time.sleep(self.idle_seconds - idle_time)
+				continue
+			with self.condition:
+				if (len(self.items) == 0):
+					continue
+				item = self.items.popleft()
+			try:
+				self.fill_function(item)
+			except Exception as e:
+				print("Filling the cutout cache failed for "+str(item)+": "+str(e))
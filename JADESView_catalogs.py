@@ -0,0 +1,203 @@
+#! /usr/bin/env python
+
+# Loading the results catalogs (EAZY, BEAGLE, BAGPIPES, the NN redshifts, and
+# the color selection) for JADESView. The catalogs are all loaded at the same
+# time in their own threads, so the window can come up before the slower ones
+# (the BEAGLE VAC can be hundreds of MB) have arrived, and their labels are
+# filled in once they're ready. Catalogs on a server are fetched through the
+# SEDFetcher, so with an HTTPDiskCache they are only downloaded again when
+# they've changed on the server.
+#
+# Each catalog is joined onto the rows of the photometric catalog as soon as it
+# is loaded, so the values for an object are all in one row, found with the
+# object's index in the photometric catalog.
+#
+# The worker threads never touch Tk: the main thread asks for the catalogs
+# that have finished with loaded_since_last_check() (from a Tk after() loop).
+
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+
+class IDIndex(object):
+	# Finding the row with a given ID in a catalog, by binary search through
+	# the sorted IDs instead of comparing against every row. The sort is stable,
+	# so if an ID is in the catalog more than once, its first row is found
+	# (like np.where(IDs == ID)[0][0]).
+
+	def __init__(self, IDs):
+		IDs = np.asarray(IDs)
+		self.order = np.argsort(IDs, kind = 'stable')
+		self.sorted_IDs = IDs[self.order]
+
+	def row(self, ID):
+		# The row with this ID, or None if it isn't in the catalog
+		position = np.searchsorted(self.sorted_IDs, ID)
+		if ((position < len(self.sorted_IDs)) and (self.sorted_IDs[position] == ID)):
+			return self.order[position]
+		return None
+
+	def rows(self, IDs):
+		# The rows for an array of IDs, with -1 for the ones that aren't in the
+		# catalog
+		IDs = np.asarray(IDs)
+		positions = np.minimum(np.searchsorted(self.sorted_IDs, IDs), max(len(self.sorted_IDs) - 1, 0))
+		if (len(self.sorted_IDs) == 0):
+			return np.full(IDs.shape, -1, dtype = 'int64')
+		found = (self.sorted_IDs[positions] == IDs)
+		return np.where(found, self.order[positions], -1)
+
+def resolve_IDs(requested_IDs, IDs):
+	# The rows in IDs of each of the requested IDs, in one pass, and the
+	# requested IDs that aren't in IDs at all (which are left out of the rows)
+	requested_IDs = np.asarray(requested_IDs).astype('int64')
+	rows = IDIndex(IDs).rows(requested_IDs)
+	found = rows >= 0
+	return rows[found], requested_IDs[~found]
+
+# The columns that are used from each kind of results catalog, as (field
+# name, column name in the catalog), and the column with the IDs. The BAGPIPES
+# catalog numbers its objects starting one lower than the photometric catalog,
+# which is taken care of with its ID offset.
+results_columns = {
+	'EAZY':{'ID':'ID', 'ID_offset':0, 'fields':[('zpeak', 'z_peak'), ('za', 'z_a'), ('zl68', 'l68'), ('zu68', 'u68')]},
+	'BEAGLE':{'ID':'ID', 'ID_offset':0, 'fields':[('zavg', 'redshift_beagle_mean'),
+		('redshift_1', 'redshift_beagle_1'), ('redshift_err_1', 'redshift_beagle_err_1'),
+		('redshift_2', 'redshift_beagle_2'), ('redshift_err_2', 'redshift_beagle_err_2'),
+		('zl68', 'redshift_68.0_low'), ('zu68', 'redshift_68.0_up'),
+		('Pzgt2p0', 'redshift_p_gt_2.0'), ('Pzgt4p0', 'redshift_p_gt_4.0'), ('Pzgt6p0', 'redshift_p_gt_6.0')]},
+	'NN':{'ID':'ID_PHOTOMETRIC', 'ID_offset':0, 'fields':[('zpred', 'pred_z'), ('zspec', 'true_z'), ('use', 'USE')]},
+	'color_selection':{'ID':'ID', 'ID_offset':0, 'fields':[('F090W_dropouts', 'NRC_F090W_Dropout_SNR3.0'),
+		('F115W_dropouts', 'NRC_F115W_Dropout_SNR3.0'), ('F150W_dropouts', 'NRC_F150W_Dropout_SNR3.0')]},
+	'BAGPIPES':{'ID':'ID', 'ID_offset':1, 'fields':[('zphot', 'redshift_mean')]}
+}
+
+def join_results(name, hdulist, photometric_IDs):
+	# The columns of a results catalog, joined onto the rows of the photometric
+	# catalog, as a structured array with one row per object. The 'found' field
+	# is False for the objects that aren't in the results catalog (and their
+	# other fields are zero).
+	columns = results_columns[name]
+	data = hdulist[1].data
+	# (The BEAGLE IDs are strings, which this converts all at once)
+	results_IDs = np.asarray(data[columns['ID']]).astype('int64') + columns['ID_offset']
+	rows = IDIndex(results_IDs).rows(photometric_IDs)
+	found = rows >= 0
+
+	dtype = [('found', bool)]
+	for (field, column) in columns['fields']:
+		dtype.append((field, np.asarray(data[column]).dtype.newbyteorder('=')))
+	joined = np.zeros(len(photometric_IDs), dtype = dtype)
+	joined['found'] = found
+	for (field, column) in columns['fields']:
+		joined[field][found] = np.asarray(data[column])[rows[found]]
+	return joined
+
+class ResultsCatalogs(object):
+
+	def __init__(self, fetcher, workers = 5):
+		self.fetcher = fetcher
+		self.photometric_IDs = None
+		self.photometric_IDs_set = threading.Event()
+		self.executor = ThreadPoolExecutor(max_workers = workers)
+		self.futures = {}
+		self.catalogs = {}
+		self.reported = set()
+		self.lock = threading.Lock()
+
+	def load_catalog(self, name, file_name):
+		# Read one catalog (in a worker thread), from the server or from disk
+		if (file_name.startswith('http')):
+			fits_file = BytesIO(self.fetcher.fetch(file_name))
+		else:
+			fits_file = file_name
+		with fits.open(fits_file) as hdulist:
+			# The catalog can be downloaded and opened before the photometric
+			# catalog has been read, but it can't be joined onto it
+			self.photometric_IDs_set.wait()
+			joined = join_results(name, hdulist, self.photometric_IDs)
+		return joined
+
+	def set_photometric_IDs(self, IDs):
+		# The IDs of the photometric catalog, in its row order, that the results
+		# catalogs are joined onto
+		self.photometric_IDs = np.asarray(IDs)
+		self.photometric_IDs_set.set()
+
+	def load(self, name, file_name):
+		# Start loading a catalog in the background
+		with self.lock:
+			self.futures[name] = self.executor.submit(self.load_catalog, name, file_name)
+
+	def ready(self, name):
+		# Whether a catalog has finished loading (successfully)
+		return (self.get(name) is not None)
+
+	def get(self, name):
+		# The joined catalog (see join_results), or None if it isn't loaded (yet)
+		with self.lock:
+			if (name in self.catalogs):
+				return self.catalogs[name]
+			future = self.futures.get(name)
+		if ((future is None) or not (future.done())):
+			return None
+		try:
+			columns = future.result()
+		except Exception:
+			columns = None
+		with self.lock:
+			self.catalogs[name] = columns
+		return columns
+
+	def wait(self, name):
+		# The joined catalog, waiting for it to finish loading
+		with self.lock:
+			future = self.futures.get(name)
+		if (future is not None):
+			try:
+				future.result()
+			except Exception:
+				pass
+		return self.get(name)
+
+	def record(self, name, index):
+		# The row of a catalog for the object in row index of the photometric
+		# catalog, or None if the catalog isn't loaded (yet)
+		joined = self.get(name)
+		if (joined is None):
+			return None
+		return joined[index]
+
+	def loaded_since_last_check(self):
+		# The names of the catalogs that have finished (or failed) since the
+		# last time this was called, so the main thread can fill in their labels
+		with self.lock:
+			names = list(self.futures.keys())
+		finished = []
+		for name in names:
+			if ((name in self.reported) or not (self.futures[name].done())):
+				continue
+			self.reported.add(name)
+			exception = self.futures[name].exception()
+			if (exception is not None):
+				print("Could not load the "+name+" results: "+str(exception))
+			finished.append(name)
+		return finished
+
+	def pending(self):
+		# Whether any of the catalogs are still loading
+		with self.lock:
+			names = list(self.futures.keys())
+		for name in names:
+			if (name not in self.reported):
+				return True
+		return False
+
+	def shutdown(self):
+		# (Don't leave any of the loaders waiting for the photometric IDs)
+		if not (self.photometric_IDs_set.is_set()):
+			self.set_photometric_IDs(np.array([], dtype = 'int64'))
+		self.executor.shutdown(wait = False)
@@ -0,0 +1,116 @@
+#! /usr/bin/env python
+
+# Fetching the SED plots for JADESView, either from local disk or from a
+# server (like fenrir). All of the downloads go through one requests.Session,
+# so the connections (and the TLS handshakes) are reused from one image to the
+# next, and there are connect and read timeouts so that a slow server can't
+# hang the viewer forever. The fetcher has its own pool of threads, so that
+# all of the SED plots for an object can be downloaded at the same time, both
+# for the object being displayed and by the prefetcher for the upcoming ones.
+#
+# With an HTTPDiskCache, downloaded files are kept on disk, and asking for them
+# again only checks with the server that they haven't changed (using the ETag
+# or Last-Modified headers). In offline mode, files only come from the cache.
+
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from PIL import Image
+
+class SEDFetcher(object):
+
+	def __init__(self, username = None, password = None, workers = 4, connect_timeout = 5.0, read_timeout = 30.0, http_cache = None, offline = False):
+		self.http_cache = http_cache
+		self.offline = offline
+		self.session = requests.Session()
+		if (username is not None):
+			self.session.auth = HTTPBasicAuth(username, password)
+		# Keep enough connections around for all of the workers
+		adapter = HTTPAdapter(pool_connections = workers, pool_maxsize = workers)
+		self.session.mount('http://', adapter)
+		self.session.mount('https://', adapter)
+		self.timeout = (connect_timeout, read_timeout)
+		self.executor = ThreadPoolExecutor(max_workers = workers)
+
+	def fetch(self, url):
+		# The contents of a URL, going through the cache if there is one
+		cached = None
+		if (self.http_cache is not None):
+			cached = self.http_cache.get(url)
+
+		if (self.offline == True):
+			if (cached is None):
+				raise IOError(url+" is not in the HTTP cache, and we're running offline.")
+			self.http_cache.touch(url)
+			self.http_cache.count('hit')
+			return cached[0]
+
+		# Only ask for the file if it has changed since we got it
+		request_headers = {}
+		if (cached is not None):
+			if (cached[1].get('etag') is not None):
+				request_headers['If-None-Match'] = cached[1]['etag']
+			if (cached[1].get('last_modified') is not None):
+				request_headers['If-Modified-Since'] = cached[1]['last_modified']
+
+		try:
+			response = self.session.get(url, headers = request_headers, timeout = self.timeout)
+		except requests.exceptions.RequestException as e:
+			if (cached is None):
+				raise
+			# We can't get to the server, but we have the file from before
+			print("Could not reach the server for "+url+" ("+str(e)+"), using the cached copy.")
+			self.http_cache.touch(url)
+			self.http_cache.count('hit')
+			return cached[0]
+
+		if ((response.status_code == 304) & (cached is not None)):
+			self.http_cache.touch(url)
+			self.http_cache.count('revalidated')
+			return cached[0]
+
+		response.raise_for_status()
+		if (self.http_cache is not None):
+			self.http_cache.put(url, response.content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+			self.http_cache.count('miss')
+		return response.content
+
+	def open_image(self, file_name):
+		# A PIL image from a URL or a local file. The image is decoded here, so
+		# that this is done in whatever thread is fetching it.
+		if (file_name.startswith('http')):
+			image = Image.open(BytesIO(self.fetch(file_name)))
+		else:
+			image = Image.open(file_name)
+		image.load()
+		return image
+
+	def submit(self, function, *args):
+		# Run function(*args) in the fetcher's threads, and return the Future
+		return self.executor.submit(function, *args)
+
+	def submit_all(self, functions):
+		# Start each of the functions in the dictionary, and return a dictionary
+		# of their Futures with the same keys
+		futures = {}
+		for key in functions:
+			futures[key] = self.submit(functions[key])
+		return futures
+
+	def fetch_all(self, functions):
+		# Run each of the functions in the dictionary at the same time, and
+		# return a dictionary of their results with the same keys. Don't call 
+		# this from one of the fetcher's own threads, or it can end up waiting
+		# on itself.
+		futures = self.submit_all(functions)
+		results = {}
+		for key in futures:
+			results[key] = futures[key].result()
+		return results
+
+	def shutdown(self):
+		self.executor.shutdown(wait = False)
+		self.session.close()
@@ -0,0 +1,270 @@
+#! /usr/bin/env python
+
+# The review journal for JADESView. Every flag and note is appended to the
+# journal (and synced to disk) as soon as it's made, so a crash, a killed
+# terminal, or a lost connection never loses any of a session. When JADESView
+# starts, the journal is replayed, and then compacted: the output_flags_file
+# and output_notes_file are written from it, and the journal is rewritten with
+# just the current state of each object.
+#
+# Each line of the journal is a JSON record, either
+#    {"ID": 1234, "flag": "HighZFlag", "value": 1}
+# or
+#    {"ID": 1234, "note": "Looks like a merger"}
+# and later records for the same object replace earlier ones.
+#
+# The position in the list and the thumbnail settings are kept in a separate
+# session file (see write_session), which is small enough to be rewritten
+# every time the user moves, so that a session can be resumed with -resume 
+# (the flags and notes come back from the journal). The list itself can be 
+# long, so it's written once to a list file that the session file points to.
+#
+# The flags and notes themselves are kept in a ReviewState, which only stores
+# what has actually been set: the notes are a dictionary keyed by the object's
+# row in the photometric catalog, and the flags are bits (one byte holds eight
+# flags for an object), so even a catalog with millions of objects costs next
+# to nothing to start up with.
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+import numpy as np
+from astropy.table import Table
+
+from JADESView_catalogs import IDIndex
+
+# The flags that can be set on an object, in the order of the columns of the
+# output_flags_file. Flags that show up in a journal but aren't here are added
+# on the end (see ReviewState.add_flag).
+default_flag_names = ['HighZFlag', 'BadFitFlag', 'BadDataFlag']
+
+class ReviewJournal(object):
+
+	def __init__(self, file_name):
+		self.file_name = file_name
+		self.journal = None
+		self.lock = threading.Lock()
+		# The number of lines that replay() had to skip
+		self.damaged_lines = 0
+
+	def replay(self):
+		# All of the records in the journal, in the order they were made. A last
+		# line that was only half written (if JADESView was killed while writing
+		# it) is skipped, and counted in damaged_lines; the journal then has to be
+		# rewritten, or the next record would be added on the end of that line.
+		records = []
+		self.damaged_lines = 0
+		if (os.path.exists(self.file_name)):
+			with open(self.file_name) as journal:
+				for line in journal:
+					try:
+						records.append(json.loads(line))
+					except ValueError:
+						print("Skipping a damaged line in the review journal "+self.file_name)
+						self.damaged_lines = self.damaged_lines + 1
+		return records
+
+	def open(self):
+		self.journal = open(self.file_name, 'a')
+
+	def append(self, record):
+		# Write one record, and make sure it's on the disk before going on
+		record['time'] = round(time.time(), 3)
+		with self.lock:
+			self.journal.write(json.dumps(record)+'\n')
+			self.journal.flush()
+			os.fsync(self.journal.fileno())
+
+	def rewrite(self, records):
+		# Replace the journal with these records (the compacted state), without
+		# ever leaving a half-written journal behind
+		with self.lock:
+			if (self.journal is not None):
+				self.journal.close()
+			temporary_file_name = self.file_name+'.tmp'
+			with open(temporary_file_name, 'w') as journal:
+				for record in records:
+					journal.write(json.dumps(record)+'\n')
+				journal.flush()
+				os.fsync(journal.fileno())
+			os.replace(temporary_file_name, self.file_name)
+			self.journal = open(self.file_name, 'a')
+
+	def close(self):
+		with self.lock:
+			if (self.journal is not None):
+				self.journal.close()
+				self.journal = None
+
+class ReviewState(object):
+
+	def __init__(self, IDs, flag_names = default_flag_names, journal = None):
+		# IDs are the IDs of the photometric catalog, in its row order
+		self.IDs = IDs
+		self.journal = journal
+		self.flag_names = []
+		self.flag_bits = np.zeros([len(IDs), 1], dtype = 'uint8')
+		for flag_name in flag_names:
+			self.add_flag(flag_name)
+		self.notes = {}
+		self.other_records = []
+
+	def add_flag(self, flag_name):
+		# Add a flag to the schema (if it isn't already there), adding another
+		# byte to each object when the ones there are full
+		if (flag_name not in self.flag_names):
+			self.flag_names.append(flag_name)
+			if (len(self.flag_names) > 8 * self.flag_bits.shape[1]):
+				self.flag_bits = np.hstack([self.flag_bits, np.zeros([len(self.IDs), 1], dtype = 'uint8')])
+		return self.flag_names.index(flag_name)
+
+	def set_flag(self, index, flag_name, value = 1, journal = True):
+		# Set (or clear) a flag on the object in row index, and write it to the 
+		# journal
+		j = self.add_flag(flag_name)
+		if (value):
+			self.flag_bits[index, j // 8] |= np.uint8(1 << (j % 8))
+		else:
+			self.flag_bits[index, j // 8] &= np.uint8(~(1 << (j % 8)) & 255)
+		if ((journal == True) & (self.journal is not None)):
+			self.journal.append({'ID':int(self.IDs[index]), 'flag':flag_name, 'value':int(value)})
+
+	def flag(self, index, flag_name):
+		j = self.flag_names.index(flag_name)
+		return int((self.flag_bits[index, j // 8] >> (j % 8)) & 1)
+
+	def flag_values(self):
+		# All of the flags, as an (objects x flags) array of 0s and 1s
+		return np.unpackbits(self.flag_bits, axis = 1, count = len(self.flag_names), bitorder = 'little')
+
+	def note(self, index):
+		return self.notes.get(index, '')
+
+	def set_note(self, index, note, journal = True):
+		# Keep the note for the object in row index, and if it has changed, write
+		# it to the journal
+		if (note == self.note(index)):
+			return
+		if (note == ''):
+			del self.notes[index]
+		else:
+			self.notes[index] = note
+		if ((journal == True) & (self.journal is not None)):
+			self.journal.append({'ID':int(self.IDs[index]), 'note':note})
+
+	def replay(self, records):
+		# Apply the flags and notes from a journal, in the order they were made.
+		# Records for objects that aren't in this catalog are kept, so that they
+		# stay in the journal.
+		if (len(records) == 0):
+			return
+		rows = IDIndex(self.IDs).rows(np.array([record['ID'] for record in records]))
+		for (record, row) in zip(records, rows):
+			if (row < 0):
+				self.other_records.append(record)
+			elif ('flag' in record):
+				self.set_flag(row, record['flag'], record['value'], journal = False)
+			elif ('note' in record):
+				self.set_note(row, record['note'], journal = False)
+
+	def records(self):
+		# The current state, as journal records (one per flag that is set, and
+		# one per note)
+		records = list(self.other_records)
+		flag_values = self.flag_values()
+		flagged_rows, flagged_columns = np.nonzero(flag_values)
+		for (row, j) in zip(flagged_rows, flagged_columns):
+			records.append({'ID':int(self.IDs[row]), 'flag':self.flag_names[j], 'value':1})
+		for row in sorted(self.notes.keys()):
+			records.append({'ID':int(self.IDs[row]), 'note':self.notes[row]})
+		return records
+
+	def write_outputs(self, flags_file_name, notes_file_name):
+		# Export to the output_flags_file and output_notes_file
+		write_flags_file(flags_file_name, self.IDs, self.flag_names, self.flag_values())
+		write_notes_file(notes_file_name, [(self.IDs[row], self.notes[row]) for row in sorted(self.notes.keys())])
+
+	def compact(self, flags_file_name, notes_file_name):
+		# Write the output files, and replace the journal with the current state
+		self.write_outputs(flags_file_name, notes_file_name)
+		if (self.journal is not None):
+			self.journal.rewrite(self.records())
+
+def write_atomically(file_name, contents):
+	# Write a JSON file to a temporary file, make sure it's on the disk, and 
+	# then move it into place, so it's never half written
+	temporary_file_name = file_name+'.tmp'
+	with open(temporary_file_name, 'w') as f:
+		json.dump(contents, f)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(temporary_file_name, file_name)
+
+def write_session(file_name, session):
+	# The session file (where the user is in which list, and how the thumbnails
+	# are being shown), which is rewritten every time the user moves. The list
+	# itself isn't in it, it's in a list file (see write_session_list).
+	write_atomically(file_name, session)
+
+def session_list_hash(IDs):
+	# A hash of a list of IDs, so a session can tell that its list file is the
+	# one it was saved with
+	return hashlib.sha1(np.asarray(IDs, dtype = 'int64').tobytes()).hexdigest()
+
+def write_session_list(file_name, IDs):
+	# The list that a session is going through, which only has to be written
+	# once (the session file points to it, with its hash)
+	list_hash = session_list_hash(IDs)
+	write_atomically(file_name, {'hash':list_hash, 'ID_list':[int(x) for x in IDs]})
+	return list_hash
+
+def read_session_list(file_name, list_hash):
+	# The IDs in a list file, or None if it isn't there, can't be read, or isn't
+	# the list with that hash
+	try:
+		with open(file_name) as f:
+			session_list = json.load(f)
+	except (IOError, OSError, ValueError):
+		return None
+	if ((session_list.get('hash') != list_hash) or (session_list_hash(session_list['ID_list']) != list_hash)):
+		return None
+	return session_list['ID_list']
+
+def read_session(file_name):
+	# The session from a session file, or None if there isn't one (or it can't
+	# be read)
+	if not (os.path.exists(file_name)):
+		return None
+	try:
+		with open(file_name) as f:
+			return json.load(f)
+	except ValueError:
+		print("Could not read the session file "+file_name)
+		return None
+
+def write_flags_file(file_name, IDs, flag_names, flag_values):
+	# The output_flags_file: the ID of every object, and a column for each flag.
+	# It's written to a temporary file first and then moved into place, so the
+	# old file is only replaced once the new one is complete.
+	colnames = ['ID'] + list(flag_names)
+	columns = [np.asarray(IDs).astype('I')]
+	for j in range(0, len(flag_names)):
+		columns.append(flag_values[:,j].astype('I'))
+
+	temporary_file_name = file_name+'.tmp'
+	outtab = Table(columns, names=colnames)
+	outtab.write(temporary_file_name, format='fits', overwrite=True)
+	os.replace(temporary_file_name, file_name)
+
+def write_notes_file(file_name, notes):
+	# The output_notes_file, from a list of (ID, note) pairs
+	temporary_file_name = file_name+'.tmp'
+	w = open(temporary_file_name, 'w')
+	w.write('#ID    Notes \n')
+	for (ID, note) in notes:
+		w.write(str(ID)+'    '+str(note)+'\n')
+	w.close()
+	os.replace(temporary_file_name, file_name)
@@ -0,0 +1,333 @@
+#! /usr/bin/env python
+
+# Mirror the EAZY, BEAGLE, and BAGPIPES SED plots for a list of objects from
+# fenrir (or any other server) to a folder on your own machine, so that a review
+# session can then be run entirely from local disk. It takes the same -idlist
+# and -idarglist as JADESView.py, and reads the paths to the plots, and the
+# username and password, from the same input file.
+#
+# The downloads are done a few at a time (-workers), each one is retried with
+# a growing wait if the server has trouble (-retries), and every file that has
+# been downloaded (or that the server doesn't have) is written to a manifest in
+# the output folder. If the mirror is stopped and started again, anything that
+# is already in the manifest (and on disk, with the right size) is skipped.
+#
+# python JADESView_mirror.py -idlist list-of-IDs.dat -output SED_mirror/
+
+import os
+import ast
+import sys
+import json
+import time
+import argparse
+import threading
+import numpy as np
+import requests
+
+from JADESView_fetch import SEDFetcher
+
+JADESView_input_file = 'JADESView_input_file.dat'
+
+fenrir_username = None
+fenrir_password = None
+fetch_connect_timeout = 5.0
+fetch_read_timeout = 30.0
+
+EAZY_files = None
+BEAGLE_files = None
+BAGPIPES_files = None
+
+# The name of the manifest in the output folder
+manifest_file_name = 'manifest.jsonl'
+
+# The status codes that are worth trying again
+retry_status_codes = [429, 500, 502, 503, 504]
+
+def SED_file_names(ID):
+	# The (kind, file name) of each of the SED plots for an object, the same
+	# as in JADESView.py
+	file_names = []
+	if (EAZY_files is not None):
+		file_names.append(('EAZY', str(ID)+'_EAZY_SED.png'))
+	if (BEAGLE_files is not None):
+		file_names.append(('BEAGLE', str(ID)+'_BEAGLE_SED.png'))
+	if (BAGPIPES_files is not None):
+		file_names.append(('BAGPIPES', '{:05d}.png'.format(ID)))
+	return file_names
+
+def read_manifest(manifest_path):
+	# The latest manifest entry for each URL. A line that was only half written
+	# when the mirror was stopped is ignored.
+	entries = {}
+	if (os.path.exists(manifest_path)):
+		with open(manifest_path) as manifest:
+			for line in manifest:
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					continue
+				entries[entry['url']] = entry
+	return entries
+
+class Mirror(object):
+
+	def __init__(self, fetcher, output_directory, retries = 3):
+		self.fetcher = fetcher
+		self.output_directory = output_directory
+		self.retries = retries
+		self.manifest_lock = threading.Lock()
+		self.manifest = open(os.path.join(output_directory, manifest_file_name), 'a')
+		self.counts = {'downloaded':0, 'missing':0, 'failed':0}
+		self.bytes = 0
+
+	def record(self, entry):
+		with self.manifest_lock:
+			self.manifest.write(json.dumps(entry)+'\n')
+			self.manifest.flush()
+			self.counts[entry['status']] = self.counts[entry['status']] + 1
+			if (entry['status'] == 'downloaded'):
+				self.bytes = self.bytes + entry['size']
+
+	def download(self, ID, kind, url, file_path):
+		# Download one file (in one of the fetcher's threads), and write it
+		# (atomically, so a stopped mirror never leaves half a png) and its
+		# manifest entry
+		entry = {'id':int(ID), 'kind':kind, 'url':url, 'file':file_path}
+		for attempt in range(0, self.retries + 1):
+			if (attempt > 0):
+				time.sleep(2.0**(attempt - 1))
+			try:
+				response = self.fetcher.session.get(url, timeout = self.fetcher.timeout)
+			except requests.exceptions.RequestException as e:
+				entry['error'] = str(e)
+				continue
+			if (response.status_code in retry_status_codes):
+				entry['error'] = 'HTTP '+str(response.status_code)
+				continue
+			break
+		else:
+			entry['status'] = 'failed'
+			self.record(entry)
+			return entry
+
+		if (response.status_code == 404):
+			entry['status'] = 'missing'
+		elif (response.status_code != 200):
+			entry['status'] = 'failed'
+			entry['error'] = 'HTTP '+str(response.status_code)
+		else:
+			temporary_path = file_path+'.tmp'+str(threading.get_ident())
+			try:
+				with open(temporary_path, 'wb') as f:
+					f.write(response.content)
+				os.replace(temporary_path, file_path)
+			except OSError as e:
+				# (A full disk, or a folder we can't write to.) Don't leave the
+				# partial file behind, and keep going with the rest.
+				try:
+					os.remove(temporary_path)
+				except OSError:
+					pass
+				entry['status'] = 'failed'
+				entry['error'] = str(e)
+				self.record(entry)
+				return entry
+			entry['status'] = 'downloaded'
+			entry['size'] = len(response.content)
+			entry['etag'] = response.headers.get('ETag')
+			entry['last_modified'] = response.headers.get('Last-Modified')
+			entry.pop('error', None)
+		self.record(entry)
+		return entry
+
+	def close(self):
+		self.manifest.close()
+
+parser = argparse.ArgumentParser()
+
+######################
+# Optional Arguments #
+######################
+
+# JADESView Input File
+parser.add_argument(
+  '-input',
+  help="Input file with the paths to the SED plots",
+  action="store",
+  type=str,
+  dest="input",
+  required=False
+)
+
+# ID list
+parser.add_argument(
+  '-idlist',
+  help="List of ID Numbers?",
+  action="store",
+  type=str,
+  dest="id_number_list",
+  required=False
+)
+
+# command line argument list of objects
+parser.add_argument(
+  '-idarglist',
+  help="Command line argument list of objects",
+  action="store",
+  type=str,
+  dest="idarglist",
+  required=False
+)
+
+# The folder to mirror the plots into
+parser.add_argument(
+  '-output',
+  help="Folder to put the SED plots in (default: SED_mirror/)",
+  action="store",
+  type=str,
+  dest="output",
+  default="SED_mirror/",
+  required=False
+)
+
+# The number of downloads at once
+parser.add_argument(
+  '-workers',
+  help="Number of downloads to run at once (default: 8)",
+  action="store",
+  type=int,
+  dest="workers",
+  default=8,
+  required=False
+)
+
+# The number of retries
+parser.add_argument(
+  '-retries',
+  help="Number of times to retry a download (default: 3)",
+  action="store",
+  type=int,
+  dest="retries",
+  default=3,
+  required=False
+)
+
+# Ask again for files the server didn't have last time
+parser.add_argument(
+  '-retry_missing',
+  help="Try again for plots that the server didn't have before?",
+  action="store_true",
+  dest="retry_missing",
+  required=False
+)
+
+args=parser.parse_args()
+
+if (args.input):
+	JADESView_input_file = args.input
+
+input_lines = np.loadtxt(JADESView_input_file, dtype='str')
+number_input_lines = len(input_lines[:,0])
+for i in range(0, number_input_lines):
+	if (input_lines[i,0] == 'EAZY_files'):
+		EAZY_files = input_lines[i,1]
+	if (input_lines[i,0] == 'BEAGLE_files'):
+		BEAGLE_files = input_lines[i,1]
+	if (input_lines[i,0] == 'BAGPIPES_files'):
+		BAGPIPES_files = input_lines[i,1]
+	if (input_lines[i,0] == 'fenrir_username'):
+		fenrir_username = input_lines[i,1]
+	if (input_lines[i,0] == 'fenrir_password'):
+		fenrir_password = input_lines[i,1]
+	if (input_lines[i,0] == 'fetch_connect_timeout'):
+		fetch_connect_timeout = float(input_lines[i,1])
+	if (input_lines[i,0] == 'fetch_read_timeout'):
+		fetch_read_timeout = float(input_lines[i,1])
+
+# Only the plots that are on a server need to be mirrored
+for kind in ['EAZY', 'BEAGLE', 'BAGPIPES']:
+	files = globals()[kind+'_files']
+	if ((files is not None) and not (files.startswith('http'))):
+		print(kind+"_files is already on this machine ("+files+"), not mirroring it.")
+		globals()[kind+'_files'] = None
+
+if ((EAZY_files is None) & (BEAGLE_files is None) & (BAGPIPES_files is None)):
+	sys.exit("There are no SED plots on a server in "+JADESView_input_file+" to mirror.")
+
+if (args.id_number_list):
+	ID_input_file = np.loadtxt(args.id_number_list)
+	if (len(ID_input_file.shape) > 1):
+		ID_numbers_to_mirror = ID_input_file[:,0].astype(int)
+	else:
+		ID_numbers_to_mirror = np.atleast_1d(ID_input_file).astype(int)
+elif (args.idarglist):
+	ID_numbers_to_mirror = np.atleast_1d(np.array(ast.literal_eval(args.idarglist))).astype(int)
+else:
+	sys.exit("Specify the objects to mirror with -idlist or -idarglist.")
+
+output_directory = args.output
+for kind in ['EAZY', 'BEAGLE', 'BAGPIPES']:
+	if (globals()[kind+'_files'] is not None):
+		os.makedirs(os.path.join(output_directory, kind), exist_ok = True)
+
+# Work out what still has to be downloaded
+manifest_entries = read_manifest(os.path.join(output_directory, manifest_file_name))
+to_download = []
+number_skipped = 0
+for ID in ID_numbers_to_mirror:
+	for (kind, file_name) in SED_file_names(ID):
+		url = globals()[kind+'_files']+file_name
+		file_path = os.path.join(output_directory, kind, file_name)
+		entry = manifest_entries.get(url)
+		if (entry is not None):
+			if ((entry['status'] == 'downloaded') and os.path.exists(file_path) and (os.path.getsize(file_path) == entry['size'])):
+				number_skipped = number_skipped + 1
+				continue
+			if ((entry['status'] == 'missing') and not (args.retry_missing)):
+				number_skipped = number_skipped + 1
+				continue
+		to_download.append((ID, kind, url, file_path))
+
+print("Mirroring "+str(len(to_download))+" plots for "+str(len(ID_numbers_to_mirror))+" objects ("+str(number_skipped)+" already done).")
+
+sed_fetcher = SEDFetcher(fenrir_username, fenrir_password, args.workers, fetch_connect_timeout, fetch_read_timeout)
+mirror = Mirror(sed_fetcher, output_directory, args.retries)
+
+start_time = time.time()
+futures = []
+for (ID, kind, url, file_path) in to_download:
+	futures.append(sed_fetcher.submit(mirror.download, ID, kind, url, file_path))
+
+try:
+	for i in range(0, len(futures)):
+		entry = futures[i].result()
+		if (entry['status'] == 'failed'):
+			print("Could not download "+entry['url']+" ("+entry.get('error', '')+")")
+		if (((i+1) % 100 == 0) | (i+1 == len(futures))):
+			elapsed_time = time.time() - start_time
+			print("   "+str(i+1)+" / "+str(len(futures))+" ("+str(round((i+1) / max(elapsed_time, 1e-6), 1))+" files/s, "
+				+str(round(mirror.bytes / 1e6 / max(elapsed_time, 1e-6), 2))+" MB/s)")
+except KeyboardInterrupt:
+	# Everything that finished is in the manifest, so the next run picks up here.
+	# The downloads that have already started are let finish first, so their
+	# entries make it into the manifest before it's closed.
+	print("Stopping, waiting for the downloads that have started to finish...")
+	sed_fetcher.executor.shutdown(wait = True, cancel_futures = True)
+	mirror.close()
+	print("Downloaded "+str(mirror.counts['downloaded'])+", "+str(mirror.counts['missing'])+" not on the server, "
+		+str(mirror.counts['failed'])+" failed. Run the same command again to pick up where this left off.")
+	sys.exit(1)
+
+sed_fetcher.shutdown()
+mirror.close()
+
+elapsed_time = time.time() - start_time
+print("Downloaded "+str(mirror.counts['downloaded'])+" ("+str(round(mirror.bytes / 1e6, 1))+" MB in "+str(round(elapsed_time, 1))+" s), "
+	+str(number_skipped)+" skipped, "+str(mirror.counts['missing'])+" not on the server, "+str(mirror.counts['failed'])+" failed.")
+if (mirror.counts['failed'] > 0):
+	print("Run the same command again to retry the ones that failed.")
+
+print("To use the mirror, put these in the input file:")
+for kind in ['EAZY', 'BEAGLE', 'BAGPIPES']:
+	if (globals()[kind+'_files'] is not None):
+		print(kind+'_files'+' '*(25 - len(kind+'_files'))+os.path.join(os.path.abspath(output_directory), kind)+'/')
@@ -0,0 +1,458 @@
+#! /usr/bin/env python
+
+# Things to do with the mosaics that are shared between JADESView.py,
+# JADESView_RA_DEC.py, and JADESView_Cutout.py.
+
+import os
+import sys
+import time
+import json
+import hashlib
+import argparse
+import threading
+from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+from astropy.nddata import Cutout2D
+from astropy.wcs import Sip
+from astropy.wcs.utils import proj_plane_pixel_scales, skycoord_to_pixel
+
+# The numpy data types for each FITS BITPIX (FITS data is big-endian)
+bitpix_dtypes = {8: 'uint8', 16: '>i2', 32: '>i4', 64: '>i8', -32: '>f4', -64: '>f8'}
+
+def mosaic_identity(mosaic_path, extension):
+	# What the caches key a mosaic by: its path, size, and modification time
+	# (so a new version of a mosaic is never confused with the old one), and 
+	# the extension
+	mosaic_stat = os.stat(mosaic_path)
+	return os.path.abspath(mosaic_path)+'|'+str(mosaic_stat.st_size)+'|'+str(mosaic_stat.st_mtime)+'|'+str(extension)
+
+class MosaicHeaderCache(object):
+	# A small sidecar file for each mosaic, with what JADESView needs from its
+	# header: the science extension header itself, the WCS (as a header with
+	# just the WCS keywords), the footprint on the sky, and where the pixels 
+	# are in the file. The sidecars are keyed by the path, size, and modification
+	# time of the mosaic (and the extension), so a mosaic that has changed is 
+	# read again. With these, starting up doesn't have to parse the mosaic
+	# headers, and the pixels are memory-mapped straight from the file.
+
+	def __init__(self, cache_directory):
+		self.cache_directory = cache_directory
+		if (not os.path.exists(cache_directory)):
+			os.makedirs(cache_directory)
+
+	def sidecar_file_name(self, identity):
+		return os.path.join(self.cache_directory, hashlib.sha1(identity.encode('utf-8')).hexdigest()+'.json')
+
+	def get(self, mosaic_path, extension):
+		try:
+			identity = mosaic_identity(mosaic_path, extension)
+			with open(self.sidecar_file_name(identity), 'r') as f:
+				sidecar = json.load(f)
+		except (IOError, OSError, ValueError):
+			return None
+		if (sidecar.get('identity') != identity):
+			return None
+		return sidecar
+
+	def put(self, record):
+		# Write the sidecar for a MosaicRecord that has been opened
+		image_hdu = record.hdu
+		image_header = image_hdu.header
+		image_wcs = record.wcs
+		identity = mosaic_identity(record.path, record.extension)
+		sidecar = {'identity': identity, 'header': image_header.tostring(), 'wcs': None, 'footprint': None,
+			'shape': None, 'dtype': None, 'data_offset': None}
+
+		# Distortion lookup tables live in other extensions, so a WCS with them 
+		# can't be rebuilt from a header
+		if ((image_wcs.cpdis1 is None) & (image_wcs.cpdis2 is None) & (image_wcs.det2im1 is None) & (image_wcs.det2im2 is None)):
+			sidecar['wcs'] = image_wcs.to_header_string(relax = True)
+
+		if (image_header.get('NAXIS', 0) == 2):
+			shape = (int(image_header['NAXIS2']), int(image_header['NAXIS1']))
+			sidecar['shape'] = shape
+			if (image_wcs.has_celestial):
+				sidecar['footprint'] = image_wcs.celestial.calc_footprint(axes = (shape[1], shape[0])).tolist()
+			# The pixels can only be memory-mapped directly if they are stored as 
+			# they are (not compressed, and not scaled)
+			if ((type(image_hdu) in (fits.PrimaryHDU, fits.ImageHDU)) & (image_header.get('BSCALE', 1) == 1) & (image_header.get('BZERO', 0) == 0)
+				& (image_header.get('BITPIX') in bitpix_dtypes)):
+				sidecar['dtype'] = bitpix_dtypes[image_header['BITPIX']]
+				sidecar['data_offset'] = int(record.hdulist.fileinfo(record.hdu_index)['datLoc'])
+
+		# Write to a temporary file first, so nothing ever sees a half-written sidecar
+		sidecar_file = self.sidecar_file_name(identity)
+		temporary_file = sidecar_file+'.'+str(os.getpid())+'.'+str(threading.get_ident())+'.tmp'
+		with open(temporary_file, 'w') as f:
+			json.dump(sidecar, f)
+		os.replace(temporary_file, sidecar_file)
+		return sidecar
+
+
+class MosaicRecord(object):
+	# One filter's mosaic: the filter name, the path, and the extension with the
+	# science data, plus the data (memory-mapped), the header, the WCS, the 
+	# footprint, and the pixel scale in arcseconds, which are all only loaded 
+	# the first time they are used. The file is only ever opened once. If there
+	# is a MosaicHeaderCache, these come from the mosaic's sidecar when it has 
+	# one, and a sidecar is written when it doesn't.
+
+	def __init__(self, filter_name, path, extension, header_cache = None):
+		self.filter_name = filter_name
+		self.path = path
+		self.extension = int(extension)
+		self.header_cache = header_cache
+		self.sidecar = None
+		self.hdulist = None
+		self.hdu_index = None
+		self.image_hdu = None
+		self.image_header = None
+		self.image_data = None
+		self.image_wcs = None
+		self.image_footprint = None
+		self.image_pixel_scale = None
+		self.lock = threading.Lock()
+		self.open_seconds = None
+		self.wcs_seconds = None
+		self.from_sidecar = False
+
+	@property
+	def hdu(self):
+		if (self.image_hdu is None):
+			with self.lock:
+				if (self.image_hdu is None):
+					print("Opening up image: "+self.path)
+					self.hdulist = fits.open(self.path, memmap = True, lazy_load_hdus = True)
+					try:
+						self.image_hdu = self.hdulist[self.extension]
+						self.hdu_index = self.extension
+					except IndexError:
+						# There's no extension like that, so use the primary HDU
+						self.image_hdu = self.hdulist[0]
+						self.hdu_index = 0
+		return self.image_hdu
+
+	@property
+	def data(self):
+		if (self.image_data is None):
+			if ((self.sidecar is not None) and (self.sidecar['data_offset'] is not None)):
+				self.image_data = np.memmap(self.path, dtype = self.sidecar['dtype'], mode = 'r', 
+					offset = self.sidecar['data_offset'], shape = tuple(self.sidecar['shape']))
+			else:
+				self.image_data = self.hdu.data
+		return self.image_data
+
+	@property
+	def header(self):
+		if (self.image_header is None):
+			if (self.sidecar is not None):
+				self.image_header = fits.Header.fromstring(self.sidecar['header'])
+			else:
+				self.image_header = self.hdu.header
+		return self.image_header
+
+	@property
+	def wcs(self):
+		if (self.image_wcs is None):
+			if ((self.sidecar is not None) and (self.sidecar['wcs'] is not None)):
+				image_wcs = WCS(fits.Header.fromstring(self.sidecar['wcs']))
+				if (self.sidecar['shape'] is not None):
+					image_wcs.pixel_shape = (self.sidecar['shape'][1], self.sidecar['shape'][0])
+			else:
+				image_wcs = WCS(self.header)
+			with self.lock:
+				if (self.image_wcs is None):
+					self.image_wcs = image_wcs
+		return self.image_wcs
+
+	@property
+	def footprint(self):
+		# The (RA, DEC) of the corners of the mosaic, in degrees
+		if (self.image_footprint is None):
+			if ((self.sidecar is not None) and (self.sidecar['footprint'] is not None)):
+				self.image_footprint = np.array(self.sidecar['footprint'])
+			else:
+				self.image_footprint = self.wcs.celestial.calc_footprint()
+		return self.image_footprint
+
+	@property
+	def pixel_scale(self):
+		# The (x, y) size of the pixels in arcseconds
+		if (self.image_pixel_scale is None):
+			image_wcs = self.wcs
+			with self.lock:
+				self.image_pixel_scale = u.Quantity(proj_plane_pixel_scales(image_wcs), image_wcs.wcs.cunit[0]).to(u.arcsec).value
+		return self.image_pixel_scale
+
+	def initialize(self):
+		# Read the header (from the sidecar, if there is one, or else the file), 
+		# then make the WCS, keeping track of how long each one took
+		start_time = time.time()
+		if (self.header_cache is not None):
+			self.sidecar = self.header_cache.get(self.path, self.extension)
+			self.from_sidecar = self.sidecar is not None
+		if (self.sidecar is None):
+			header = self.header
+		self.open_seconds = time.time() - start_time
+		start_time = time.time()
+		image_wcs = self.wcs
+		self.wcs_seconds = time.time() - start_time
+		if ((self.header_cache is not None) and (self.sidecar is None)):
+			self.sidecar = self.header_cache.put(self)
+		return self
+
+	def close(self):
+		with self.lock:
+			if (self.hdulist is not None):
+				self.hdulist.close()
+			self.hdulist = None
+			self.image_hdu = None
+			self.image_data = None
+
+
+class MosaicRegistry(object):
+	# The MosaicRecords for all of the filters in the image list, in order, 
+	# shared by JADESView.py, JADESView_RA_DEC.py, and JADESView_Cutout.py.
+	# Making the registry doesn't open anything; each mosaic is opened when 
+	# something first needs it.
+
+	def __init__(self, filter_names, paths, extensions, header_cache = None):
+		self.records = []
+		for i in range(0, len(paths)):
+			self.records.append(MosaicRecord(filter_names[i], paths[i], extensions[i], header_cache))
+		self.futures = None
+		self.start_time = None
+
+	def initialize(self, workers = 8, report = True):
+		# Open the headers and make the WCS of all of the mosaics at once, in a 
+		# pool of threads (this is mostly waiting on the disk or the network).
+		# This returns straight away; use wait() for the mosaics that are needed
+		# before going on. With report = True, the time each file took is printed
+		# once they are all done.
+		self.start_time = time.time()
+		executor = ThreadPoolExecutor(max_workers = max(1, min(workers, len(self.records))))
+		self.futures = [executor.submit(record.initialize) for record in self.records]
+		executor.shutdown(wait = False)
+		if (report == True):
+			report_thread = threading.Thread(target = self.report)
+			report_thread.daemon = True
+			report_thread.start()
+
+	def wait(self, filter_indices = None):
+		# Wait until these mosaics (or all of them) have been initialized
+		if (self.futures is None):
+			return
+		if (filter_indices is None):
+			filter_indices = range(0, len(self.records))
+		for filter_index in filter_indices:
+			self.futures[filter_index].result()
+
+	def report(self):
+		try:
+			self.wait()
+		except Exception as e:
+			print("Opening the mosaics failed: "+str(e))
+			return
+		print(self.timing_summary())
+
+	def timing_summary(self):
+		lines = []
+		for record in self.records:
+			if (record.open_seconds is not None):
+				if (record.from_sidecar):
+					source = "sidecar"
+				else:
+					source = "opening"
+				lines.append("   "+record.filter_name+": "+source+" "+str(round(record.open_seconds, 2))+" s, WCS "
+					+str(round(record.wcs_seconds, 2))+" s ("+record.path+")")
+		total_seconds = 0.0
+		if (self.start_time is not None):
+			total_seconds = time.time() - self.start_time
+		return "Initialized "+str(len(lines))+" mosaics in "+str(round(total_seconds, 2))+" s:\n"+"\n".join(lines)
+
+	def __len__(self):
+		return len(self.records)
+
+	def __getitem__(self, filter_index):
+		return self.records[filter_index]
+
+	def __iter__(self):
+		return iter(self.records)
+
+	def close(self):
+		for record in self.records:
+			record.close()
+
+
+def read_image_list(image_list_file):
+	# The filter names, science extensions, and paths in an image list, which 
+	# has either two columns (filter and path, with the science data in 
+	# extension 1) or three (filter, extension, and path)
+	images_all_txt = np.loadtxt(image_list_file, dtype='str')
+	if (len(images_all_txt[0]) > 2):
+		all_images_filter_name = images_all_txt[:,0]
+		all_image_extension_number = images_all_txt[:,1].astype('int')
+		all_image_paths = images_all_txt[:,2]
+	else:
+		all_images_filter_name = images_all_txt[:,0]
+		all_image_extension_number = np.zeros(len(all_images_filter_name))+1
+		all_image_paths = images_all_txt[:,1]
+	all_image_paths = np.array([path if path != 'NoImage' else 'NoImage.fits' for path in all_image_paths])
+	return all_images_filter_name, all_image_extension_number, all_image_paths
+
+
+class PixelPositionTable(object):
+	# The pixel position of every object in every mosaic, as a compact float32
+	# (N_objects x N_filters x 2) table of (x, y), so that making a cutout for an
+	# object is just slicing the mosaic instead of solving the WCS each time.
+	#
+	# Each mosaic's column is filled with one vectorized pass over all of the
+	# RA and DEC values, either for all of the mosaics at once with compute_all()
+	# (which can be run in a background thread at startup), or on first use.
+	# Until a mosaic's column is done, single positions are worked out on their
+	# own, so nothing ever waits on the whole column.
+
+	def __init__(self, ra_values, dec_values, mosaics):
+		self.ra_values = np.asarray(ra_values, dtype = 'float64')
+		self.dec_values = np.asarray(dec_values, dtype = 'float64')
+		self.mosaics = mosaics
+		number_objects = len(self.ra_values)
+		number_filters = len(mosaics)
+		self.positions = np.full((number_objects, number_filters, 2), np.nan, dtype = 'float32')
+		self.computed = np.zeros(number_filters, dtype = bool)
+		self.locks = [threading.Lock() for i in range(0, number_filters)]
+		# The single positions are worked out with a WCS of their own, so they
+		# never wait on a column that's being filled
+		self.lookup_wcs = [None] * number_filters
+		self.lookup_locks = [threading.Lock() for i in range(0, number_filters)]
+
+	def compute_filter(self, filter_index):
+		if (self.computed[filter_index]):
+			return
+		# Let the registry load the mosaic (from its sidecar, if it has one) 
+		# first, so that asking for the WCS here doesn't parse the whole header
+		self.mosaics.wait([filter_index])
+		# Work on our own copy of the WCS, since WCS objects aren't thread-safe
+		# and the original may be in use elsewhere.
+		image_wcs = deepcopy(self.mosaics[filter_index].wcs)
+		# The positions are in fk5, like the SkyCoord that JADESView made for
+		# Cutout2D, so that the pixels are the same as they were.
+		# Positions that can't be real (like the -9999 for RA/DEC values that 
+		# couldn't be parsed) are left as NaN.
+		valid = np.isfinite(self.ra_values) & np.isfinite(self.dec_values) & (np.abs(self.dec_values) <= 90.0)
+		positions = SkyCoord(ra = self.ra_values[valid]*u.deg, dec = self.dec_values[valid]*u.deg, frame = 'fk5')
+		x, y = skycoord_to_pixel(positions, image_wcs, mode = 'all')
+		# The column is only locked while it's put in the table
+		with self.locks[filter_index]:
+			if (self.computed[filter_index]):
+				return
+			self.positions[valid, filter_index, 0] = x
+			self.positions[valid, filter_index, 1] = y
+			self.computed[filter_index] = True
+
+	def compute_all(self):
+		for filter_index in range(0, len(self.mosaics)):
+			self.compute_filter(filter_index)
+
+	def pixel_position(self, object_index, filter_index):
+		# The (x, y) of an object in a mosaic
+		if (self.computed[filter_index]):
+			return self.positions[object_index, filter_index]
+		with self.lookup_locks[filter_index]:
+			if (self.lookup_wcs[filter_index] is None):
+				self.lookup_wcs[filter_index] = deepcopy(self.mosaics[filter_index].wcs)
+			position = SkyCoord(ra = self.ra_values[object_index]*u.deg, dec = self.dec_values[object_index]*u.deg, frame = 'fk5')
+			x, y = skycoord_to_pixel(position, self.lookup_wcs[filter_index], mode = 'all')
+		return np.array([x, y], dtype = 'float32')
+
+	def cutout_slice(self, object_index, filter_index, ra_dec_size_value):
+		# The pixel position and the size in pixels of an object's cutout, for
+		# make_cutout (which only asks for them when the cutout isn't cached)
+		return self.pixel_position(object_index, filter_index), self.cutout_shape(filter_index, ra_dec_size_value)
+
+	def cutout_shape(self, filter_index, ra_dec_size_value):
+		# The (ny, nx) size in pixels of a ra_dec_size_value x ra_dec_size_value
+		# arcsecond cutout, worked out the same way as Cutout2D does it
+		pixel_scales = self.mosaics[filter_index].pixel_scale
+		return (int(np.round(ra_dec_size_value / pixel_scales[0])), int(np.round(ra_dec_size_value / pixel_scales[1])))
+
+
+class SlicedCutout(object):
+	# A cutout made by slicing the mosaic at a known pixel position. The cutout
+	# WCS is only made if something asks for it.
+
+	def __init__(self, image, pixel_position, pixel_shape, image_wcs):
+		self.cutout = Cutout2D(image, (float(pixel_position[0]), float(pixel_position[1])), pixel_shape)
+		self.data = self.cutout.data
+		self.image_wcs = image_wcs
+		self.cutout_wcs = None
+
+	@property
+	def wcs(self):
+		if (self.cutout_wcs is None):
+			# The same as what Cutout2D does with the WCS
+			origin = (self.cutout.origin_original[0] - self.cutout.slices_cutout[1].start,
+				self.cutout.origin_original[1] - self.cutout.slices_cutout[0].start)
+			cutout_wcs = deepcopy(self.image_wcs)
+			cutout_wcs.wcs.crpix -= origin
+			cutout_wcs.array_shape = self.data.shape
+			if (self.image_wcs.sip is not None):
+				sip = self.image_wcs.sip
+				cutout_wcs.sip = Sip(sip.a, sip.b, sip.ap, sip.bp, sip.crpix - origin)
+			self.cutout_wcs = cutout_wcs
+		return self.cutout_wcs
+
+
+if __name__ == '__main__':
+	# Pre-warm the header cache: write the sidecars for all of the mosaics in an
+	# image list, so the next time any of the JADESView scripts starts up it 
+	# doesn't have to read their headers
+	#
+	# python JADESView_mosaics.py -image_list JADESView_image_list.dat -header_cache_dir header_cache/
+
+	parser = argparse.ArgumentParser()
+
+	parser.add_argument(
+	  '-image_list',
+	  help="The image list (as in the JADESView input file)",
+	  action="store",
+	  type=str,
+	  dest="image_list",
+	  required=True
+	)
+
+	parser.add_argument(
+	  '-header_cache_dir',
+	  help="The folder for the header cache sidecars",
+	  action="store",
+	  type=str,
+	  dest="header_cache_dir",
+	  required=True
+	)
+
+	parser.add_argument(
+	  '-workers',
+	  help="The number of mosaics to read at the same time",
+	  action="store",
+	  type=int,
+	  dest="workers",
+	  default=8,
+	  required=False
+	)
+
+	args=parser.parse_args()
+
+	all_images_filter_name, all_image_extension_number, all_image_paths = read_image_list(args.image_list)
+	mosaics = MosaicRegistry(all_images_filter_name, all_image_paths, all_image_extension_number, MosaicHeaderCache(args.header_cache_dir))
+	mosaics.initialize(args.workers, report = False)
+	try:
+		mosaics.wait()
+	except Exception as e:
+		sys.exit("Pre-warming the header cache failed: "+str(e))
+	print(mosaics.timing_summary())
@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+
+# Background prefetching of objects for JADESView. While the user is looking at
+# one object, the next (and previous) few entries of the active ID list are
+# prepared in worker threads, so that navigating only has to swap in images
+# that are already finished.
+#
+# The worker threads never touch Tk: the function that prepares an object has
+# to return plain data (PIL images, arrays), and the Tk PhotoImages are made
+# in the main thread when the object is actually displayed.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class Prefetcher(object):
+
+	def __init__(self, prepare_function, depth = 3, workers = 2):
+		# prepare_function is called as prepare_function(*key) in a worker thread
+		self.prepare_function = prepare_function
+		self.depth = depth
+		self.executor = None
+		if (depth > 0):
+			self.executor = ThreadPoolExecutor(max_workers = workers)
+		self.futures = {}
+		self.lock = threading.Lock()
+
+	def schedule(self, keys):
+		# Make sure the keys are being prepared (in the order given), and drop
+		# anything that is no longer wanted.
+		if (self.executor is None):
+			return
+		with self.lock:
+			for key in list(self.futures.keys()):
+				if key not in keys:
+					self.futures.pop(key).cancel()
+			for key in keys:
+				if key not in self.futures:
+					self.futures[key] = self.executor.submit(self.prepare_function, *key)
+
+	def get(self, key):
+		# Returns the prepared result for this key, waiting for it if it is
+		# currently being worked on, or None if it was never scheduled (or failed).
+		with self.lock:
+			future = self.futures.pop(key, None)
+		if (future is None):
+			return None
+		if (future.cancel()):
+			return None
+		try:
+			return future.result()
+		except Exception as e:
+			print("Prefetching failed for "+str(key)+": "+str(e))
+			return None
+
+	def cancel(self):
+		# Throw away everything that hasn't started yet (for example, when the
+		# user jumps to a different object with the Go button).
+		with self.lock:
+			for key in list(self.futures.keys()):
+				self.futures.pop(key).cancel()
+
+	def shutdown(self):
+		self.cancel()
+		if (self.executor is not None):
+			self.executor.shutdown(wait = False)
+
+
+def prefetch_window(ID_iterator, number_in_list, depth):
+	# The list positions to prefetch around ID_iterator, nearest first, and
+	# favoring the direction the user is most likely to go (forward).
+	positions = []
+	for step in range(1, depth+1):
+		if (ID_iterator + step < number_in_list):
+			positions.append(ID_iterator + step)
+		if ((step == 1) & (ID_iterator - step >= 0)):
+			positions.append(ID_iterator - step)
+	return positions
@@ -0,0 +1,147 @@
+#! /usr/bin/env python
+
+# Rendering thumbnails without matplotlib. The stretch is applied with NumPy
+# (through a lookup table), and the labels, SNR text, and crosshair are drawn
+# with PIL, so that a thumbnail takes a few milliseconds instead of the
+# hundreds of milliseconds it takes to make and rasterize a matplotlib figure.
+# The output is made to look like the matplotlib thumbnails: a gray colormap
+# with NaNs shown as white, nearest-neighbor pixels, the filter name at the top
+# and the SNR at the bottom right (white text with a black shadow), and a
+# white crosshair.
+
+import os
+import threading
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from JADESView_zscale import zscale_interval
+
+# The matplotlib figures were made at 100 dots per inch, and the font sizes
+# are in points
+figure_dpi = 100.0
+
+# The crosshair lines are 2 points wide
+crosshair_line_width = int(round(2.0 * figure_dpi / 72.0))
+
+# The number of levels in the stretch lookup tables
+lut_levels = 4096
+
+stretch_luts = {}
+fonts = {}
+font_lock = threading.Lock()
+
+def stretch_lut(stretch):
+	# The 8-bit gray level for each of lut_levels evenly spaced values between
+	# 0 and 1 (after the interval has been applied), for each stretch. These
+	# are the same as the astropy stretches that were used with ImageNormalize.
+	lut = stretch_luts.get(stretch)
+	if (lut is None):
+		values = np.linspace(0.0, 1.0, lut_levels)
+		if (stretch == 'AsinhStretch'):
+			a = 0.1
+			values = np.arcsinh(values / a) / np.arcsinh(1.0 / a)
+		elif (stretch == 'LogStretch'):
+			a = 100.0
+			values = np.log(a * values + 1.0) / np.log(a + 1.0)
+		elif (stretch == 'SinhStretch'):
+			a = 1.0 / 3.0
+			values = np.sinh(values / a) / np.sinh(1.0 / a)
+		lut = np.round(np.clip(values, 0.0, 1.0) * 255.0).astype('uint8')
+		stretch_luts[stretch] = lut
+	return lut
+
+def stretch_thumbnail(data, stretch, vmin, vmax):
+	# Apply the interval and the stretch, and return an 8-bit image with the
+	# origin at the bottom (like imshow with origin = 'lower')
+	data = np.asarray(data, dtype = 'float32')
+	scale = vmax - vmin
+	if (not (scale > 0)):
+		scale = 1.0
+	normalized = (data - vmin) / scale
+	bad = ~np.isfinite(normalized)
+	normalized[bad] = 0.0
+	levels = np.clip(normalized * (lut_levels - 1) + 0.5, 0, lut_levels - 1).astype('int32')
+	gray = stretch_lut(stretch)[levels]
+	gray[bad] = 255
+	return np.ascontiguousarray(gray[::-1, :])
+
+def load_font(fontsize_points, bold = True):
+	# The (bold) DejaVu Sans that matplotlib uses, at the size it would have 
+	# been drawn at in the figure
+	fontsize_pixels = int(round(fontsize_points * figure_dpi / 72.0))
+	if (bold == True):
+		font_file_name = 'DejaVuSans-Bold.ttf'
+	else:
+		font_file_name = 'DejaVuSans.ttf'
+	with font_lock:
+		font = fonts.get((fontsize_pixels, font_file_name))
+		if (font is None):
+			try:
+				font = ImageFont.truetype(font_file_name, fontsize_pixels)
+			except (IOError, OSError):
+				try:
+					import matplotlib
+					font = ImageFont.truetype(os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf', font_file_name), fontsize_pixels)
+				except (ImportError, IOError, OSError):
+					font = ImageFont.load_default()
+			fonts[(fontsize_pixels, font_file_name)] = font
+	return font
+
+def draw_shadowed_text(draw, width, height, x, y, text, font, anchor):
+	# White text at (x, y) (in axes fractions, like ax.text), with a black copy
+	# offset by 0.01 up and to the right behind it
+	draw.text(((x + 0.01) * width, (1.0 - (y + 0.01)) * height), text, fill = 0, font = font, anchor = anchor)
+	draw.text((x * width, (1.0 - y) * height), text, fill = 255, font = font, anchor = anchor)
+
+def crosshair_lines(width, height):
+	# Four ticks pointing at the center, as (x1, y1, x2, y2) in pixels from the
+	# top left, so that they can also be drawn on the Tk canvas
+	lines = []
+	for (x1, y1, x2, y2) in [(0.5, 0.65, 0.5, 0.8), (0.5, 0.2, 0.5, 0.35), (0.2, 0.5, 0.35, 0.5), (0.65, 0.5, 0.8, 0.5)]:
+		lines.append((x1 * width, (1.0 - y1) * height, x2 * width, (1.0 - y2) * height))
+	return lines
+
+def draw_crosshair(draw, width, height):
+	for (x1, y1, x2, y2) in crosshair_lines(width, height):
+		draw.line([(x1, y1), (x2, y2)], fill = 255, width = crosshair_line_width)
+
+def render_thumbnail(data, stretch, thumbnail_pixels, label, label_fontsize, snr_text = None, snr_fontsize = None, crosshair = False, interval = None):
+	# Make a thumbnail_pixels x thumbnail_pixels grayscale PIL image of a cutout.
+	# The interval is (vmin, vmax), and is worked out here if it isn't given.
+	# For the segmentation map, pass stretch = 'LinearStretch' and the full
+	# range of the data as the interval.
+	if (interval is None):
+		interval = zscale_interval(data)
+	gray = stretch_thumbnail(data, stretch, interval[0], interval[1])
+	return render_stretched(gray, thumbnail_pixels, label, label_fontsize, snr_text, snr_fontsize, crosshair)
+
+def render_stretched(gray, thumbnail_pixels, label, label_fontsize, snr_text = None, snr_fontsize = None, crosshair = False):
+	# The rest of render_thumbnail, for a cutout that has already been 
+	# stretched (see stretch_thumbnail)
+
+	# Cutouts at the edge of a mosaic aren't square, and are centered on a
+	# white background (like imshow with aspect = 'equal')
+	ny, nx = gray.shape
+	scale = float(thumbnail_pixels) / max(nx, ny)
+	image_width = max(1, int(round(nx * scale)))
+	image_height = max(1, int(round(ny * scale)))
+	thumbnail_image = Image.fromarray(gray).resize((image_width, image_height), Image.NEAREST)
+	if ((image_width != thumbnail_pixels) | (image_height != thumbnail_pixels)):
+		square_image = Image.new('L', (thumbnail_pixels, thumbnail_pixels), 255)
+		square_image.paste(thumbnail_image, ((thumbnail_pixels - image_width) // 2, (thumbnail_pixels - image_height) // 2))
+		thumbnail_image = square_image
+	draw = ImageDraw.Draw(thumbnail_image)
+	width, height = thumbnail_image.size
+
+	if (label is not None):
+		draw_shadowed_text(draw, width, height, 0.5, 0.95, label, load_font(label_fontsize), 'mt')
+	if (snr_text is not None):
+		draw_shadowed_text(draw, width, height, 0.95, 0.05, snr_text, load_font(snr_fontsize), 'rs')
+	if (crosshair == True):
+		draw_crosshair(draw, width, height)
+
+	# The frame around the axes
+	draw.rectangle([0, 0, width - 1, height - 1], outline = 0)
+
+	return thumbnail_image
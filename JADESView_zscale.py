@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+
+# The ZScale interval (the same algorithm as astropy's ZScaleInterval, which is
+# the IRAF one), written so that it never raises: cutouts that are all NaN,
+# all zero, or too small to fit just get a sensible interval back. The line
+# fit and the k-sigma clipping are done for a whole batch of cutouts at once
+# (for example, all of the filters of an object) on a fixed-size sample of
+# each, so the cost doesn't grow with the size of the cutouts.
+
+import numpy as np
+
+# The astropy ZScaleInterval defaults
+zscale_n_samples = 1000
+zscale_contrast = 0.25
+zscale_max_reject = 0.5
+zscale_min_npixels = 5
+zscale_krej = 2.5
+zscale_max_iterations = 5
+
+def zscale_sample(data, n_samples = zscale_n_samples):
+	# Up to n_samples of the finite pixels, evenly spaced through the image
+	values = np.asarray(data).ravel()
+	values = values[np.isfinite(values)]
+	stride = int(max(1.0, values.size / n_samples))
+	return values[::stride][:n_samples]
+
+def zscale_intervals(data_list, n_samples = zscale_n_samples, contrast = zscale_contrast, max_reject = zscale_max_reject,
+	min_npixels = zscale_min_npixels, krej = zscale_krej, max_iterations = zscale_max_iterations):
+	# The (vmin, vmax) for each of the images in data_list, as an (N x 2) array.
+	# The samples are padded out to n_samples with +inf (which sorts to the
+	# end), so each row only looks at its first npix values.
+	number_images = len(data_list)
+	samples = np.full((number_images, n_samples), np.inf)
+	npix = np.zeros(number_images, dtype = 'int64')
+	for k in range(0, number_images):
+		sample = zscale_sample(data_list[k], n_samples)
+		samples[k, 0:len(sample)] = sample
+		npix[k] = len(sample)
+	samples.sort(axis = 1)
+
+	x = np.arange(n_samples, dtype = 'float64')[np.newaxis, :]
+	valid = x < npix[:, np.newaxis]
+	y = np.where(valid, samples, 0.0)
+	rows = np.arange(number_images)
+
+	minpix = np.maximum(min_npixels, (npix * max_reject).astype('int64'))
+	ngrow = np.maximum(1, (npix * 0.01).astype('int64'))
+	# The bad pixel mask is grown by ngrow pixels (like np.convolve with
+	# mode = 'same'), from index - ngrow//2 to index + (ngrow-1)//2
+	grow_low = np.clip(x.astype('int64') - (ngrow // 2)[:, np.newaxis], 0, n_samples)
+	grow_high = np.clip(x.astype('int64') + ((ngrow - 1) // 2)[:, np.newaxis] + 1, 0, n_samples)
+
+	badpix = np.zeros((number_images, n_samples), dtype = bool)
+	ngoodpix = npix.copy()
+	last_ngoodpix = npix + 1
+	slope = np.zeros(number_images)
+	fitted = np.zeros(number_images, dtype = bool)
+
+	for iteration in range(0, max_iterations):
+		# A row stops as soon as the clipping stops removing pixels, or too many
+		# have been removed. Rows that have stopped aren't changed after that.
+		active = (ngoodpix < last_ngoodpix) & (ngoodpix >= minpix)
+		if (np.any(active) == False):
+			break
+
+		# Fit a line to the good pixels (weighted least squares with 0/1 weights)
+		w = (valid & ~badpix).astype('float64')
+		sw = np.sum(w, axis = 1)
+		sx = np.sum(w * x, axis = 1)
+		sy = np.sum(w * y, axis = 1)
+		sxx = np.sum(w * x * x, axis = 1)
+		sxy = np.sum(w * x * y, axis = 1)
+		denominator = sw * sxx - sx * sx
+		good_fit = denominator > 0
+		b = np.where(good_fit, (sw * sxy - sx * sy) / np.where(good_fit, denominator, 1.0), 0.0)
+		a = (sy - b * sx) / np.maximum(sw, 1.0)
+
+		# Reject the pixels further than krej sigma from the line
+		flat = y - (a[:, np.newaxis] + b[:, np.newaxis] * x)
+		mean = np.sum(w * flat, axis = 1) / np.maximum(sw, 1.0)
+		sigma = np.sqrt(np.sum(w * (flat - mean[:, np.newaxis])**2, axis = 1) / np.maximum(sw, 1.0))
+		new_badpix = badpix | (valid & (np.abs(flat) > (krej * sigma)[:, np.newaxis]))
+
+		# And grow the mask
+		counts = np.zeros((number_images, n_samples + 1), dtype = 'int64')
+		counts[:, 1:] = np.cumsum(new_badpix, axis = 1)
+		new_badpix = valid & ((np.take_along_axis(counts, grow_high, axis = 1) - np.take_along_axis(counts, grow_low, axis = 1)) > 0)
+
+		badpix = np.where(active[:, np.newaxis], new_badpix, badpix)
+		slope = np.where(active, b, slope)
+		fitted = fitted | active
+		last_ngoodpix = np.where(active, ngoodpix, last_ngoodpix)
+		ngoodpix = np.where(active, np.sum(valid & ~badpix, axis = 1), ngoodpix)
+
+	# Rows with no finite pixels at all get (0, 1), and everything else starts
+	# from the full range of the samples
+	last_index = np.maximum(npix - 1, 0)
+	vmin = np.where(npix > 0, samples[:, 0], 0.0)
+	vmax = np.where(npix > 0, samples[rows, last_index], 1.0)
+
+	use_fit = fitted & (ngoodpix >= minpix)
+	if (contrast > 0):
+		slope = slope / contrast
+	center_pixel = (npix - 1) // 2
+	median = 0.5 * (samples[rows, last_index // 2] + samples[rows, npix // 2])
+	vmin = np.where(use_fit, np.maximum(vmin, median - (center_pixel - 1) * slope), vmin)
+	vmax = np.where(use_fit, np.minimum(vmax, median + (npix - center_pixel) * slope), vmax)
+
+	return np.stack([vmin, vmax], axis = 1)
+
+def zscale_interval(data):
+	# The (vmin, vmax) for one image. An image with the same value everywhere
+	# (like an all-zero cutout off the edge of a mosaic) gets vmin == vmax.
+	vmin, vmax = zscale_intervals([data])[0]
+	return vmin, vmax